@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+import json
+import sys
+import time
+
+import boto3
+
+import config
+from dynamdb_store import DynamoStore
+from message_structure import MessageData
+
+# Write throughput of DynamoStore batches against one put_item per event, on DynamoDB Local at
+# config.DYNAMO_ENDPOINT_URL, or on moto's in process stand-in with --moto.
+# Tables are prefixed with "bench_" so they are apart from the event tables.
+
+BLOCK_COUNT = 40
+SIGNATURES_PER_BLOCK = 50
+DEPLOYS_PER_BLOCK = 10
+
+
+def sample_messages() -> list:
+    messages = []
+    for height in range(BLOCK_COUNT):
+        block_hash = f"{height:064x}"
+        deploy_hashes = [f"{height:032x}{index:032x}" for index in range(DEPLOYS_PER_BLOCK)]
+        messages.append({"BlockAdded": {"block_hash": block_hash, "block": {
+            "hash": block_hash, "header": {"era_id": height // 10, "height": height},
+            "body": {"proposer": "01" + "ab" * 32, "deploy_hashes": deploy_hashes, "transfer_hashes": []}}}})
+        for deploy_hash in deploy_hashes:
+            messages.append({"DeployProcessed": {"deploy_hash": deploy_hash, "block_hash": block_hash,
+                                                 "execution_result": {"Success": {"cost": "100"}}}})
+        for index in range(SIGNATURES_PER_BLOCK):
+            messages.append({"FinalitySignature": {"block_hash": block_hash, "era_id": height // 10,
+                                                   "signature": "01" + "12" * 64, "public_key": f"01{index:064x}"}})
+    return [json.dumps(message) for message in messages]
+
+
+def put_item_per_event(store: DynamoStore, messages: list):
+    for contents in messages:
+        table, item = store._item(MessageData(contents, lazy=True), contents)
+        store.client.put_item(TableName=table, Item=item)
+
+
+def batched(store: DynamoStore, messages: list):
+    store.save_batch((MessageData(contents, lazy=True), contents) for contents in messages)
+
+
+def run():
+    client = boto3.client('dynamodb', endpoint_url=None if "--moto" in sys.argv else config.DYNAMO_ENDPOINT_URL)
+    store = DynamoStore(client, table_prefix="bench_")
+    messages = sample_messages()
+    print(f"{'method':<20}{'events':>8}{'sec':>8}{'events/sec':>12}")
+    for name, func in (("put_item", put_item_per_event), ("batch_write_item", batched)):
+        start = time.perf_counter()
+        func(store, messages)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<20}{len(messages):>8}{elapsed:>8.2f}{len(messages) / elapsed:>12.0f}")
+    print(f"{store.batches_written} batches, {store.limit.throttles} throttled, concurrency {store.limit.limit}")
+    store.close()
+
+
+if __name__ == '__main__':
+    if "--moto" in sys.argv:
+        from moto import mock_aws
+        with mock_aws():
+            run()
+    else:
+        run()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import json
+import time
+
+from message_structure import MessageData
+
+# Compares eager and lazy MessageData for the routing done by file_store:
+# message_type, primary_key, era_id and block_hash of each message.
+
+VALIDATOR_COUNT = 100
+TRANSFORM_COUNT = 300
+ITERATIONS = 2000
+
+
+def sample_messages() -> dict:
+    validators = [f"01{index:064x}" for index in range(VALIDATOR_COUNT)]
+    block_hash = "ab" * 32
+    switch_block = {"BlockAdded": {
+        "block_hash": block_hash,
+        "block": {"hash": block_hash,
+                  "header": {"parent_hash": "cd" * 32,
+                             "era_end": {"era_report": {"equivocators": [],
+                                                        "rewards": [{"validator": v, "amount": 1000}
+                                                                    for v in validators],
+                                                        "inactive_validators": []},
+                                         "next_era_validator_weights": [{"validator": v, "weight": "1000000000"}
+                                                                        for v in validators]},
+                             "timestamp": "2021-03-22T13:11:41.312Z", "era_id": 67, "height": 16495},
+                  "body": {"proposer": validators[0], "deploy_hashes": ["ef" * 32], "transfer_hashes": []}}}}
+    deploy_processed = {"DeployProcessed": {
+        "deploy_hash": "ef" * 32, "account": validators[0], "timestamp": "2021-03-22T12:59:47.939Z", "ttl": "1h",
+        "dependencies": [], "block_hash": block_hash,
+        "execution_result": {"Success": {"effect": {
+            "operations": [{"key": f"balance-{index:064x}", "kind": "Write"} for index in range(TRANSFORM_COUNT)],
+            "transforms": [{"key": f"balance-{index:064x}", "transform": {"AddUInt512": "100000000000"}}
+                           for index in range(TRANSFORM_COUNT)]},
+            "transfers": [], "cost": "11406830"}}}}
+    finality_signature = {"FinalitySignature": {"block_hash": block_hash, "era_id": 67,
+                                                "signature": "01" + "12" * 64, "public_key": validators[0]}}
+    return {"DeployProcessed": json.dumps(deploy_processed),
+            "BlockAdded (switch)": json.dumps(switch_block),
+            "FinalitySignature": json.dumps(finality_signature)}
+
+
+def route(data: MessageData):
+    return data.message_type, data.primary_key, data.era_id, data.block_hash
+
+
+def time_per_message(json_str: str, lazy: bool) -> float:
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        route(MessageData(json_str, lazy=lazy))
+    return (time.perf_counter() - start) / ITERATIONS
+
+
+if __name__ == '__main__':
+    print(f"{'message':<22}{'bytes':>9}{'eager us':>11}{'lazy us':>10}{'speedup':>9}")
+    for name, json_str in sample_messages().items():
+        eager = time_per_message(json_str, lazy=False)
+        lazy = time_per_message(json_str, lazy=True)
+        print(f"{name:<22}{len(json_str):>9}{eager * 1e6:>11.1f}{lazy * 1e6:>10.1f}{eager / lazy:>8.1f}x")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List
+
+from directory_store import DirectoryStore
+from event_stream_reader import file_message_streamer
+from finality_tracker import FinalityTracker
+from message_structure import MessageData
+from segment_log_store import SegmentLogStore
+from signature_verifier import SignatureVerifier
+from synthetic_events import SyntheticChain, add_chain_arguments, chain_from_arguments
+
+# End to end benchmark of the ingest pipeline on a synthetic event stream dump.
+# Reports events/sec and p50/p99 latency per event for each stage:
+#   sse read        frames read from the dump file by file_message_streamer
+#   parse eager     full MessageData parse and routing fields
+#   parse lazy      lazy MessageData routing fields, as file_store does
+#   directory store DirectoryStore.save_message, a file per event
+#   segment log     SegmentLogStore.save_message, appended to a segment
+#   finality        FinalityTracker on BlockAdded and FinalitySignature events
+#   verify          SignatureVerifier on FinalitySignature events, only with --sign
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+def report(stage: str, latencies: List[float], elapsed: float = None):
+    """ Prints a row for stage, elapsed defaults to the sum of latencies """
+    latencies = sorted(latencies)
+    elapsed = elapsed if elapsed is not None else sum(latencies)
+    print(f"{stage:<18}{len(latencies):>9}{len(latencies) / elapsed:>14,.0f}"
+          f"{percentile(latencies, 0.5) * 1e6:>10.1f}{percentile(latencies, 0.99) * 1e6:>10.1f}")
+
+
+def timed(items: Iterable, func: Callable) -> List[float]:
+    """ Latency of func for each item """
+    latencies = []
+    perf_counter = time.perf_counter
+    for item in items:
+        start = perf_counter()
+        func(item)
+        latencies.append(perf_counter() - start)
+    return latencies
+
+
+def bench_read(dump_file: Path) -> List[str]:
+    messages = []
+    latencies = []
+    streamer = file_message_streamer(str(dump_file), 0)
+    start = time.perf_counter()
+    for msg in streamer:
+        end = time.perf_counter()
+        latencies.append(end - start)
+        messages.append(msg.data)
+        start = time.perf_counter()
+    report("sse read", latencies)
+    # ApiVersion is not stored or tracked
+    return messages[1:]
+
+
+def route(data: MessageData):
+    return data.message_type, data.primary_key, data.era_id, data.block_hash
+
+
+def bench_finality(chain: SyntheticChain, messages: List[str]):
+    tracker = FinalityTracker()
+    tracker.add_era(0, chain.genesis_weights)
+    finalized = 0
+
+    def process(contents: str):
+        nonlocal finalized
+        data = MessageData(contents, lazy=True)
+        if data.is_finality_signature:
+            fin_sig = data.event
+            finalized += tracker.add_signature(fin_sig.era_id, fin_sig.block_hash, fin_sig.public_key)
+        elif data.is_block_added:
+            block = data.event
+            if block.is_switch_block:
+                tracker.add_era(block.era_id + 1, block.next_era_validator_weights)
+
+    tracked = [contents for contents in messages
+               if contents.startswith(('{"FinalitySignature"', '{"BlockAdded"'))]
+    report("finality", timed(tracked, process))
+    return finalized
+
+
+def bench_verify(messages: List[str]) -> int:
+    signatures = [MessageData(contents).event for contents in messages
+                  if contents.startswith('{"FinalitySignature"')]
+    verifier = SignatureVerifier()
+    # Start the pool processes before timing
+    verifier.add(signatures[0])
+    list(verifier.verified(wait=True))
+    added = {}
+    latencies = []
+    start = time.perf_counter()
+    for fin_sig in signatures:
+        added[id(fin_sig)] = time.perf_counter()
+        verifier.add(fin_sig)
+        for verified in verifier.verified():
+            latencies.append(time.perf_counter() - added[id(verified)])
+    for verified in verifier.verified(wait=True):
+        latencies.append(time.perf_counter() - added[id(verified)])
+    elapsed = time.perf_counter() - start
+    verifier.close()
+    report("verify", latencies, elapsed)
+    return verifier.invalid
+
+
+def run(chain: SyntheticChain):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        dump_file = tmp_dir / "events_dump"
+        start = time.perf_counter()
+        count = chain.write_dump(dump_file)
+        print(f"Generated {count} events, {dump_file.stat().st_size / 1e6:.1f} MB "
+              f"in {time.perf_counter() - start:.1f}s")
+        print(f"{'stage':<18}{'events':>9}{'events/sec':>14}{'p50 us':>10}{'p99 us':>10}")
+        messages = bench_read(dump_file)
+        report("parse eager", timed(messages, lambda contents: route(MessageData(contents))))
+        report("parse lazy", timed(messages, lambda contents: route(MessageData(contents, lazy=True))))
+
+        parsed = [(MessageData(contents, lazy=True), contents) for contents in messages]
+        directory_store = DirectoryStore(tmp_dir / "events")
+        report("directory store", timed(parsed, lambda message: directory_store.save_message(*message)))
+        segment_store = SegmentLogStore(tmp_dir / "event_log")
+        report("segment log", timed(parsed, lambda message: segment_store.save_message(*message)))
+        segment_store.close()
+
+        finalized = bench_finality(chain, messages)
+        if chain.sign:
+            invalid = bench_verify(messages)
+            print(f"{invalid} invalid signatures")
+        print(f"{finalized} of {chain.eras * chain.blocks_per_era} blocks finalized")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the ingest pipeline on a synthetic event stream")
+    add_chain_arguments(parser)
+    run(chain_from_arguments(parser.parse_args()))
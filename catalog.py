@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import config
+from message_structure import MessageData
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    block_hash TEXT PRIMARY KEY,
+    era_id INTEGER NOT NULL,
+    height INTEGER,
+    proposer TEXT
+);
+CREATE INDEX IF NOT EXISTS blocks_era ON blocks (era_id);
+CREATE TABLE IF NOT EXISTS deploys (
+    deploy_hash TEXT PRIMARY KEY,
+    block_hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deploys_block ON deploys (block_hash);
+CREATE TABLE IF NOT EXISTS finsigs (
+    block_hash TEXT NOT NULL,
+    public_key TEXT NOT NULL,
+    PRIMARY KEY (block_hash, public_key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class Catalog:
+    """
+    SQLite catalog of where events are in a directory store: era -> blocks, block -> height, proposer and
+    deploy hashes, deploy -> block, and finality signatures per block.
+
+    The store records each batch it writes in one transaction, so lookups don't need to walk the directories.
+    An existing data directory is cataloged once with rebuild().  Safe to use from multiple threads.
+    """
+
+    def __init__(self, path: Path = config.CATALOG_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @property
+    def is_built(self) -> bool:
+        return bool(self._query("SELECT 1 FROM meta WHERE key = 'built'"))
+
+    def record_batch(self, messages: Iterable[MessageData]):
+        """ Adds locations from a batch of stored messages in one transaction """
+        blocks, deploys, finsigs = [], [], []
+        for data in messages:
+            if data.is_block_added:
+                block = data.event
+                if block is None:
+                    continue
+                blocks.append((block.block_hash, block.era_id, block.height, block.proposer))
+                deploys.extend((deploy_hash, block.block_hash)
+                               for deploy_hash in block.deploy_hashes + block.transfer_hashes)
+            elif data.is_deploy_processed:
+                deploys.append((data.deploy_hash, data.block_hash))
+            elif data.is_finality_signature:
+                finsigs.append((data.block_hash, data.public_key))
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)", blocks)
+            self._conn.executemany("INSERT OR REPLACE INTO deploys VALUES (?, ?)", deploys)
+            self._conn.executemany("INSERT OR IGNORE INTO finsigs VALUES (?, ?)", finsigs)
+
+    def record(self, data: MessageData):
+        self.record_batch((data,))
+
+    def eras(self) -> List[int]:
+        return [era_id for era_id, in self._query("SELECT DISTINCT era_id FROM blocks ORDER BY era_id")]
+
+    def blocks_for_era(self, era_id: int) -> List[str]:
+        """ Block hashes of era in height order """
+        return [block_hash for block_hash, in
+                self._query("SELECT block_hash FROM blocks WHERE era_id = ? ORDER BY height", (era_id,))]
+
+    def block(self, block_hash: str) -> Optional[dict]:
+        """ {"era_id", "height", "proposer", "deploy_hashes"} of block, or None if not cataloged """
+        rows = self._query("SELECT era_id, height, proposer FROM blocks WHERE block_hash = ?", (block_hash,))
+        if not rows:
+            return None
+        era_id, height, proposer = rows[0]
+        return {"era_id": era_id, "height": height, "proposer": proposer,
+                "deploy_hashes": self.deploy_hashes(block_hash)}
+
+    def era_of_block(self, block_hash: str) -> Optional[int]:
+        rows = self._query("SELECT era_id FROM blocks WHERE block_hash = ?", (block_hash,))
+        return rows[0][0] if rows else None
+
+    def deploy_hashes(self, block_hash: str) -> List[str]:
+        """ Deploy and transfer hashes of block """
+        return [deploy_hash for deploy_hash, in
+                self._query("SELECT deploy_hash FROM deploys WHERE block_hash = ? ORDER BY deploy_hash",
+                            (block_hash,))]
+
+    def block_of_deploy(self, deploy_hash: str) -> Optional[Tuple[int, str]]:
+        """ (era_id, block_hash) of deploy, if its block is cataloged """
+        rows = self._query("SELECT blocks.era_id, blocks.block_hash FROM deploys JOIN blocks USING (block_hash) "
+                           "WHERE deploy_hash = ?", (deploy_hash,))
+        return rows[0] if rows else None
+
+    def directory_of_deploy(self, deploy_hash: str) -> Optional[str]:
+        """ era_<era_id>/<block_hash> directory of deploy, relative to data directory """
+        located = self.block_of_deploy(deploy_hash)
+        if located is None:
+            return None
+        era_id, block_hash = located
+        return f"era_{era_id}/{block_hash}"
+
+    def finsig_count(self, block_hash: str) -> int:
+        return self._query("SELECT COUNT(*) FROM finsigs WHERE block_hash = ?", (block_hash,))[0][0]
+
+    def blocks_missing_finsigs(self) -> List[Tuple[int, str]]:
+        """ [(era_id, block_hash), ...] of blocks without finality signatures, in era order """
+        return self._query("SELECT era_id, block_hash FROM blocks WHERE NOT EXISTS "
+                           "(SELECT 1 FROM finsigs WHERE finsigs.block_hash = blocks.block_hash) "
+                           "ORDER BY era_id, block_hash")
+
+    def rebuild(self, data_dir: Path = config.DATA_DIR):
+        """ Catalogs blocks and finality signatures already in data_dir, reading each block file once """
+        data_dir = Path(data_dir)
+        if data_dir.exists():
+            for era_entry in os.scandir(data_dir):
+                if not (era_entry.is_dir() and era_entry.name.startswith("era_")):
+                    continue
+                messages = []
+                for entry in os.scandir(era_entry.path):
+                    if entry.name.startswith("block-"):
+                        with open(entry.path) as f:
+                            messages.append(MessageData(f.read()))
+                    elif entry.is_dir():
+                        for file_entry in os.scandir(entry.path):
+                            if file_entry.name.startswith("finsig-"):
+                                public_key = file_entry.name.split('-')[-1]
+                                finsig = {"FinalitySignature": {"block_hash": entry.name, "public_key": public_key}}
+                                messages.append(MessageData(json.dumps(finsig), lazy=True))
+                self.record_batch(messages)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('built', '1')")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_catalog = None
+_default_catalog_lock = threading.Lock()
+
+
+def default_catalog() -> Optional[Catalog]:
+    """
+    Shared catalog at config.CATALOG_PATH for config.DATA_DIR, rebuilt from the directories on first use.
+    None if config.CATALOG_ENABLED is off.
+    """
+    global _default_catalog
+    if not config.CATALOG_ENABLED:
+        return None
+    with _default_catalog_lock:
+        if _default_catalog is None:
+            _default_catalog = Catalog()
+            if not _default_catalog.is_built:
+                _default_catalog.rebuild(config.DATA_DIR)
+        return _default_catalog
+
+
+def catalog_for(data_dir: Path) -> Optional[Catalog]:
+    """ The default catalog if data_dir is config.DATA_DIR, else None so the directories are read instead """
+    if Path(data_dir).resolve() != Path(config.DATA_DIR).resolve():
+        return None
+    return default_catalog()
+
+
+if __name__ == '__main__':
+    catalog = Catalog()
+    catalog.rebuild(config.DATA_DIR)
+    eras = catalog.eras()
+    print(f"Cataloged {len(eras)} eras, {len(catalog.blocks_missing_finsigs())} blocks missing finality signatures")
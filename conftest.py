@@ -0,0 +1,110 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from event_stream_reader import EventStreamReader, async_file_message_streamer, file_message_streamer
+
+# Fixtures shared by the tests: readers of dump files that reconnect without delay, and stub RPC servers.
+
+
+@pytest.fixture
+def quick_reader():
+    """
+    Makes an EventStreamReader of a dump file, reading it with the file streamers unless others are given, that
+    reconnects without delay up to reconnect_count times.
+    """
+    def make(dump_file, start_from: int = 0, message_streamer=file_message_streamer,
+             async_message_streamer=async_file_message_streamer, reconnect_count: int = 5, **kwargs):
+        esr = EventStreamReader(str(dump_file), start_from, message_streamer, async_message_streamer, **kwargs)
+        esr.RECONNECT_DELAY_SEC = 0
+        esr.RECONNECT_COUNT = reconnect_count
+        return esr
+    return make
+
+
+class StubRpcHandler(BaseHTTPRequestHandler):
+    """
+    chain_get_block for any hash except "missing", or "latest" block without params, from blocks if present.
+    info_get_deploy executed in the block of executed if present, else "a", and not executed if that is None
+    or the hash starts with "pending".
+    Fails the first fail_first POSTs with 503.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = 0
+    posts = 0
+    fail_first = 0
+    methods = []
+    blocks = {}
+    executed = {}
+
+    def setup(self):
+        super().setup()
+        StubRpcHandler.connections += 1
+
+    @staticmethod
+    def _response(request):
+        StubRpcHandler.methods.append(request["method"])
+        if request["method"] == "info_get_deploy":
+            deploy_hash = request["params"][0]
+            block_hash = StubRpcHandler.executed.get(deploy_hash, "a")
+            executed = block_hash is not None and not deploy_hash.startswith("pending")
+            results = [{"block_hash": block_hash, "result": {}}] if executed else []
+            return {"jsonrpc": "2.0", "id": request["id"],
+                    "result": {"deploy": {"hash": deploy_hash}, "execution_results": results}}
+        block_hash = request["params"][0]["Hash"] if request["params"] else "latest"
+        if block_hash == "missing":
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32001, "message": "block not known"}}
+        block = StubRpcHandler.blocks.get(block_hash, {"hash": block_hash})
+        return {"jsonrpc": "2.0", "id": request["id"], "result": {"block": block}}
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        StubRpcHandler.posts += 1
+        if StubRpcHandler.posts <= self.fail_first:
+            status, body = 503, b"busy"
+        elif isinstance(request, list):
+            # Reverse order, as batch responses may come in any order
+            status, body = 200, json.dumps([self._response(r) for r in reversed(request)]).encode()
+        else:
+            status, body = 200, json.dumps(self._response(request)).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def serve_rpc():
+    """ Serves a handler class on a free local port, returning its RPC url, until the test ends """
+    servers = []
+
+    def serve(handler) -> str:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/rpc"
+    yield serve
+    for server in servers:
+        server.shutdown()
+
+
+@pytest.fixture
+def rpc_handler():
+    """ StubRpcHandler with its counts and blocks reset """
+    StubRpcHandler.connections = StubRpcHandler.posts = StubRpcHandler.fail_first = 0
+    StubRpcHandler.methods = []
+    StubRpcHandler.blocks = {}
+    StubRpcHandler.executed = {}
+    return StubRpcHandler
+
+
+@pytest.fixture
+def rpc_url(serve_rpc, rpc_handler):
+    return serve_rpc(rpc_handler)
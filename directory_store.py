@@ -0,0 +1,304 @@
+import ctypes
+import os
+from collections import defaultdict
+from itertools import chain
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import config
+from event_store import EventStore
+from catalog import Catalog
+from message_structure import MessageData
+from pending_deploys import PendingDeploys, PendingJournal
+
+PENDING_JOURNAL = "pending_deploys.journal"
+# Files are written under this prefix and renamed, so a file named by its primary key is never partly written
+TMP_PREFIX = ".tmp-"
+
+
+# Three message types:
+# DeployProcessed - Has no era_id, can store in block-hash folder and move into era_id folder when we get BlockAdded
+#   Final location: era_<era_id>/<block_hash>/deploy-<deploy_hash>
+# BlockAdded - Has era_id, can store in era_id folder
+#   Final location: era_<era_id>/block-<block_hash>
+# FinalitySignature = Has era_id, can store in era_id folder
+#   Final location: era_<era_id>/<block_hash>/finsig-<block_hash>-<public_key>
+
+
+def era_directory_name(era_id: Union[str, int]) -> str:
+    return f"era_{era_id}"
+
+
+def save_file_in_directory(directory: str, filename: str, contents: str, root_dir: Path = config.DATA_DIR):
+    """ Creates directory if needed and saves file to filename in directory """
+    target_dir = root_dir / directory
+    target_dir.mkdir(parents=True, exist_ok=True)
+    file_path = target_dir / filename
+    file_path.write_text(contents)
+
+
+def move_deploys_to_era(directory: str, era_id: str, root_dir: Path = config.DATA_DIR):
+    """ Moves all temp stored deploys into the proper era directory """
+    source_dir = root_dir / directory
+    target_dir = root_dir / era_directory_name(era_id) / directory
+    if source_dir.exists():
+        target_dir.mkdir(parents=True, exist_ok=True)
+        for src_file in source_dir.glob("deploy-*"):
+            src_file.rename(target_dir / src_file.name)
+        source_dir.rmdir()
+
+
+def move_deploy_accepted_to_era(block: MessageData, era_id: str, root_dir: Path = config.DATA_DIR):
+    """ Moves all deploy-accepted into the proper era and block directory """
+    target_dir = root_dir / era_directory_name(era_id) / block.block_hash
+    for td_hash in chain(block.get_deploy_hashes(), block.get_transfer_hashes()):
+        source_file = root_dir / 'deploy_accepted' / f'deploy-accepted-{td_hash}'
+        target_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            source_file.rename(target_dir / source_file.name)
+        except FileNotFoundError:
+            continue
+
+
+try:
+    _syncfs = ctypes.CDLL(None, use_errno=True).syncfs
+except (AttributeError, OSError):
+    _syncfs = None
+
+
+def sync_filesystem(path: Path):
+    """ Syncs the filesystem holding path with one syncfs call, or all filesystems where there is no syncfs """
+    if _syncfs is None:
+        os.sync()
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if _syncfs(fd) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(path))
+    finally:
+        os.close(fd)
+
+
+class DirectoryStore(EventStore):
+    """
+    One file per event in per era and per block directories under root_dir.
+
+    Deploy events waiting for their BlockAdded are held in a PendingDeploys index and written once, directly
+    to era_<era_id>/<block_hash>/ when the block arrives.  Only entries that outlive the index are spilled to
+    the <block_hash>/ and deploy_accepted/ staging directories, and moved when their block arrives as before.
+    The index is kept durable by a PendingJournal in root_dir, flushed with the files of each batch.  Only the
+    store of file_store should keep the journal, other stores writing to the same root_dir use journal=False.
+
+    With a catalog, each saved message or batch is recorded in it after its files are written.
+    """
+    # Sync the filesystem of root_dir once per flush if anything was written, so a batch is durable with one flush.
+    SYNC_ON_FLUSH = True
+    # Files saved by save_message without a flush, before one is done
+    MAX_UNSYNCED = 10000
+
+    def __init__(self, root_dir: Path = config.DATA_DIR, pending: PendingDeploys = None, catalog: Catalog = None,
+                 journal: bool = True):
+        self.root_dir = Path(root_dir)
+        self.catalog = catalog
+        self.pending = pending if pending is not None else PendingDeploys(config.PENDING_DEPLOY_TTL_SEC,
+                                                                          config.PENDING_DEPLOY_MAX)
+        self.journal = PendingJournal(self.root_dir / PENDING_JOURNAL if journal else None)
+        self.journal.replay(self.pending)
+        self.journal.compact(self.pending)
+        # Staged on disk, so renamed when the block arrives
+        self._spilled_blocks = set()
+        self._spilled_accepted = set()
+        # Files written or moved since the last flush
+        self._unsynced = 0
+        self._load_spilled()
+
+    def _load_spilled(self):
+        """ Staging directories left from earlier runs """
+        if not self.root_dir.exists():
+            return
+        for entry in os.scandir(self.root_dir):
+            if entry.is_dir() and not entry.name.startswith("era_") and entry.name != "deploy_accepted":
+                self._spilled_blocks.add(entry.name)
+        accepted_dir = self.root_dir / "deploy_accepted"
+        if accepted_dir.exists():
+            self._spilled_accepted.update(entry.name.split('-')[-1] for entry in os.scandir(accepted_dir))
+
+    @staticmethod
+    def _directory(data: MessageData) -> str:
+        if data.is_deploy_accepted:
+            return "deploy_accepted"
+        # We don't have a block for deploys yet as they process before the era_id is known.
+        # Using a directory name in root data directory as block_hash
+        directory = era_directory_name(data.era_id) if not data.is_deploy_processed else data.block_hash
+
+        # We can go directly into a era/block_hash structure for finality_signatures
+        if data.is_finality_signature:
+            directory += f"/{data.block_hash}"
+        return directory
+
+    def _route(self, data: MessageData, contents: str, writes: list, blocks_added: list):
+        """ Adds (directory, filename, contents) for message to writes, or holds it in pending """
+        if data.is_deploy_processed:
+            era_id = self._era_of_block(data.block_hash)
+            if era_id is None:
+                self.pending.add_processed(data.block_hash, data.primary_key, contents)
+                self.journal.processed(data.block_hash, data.primary_key, contents)
+            else:
+                writes.append((f"{era_directory_name(era_id)}/{data.block_hash}", data.primary_key, contents))
+        elif data.is_deploy_accepted:
+            located = self._block_of_deploy(data.deploy_hash)
+            if located is None:
+                self.pending.add_accepted(data.deploy_hash, data.primary_key, contents)
+                self.journal.accepted(data.deploy_hash, data.primary_key, contents)
+            else:
+                era_id, block_hash = located
+                writes.append((f"{era_directory_name(era_id)}/{block_hash}", data.primary_key, contents))
+        else:
+            writes.append((self._directory(data), data.primary_key, contents))
+        if data.is_block_added:
+            td_hashes = list(chain(data.get_deploy_hashes(), data.get_transfer_hashes()))
+            block_dir = f"{era_directory_name(data.era_id)}/{data.block_hash}"
+            for primary_key, pending_contents in self.pending.block_added(data.block_hash, data.era_id, td_hashes):
+                writes.append((block_dir, primary_key, pending_contents))
+            self.journal.block_added(data.block_hash, data.era_id, td_hashes)
+            blocks_added.append((data, td_hashes))
+
+    def _spill_expired(self, writes: list):
+        processed, accepted = self.pending.pop_expired()
+        self._add_spills(processed, accepted, writes)
+
+    def _add_spills(self, processed: list, accepted: list, writes: list):
+        self.journal.spilled(processed, accepted)
+        for block_hash, primary_key, contents in processed:
+            self._spilled_blocks.add(block_hash)
+            writes.append((block_hash, primary_key, contents))
+        for deploy_hash, primary_key, contents in accepted:
+            self._spilled_accepted.add(deploy_hash)
+            writes.append(("deploy_accepted", primary_key, contents))
+
+    def _move_spilled(self, block: MessageData, td_hashes: list):
+        """ Moves deploys of block that had been spilled to staging directories """
+        target_dir = self.root_dir / era_directory_name(block.era_id) / block.block_hash
+        if block.block_hash in self._spilled_blocks:
+            self._spilled_blocks.discard(block.block_hash)
+            move_deploys_to_era(block.block_hash, block.era_id, self.root_dir)
+            self._unsynced += 1
+        spilled = [td_hash for td_hash in td_hashes if td_hash in self._spilled_accepted]
+        if spilled:
+            target_dir.mkdir(parents=True, exist_ok=True)
+            self._unsynced += len(spilled)
+            for td_hash in spilled:
+                self._spilled_accepted.discard(td_hash)
+                source_file = self.root_dir / 'deploy_accepted' / f'deploy-accepted-{td_hash}'
+                try:
+                    source_file.rename(target_dir / source_file.name)
+                except FileNotFoundError:
+                    continue
+
+    def _write(self, writes: list, blocks_added: list):
+        """
+        Writes files grouped by directory, so each directory is created once.
+        Spilled deploys of blocks are moved after all files are written.
+        """
+        by_directory = defaultdict(list)
+        for directory, filename, contents in writes:
+            by_directory[directory].append((filename, contents))
+        for directory, files in by_directory.items():
+            target_dir = self.root_dir / directory
+            target_dir.mkdir(parents=True, exist_ok=True)
+            for filename, contents in files:
+                file_path = target_dir / filename
+                tmp_path = target_dir / f"{TMP_PREFIX}{filename}"
+                tmp_path.write_text(contents)
+                os.replace(tmp_path, file_path)
+                self._unsynced += 1
+        for data, td_hashes in blocks_added:
+            self._move_spilled(data, td_hashes)
+
+    def stored_keys(self) -> Iterator[Tuple[Optional[int], str]]:
+        """ (era_id, primary_key) of each file under root_dir, as files are named by primary key """
+        if not self.root_dir.exists():
+            return
+        for entry in os.scandir(self.root_dir):
+            if not entry.is_dir():
+                continue
+            era_id = int(entry.name[len("era_"):]) if entry.name.startswith("era_") else None
+            for child in os.scandir(entry.path):
+                if child.is_dir():
+                    for file_entry in os.scandir(child.path):
+                        if not file_entry.name.startswith(TMP_PREFIX):
+                            yield era_id, file_entry.name
+                elif not child.name.startswith(TMP_PREFIX):
+                    yield era_id, child.name
+
+    def _era_of_block(self, block_hash: str) -> Optional[int]:
+        """ Era of a block added recently or, once compacted out of pending, in the catalog """
+        era_id = self.pending.era_of_block(block_hash)
+        if era_id is None and self.catalog is not None:
+            era_id = self.catalog.era_of_block(block_hash)
+        return era_id
+
+    def _block_of_deploy(self, deploy_hash: str) -> Optional[Tuple[int, str]]:
+        """ (era_id, block_hash) of a deploy's block, from pending or the catalog """
+        located = self.pending.block_of_deploy(deploy_hash)
+        if located is None and self.catalog is not None:
+            located = self.catalog.block_of_deploy(deploy_hash)
+        return located
+
+    def _stored_directories(self, data: MessageData) -> List[str]:
+        """ Directories the file of a message may be in, staged or in its era """
+        if data.is_deploy_processed:
+            era_id = self._era_of_block(data.block_hash)
+            directories = [data.block_hash]
+            if era_id is not None:
+                directories.append(f"{era_directory_name(era_id)}/{data.block_hash}")
+            return directories
+        if data.is_deploy_accepted:
+            directories = ["deploy_accepted"]
+            located = self._block_of_deploy(data.deploy_hash)
+            if located is not None:
+                directories.append(f"{era_directory_name(located[0])}/{located[1]}")
+            return directories
+        return [self._directory(data)]
+
+    def is_stored(self, data: MessageData) -> bool:
+        return any((self.root_dir / directory / data.primary_key).exists()
+                   for directory in self._stored_directories(data))
+
+    def save_message(self, data: MessageData, contents: str):
+        """ Blocking save of a message into its directory """
+        writes, blocks_added = [], []
+        self._route(data, contents, writes, blocks_added)
+        self._spill_expired(writes)
+        self._write(writes, blocks_added)
+        if self.catalog is not None:
+            self.catalog.record(data)
+        if self._unsynced >= self.MAX_UNSYNCED:
+            self.flush()
+
+    def save_batch(self, messages: Iterable[Tuple[MessageData, str]]):
+        writes, blocks_added, saved = [], [], []
+        for data, contents in messages:
+            self._route(data, contents, writes, blocks_added)
+            saved.append(data)
+        self._spill_expired(writes)
+        self._write(writes, blocks_added)
+        if self.catalog is not None:
+            self.catalog.record_batch(saved)
+        self.flush()
+
+    def flush(self):
+        unsynced, self._unsynced = self._unsynced, 0
+        if self.SYNC_ON_FLUSH and unsynced:
+            sync_filesystem(self.root_dir)
+        # After the files, as the journal records deploys spilled to them
+        self.journal.flush(self.pending)
+
+    def close(self):
+        """ Spills all pending deploys, so they are durable for the next run """
+        writes = []
+        self._add_spills(*self.pending.spill(), writes)
+        self._write(writes, [])
+        self.flush()
+        self.journal.close()
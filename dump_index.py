@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+from sse_parser import frame_id, iter_frames
+
+
+class DumpIndex:
+    """
+    Sidecar index of event id to byte offset for an event stream dump file from:
+    `curl -sN host_ip:9999/events > dump_file`
+
+    Stored next to the dump as <dump_file>.idx.  Built once and extended with only the new bytes as the
+    dump grows.  Frames are recorded in file order, so seeking uses bisect as long as ids only increase.
+
+    The header holds a fingerprint of the start of the dump and of the bytes before indexed_end, which do not
+    change as the dump grows, so a dump replaced by another of any size is indexed again.
+    """
+    MAGIC = b"CEVIDX02"
+    # magic, indexed_end, fingerprint
+    HEADER = struct.Struct("<8sQ16s")
+    FINGERPRINT_BYTES = 4096
+    # id, offset of frame
+    RECORD = struct.Struct("<QQ")
+
+    def __init__(self, dump_path: Union[str, Path]):
+        self.dump_path = Path(dump_path)
+        self.index_path = self.dump_path.with_name(f"{self.dump_path.name}.idx")
+        self.ids = array('Q')
+        self.offsets = array('Q')
+        # Byte offset after the last complete frame that has been indexed
+        self.indexed_end = 0
+        self.fingerprint = self._fingerprint(0)
+        self.is_sorted = True
+        self._load()
+
+    def _fingerprint(self, indexed_end: int) -> bytes:
+        digest = hashlib.blake2b(digest_size=16)
+        if indexed_end > 0:
+            with open(self.dump_path, 'rb') as f:
+                digest.update(f.read(min(indexed_end, self.FINGERPRINT_BYTES)))
+                tail_start = max(0, indexed_end - self.FINGERPRINT_BYTES)
+                f.seek(tail_start)
+                digest.update(f.read(indexed_end - tail_start))
+        return digest.digest()
+
+    def _load(self):
+        if not self.index_path.exists():
+            return
+        raw = self.index_path.read_bytes()
+        if len(raw) < self.HEADER.size:
+            return
+        magic, indexed_end, fingerprint = self.HEADER.unpack_from(raw)
+        record_count = (len(raw) - self.HEADER.size) // self.RECORD.size
+        records = array('Q')
+        records.frombytes(raw[self.HEADER.size:self.HEADER.size + record_count * self.RECORD.size])
+        if (magic != self.MAGIC or indexed_end > self.dump_path.stat().st_size or
+                fingerprint != self._fingerprint(indexed_end)):
+            # Unknown format or dump file was replaced, so index is rebuilt.
+            return
+        if sys.byteorder != 'little':
+            records.byteswap()
+        self.ids = records[0::2]
+        self.offsets = records[1::2]
+        self.indexed_end = indexed_end
+        self.fingerprint = fingerprint
+        self.is_sorted = all(a < b for a, b in zip(self.ids, self.ids[1:]))
+
+    def update(self) -> "DumpIndex":
+        """ Index any complete frames added to the dump since last update """
+        dump_size = self.dump_path.stat().st_size
+        if dump_size < self.indexed_end or self._fingerprint(self.indexed_end) != self.fingerprint:
+            # Dump file was truncated or replaced
+            self._reset()
+        if dump_size == self.indexed_end:
+            return self
+        new_records = array('Q')
+        last_id = self.ids[-1] if self.ids else None
+        indexed_end = self.indexed_end
+        with open(self.dump_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                for frame_start, frame_end in iter_frames(buffer, self.indexed_end):
+                    indexed_end = frame_end + 2
+                    msg_id = frame_id(buffer, frame_start, frame_end)
+                    if msg_id is None:
+                        continue
+                    if last_id is not None and msg_id <= last_id:
+                        self.is_sorted = False
+                    last_id = msg_id
+                    new_records.append(msg_id)
+                    new_records.append(frame_start)
+        self._append(new_records, indexed_end)
+        return self
+
+    def _reset(self):
+        self.ids = array('Q')
+        self.offsets = array('Q')
+        self.indexed_end = 0
+        self.fingerprint = self._fingerprint(0)
+        self.is_sorted = True
+        if self.index_path.exists():
+            self.index_path.unlink()
+
+    def _append(self, new_records: array, indexed_end: int):
+        self.ids.extend(new_records[0::2])
+        self.offsets.extend(new_records[1::2])
+        self.indexed_end = indexed_end
+        self.fingerprint = self._fingerprint(indexed_end)
+        if sys.byteorder != 'little':
+            new_records.byteswap()
+        mode = 'r+b' if self.index_path.exists() else 'w+b'
+        with open(self.index_path, mode) as f:
+            # Records are written before the header, so a crash leaves an index that is only short of records.
+            f.seek(self.HEADER.size + (len(self.ids) - len(new_records) // 2) * self.RECORD.size)
+            f.write(new_records.tobytes())
+            f.truncate()
+            f.seek(0)
+            f.write(self.HEADER.pack(self.MAGIC, indexed_end, self.fingerprint))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def count(self) -> int:
+        """ Number of events with id in the dump """
+        return len(self.ids)
+
+    def id_range(self) -> Optional[Tuple[int, int]]:
+        """ Returns (lowest id, highest id) in dump or None if empty """
+        if not self.ids:
+            return None
+        if self.is_sorted:
+            return self.ids[0], self.ids[-1]
+        return min(self.ids), max(self.ids)
+
+    def offset_for(self, start_from: int) -> int:
+        """ Byte offset of first frame with id >= start_from, or end of indexed data if there is none """
+        if self.is_sorted:
+            pos = bisect_left(self.ids, start_from)
+        else:
+            pos = next((i for i, msg_id in enumerate(self.ids) if msg_id >= start_from), len(self.ids))
+        if pos == len(self.ids):
+            return self.indexed_end
+        return self.offsets[pos]
+
+
+if __name__ == '__main__':
+    for dump_file in sys.argv[1:]:
+        index = DumpIndex(dump_file).update()
+        print(f"{dump_file}: {index.count} events, id range: {index.id_range()}, "
+              f"size: {os.path.getsize(dump_file)}")
@@ -1,338 +1,251 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
 import boto3
+from botocore.exceptions import ClientError
+
 import config
+from event_store import EventStore
+from fan_in import content_key
+from message_structure import (MessageData, API_VERSION, BLOCK_ADDED, DEPLOY_ACCEPTED, DEPLOY_PROCESSED,
+                               FAULT, FINALITY_SIGNATURE, STEP)
+
+
+# Table name and (partition key, sort key) per event type.  Every item holds the fan_in.content_key of its
+# event, which is the sort key or the partition key, so writing an event again replaces the same item.
+# Attribute types are "S" string and "N" number.
+TABLE_SCHEMAS = {
+    BLOCK_ADDED: ("BlockAdded", ("era_id", "N"), ("primary_key", "S")),
+    DEPLOY_PROCESSED: ("DeployProcessed", ("block_hash", "S"), ("primary_key", "S")),
+    DEPLOY_ACCEPTED: ("DeployAccepted", ("primary_key", "S"), None),
+    FINALITY_SIGNATURE: ("FinalitySignature", ("block_hash", "S"), ("primary_key", "S")),
+    STEP: ("Step", ("primary_key", "S"), None),
+    FAULT: ("Fault", ("era_id", "N"), ("primary_key", "S")),
+    API_VERSION: ("ApiVersion", ("primary_key", "S"), None),
+}
+OTHER_TABLE_SCHEMA = ("OtherEvents", ("primary_key", "S"), None)
+# DynamoDB item size limit, of attribute names and values
+MAX_ITEM_BYTES = 400 * 1024
+
+
+class DynamoWriteError(Exception):
+    """ Batch write that still had unprocessed items after all retries """
+
+    def __init__(self, message: str, unprocessed: dict = None):
+        super().__init__(message)
+        self.unprocessed = unprocessed or {}
+
+
+class AdaptiveLimit:
+    """
+    Limit on concurrent requests, halved when a request is throttled and raised by one after limit
+    requests in a row succeed, between 1 and max_limit.
+    """
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.active = 0
+        self.throttles = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while self.active >= self.limit:
+                self._condition.wait()
+            self.active += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def throttled(self):
+        with self._condition:
+            self.throttles += 1
+            self._successes = 0
+            self.limit = max(1, self.limit // 2)
+
+    def succeeded(self):
+        with self._condition:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self._successes = 0
+                self.limit += 1
+                self._condition.notify_all()
+
+
+class DynamoStore(EventStore):
+    """
+    Stores events in a DynamoDB table per event type, see TABLE_SCHEMAS, with the original data string
+    in the "data" attribute.
+
+    Saved messages are buffered and written with BatchWriteItem in batches of BATCH_SIZE on up to
+    max_concurrency threads.  Items of the same primary_key in a batch are collapsed to the last one, as
+    DynamoDB rejects duplicate keys in a batch.  Unprocessed items and throttled requests are retried up to
+    retries times with jittered exponential backoff from backoff_sec, and throttling halves the number of
+    concurrent requests until writes succeed again.  Items over MAX_ITEM_BYTES can't be written, so are
+    logged and counted in items_rejected rather than failing the batch they would be in.
+
+    save_message is thread safe.  flush() waits for all buffered items to be written, and raises
+    DynamoWriteError for any batch that could not be.
+    """
+    BATCH_SIZE = 25
+    THROTTLE_CODES = ("ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded")
+    MAX_BACKOFF_SEC = 20
+
+    def __init__(self, client=None, table_prefix: str = config.DYNAMO_TABLE_PREFIX,
+                 max_concurrency: int = config.DYNAMO_MAX_CONCURRENCY, retries: int = config.DYNAMO_RETRIES,
+                 backoff_sec: float = config.DYNAMO_BACKOFF_SEC, create_tables: bool = True):
+        self.client = client or boto3.client('dynamodb', endpoint_url=config.DYNAMO_ENDPOINT_URL)
+        self.table_prefix = table_prefix
+        self.retries = retries
+        self.backoff_sec = backoff_sec
+        self.limit = AdaptiveLimit(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="dynamo_store")
+        self._lock = threading.Lock()
+        # (table, primary_key) -> item, waiting for a full batch
+        self._buffer = {}
+        self._futures = []
+        self.batches_written = 0
+        self.items_written = 0
+        self.items_rejected = 0
+        if create_tables:
+            self.create_tables()
+
+    def _schema(self, message_type: str) -> tuple:
+        table, partition_key, sort_key = TABLE_SCHEMAS.get(message_type, OTHER_TABLE_SCHEMA)
+        return self.table_prefix + table, partition_key, sort_key
+
+    def create_tables(self):
+        """ Creates missing event tables with on demand capacity and waits until they exist """
+        existing = set()
+        for page in self.client.get_paginator('list_tables').paginate():
+            existing.update(page["TableNames"])
+        created = []
+        for message_type in list(TABLE_SCHEMAS) + [None]:
+            table, partition_key, sort_key = self._schema(message_type)
+            if table in existing:
+                continue
+            keys = [(partition_key, "HASH")] + ([(sort_key, "RANGE")] if sort_key else [])
+            self.client.create_table(
+                TableName=table,
+                KeySchema=[{"AttributeName": name, "KeyType": key_type} for (name, _), key_type in keys],
+                AttributeDefinitions=[{"AttributeName": name, "AttributeType": attr_type}
+                                      for (name, attr_type), _ in keys],
+                BillingMode="PAY_PER_REQUEST")
+            created.append(table)
+        for table in created:
+            self.client.get_waiter('table_exists').wait(TableName=table)
+
+    @staticmethod
+    def _item_bytes(item: dict) -> int:
+        return sum(len(name) + len(next(iter(value.values())).encode()) for name, value in item.items())
+
+    def _item(self, data: MessageData, contents: str) -> Tuple[str, dict]:
+        """ (table, item) for message """
+        table, partition_key, sort_key = self._schema(data.message_type)
+        item = {"primary_key": {"S": content_key(contents, data)}, "data": {"S": contents}}
+        era_id = data.era_id
+        if era_id is not None:
+            item["era_id"] = {"N": str(era_id)}
+        block_hash = data.block_hash
+        if block_hash is not None:
+            item["block_hash"] = {"S": block_hash}
+        for name, _ in filter(None, (partition_key, sort_key)):
+            if name not in item:
+                raise ValueError(f"{data.message_type} {item['primary_key']['S']} has no {name} for key of {table}")
+        return table, item
+
+    def _add(self, data: MessageData, contents: str):
+        table, item = self._item(data, contents)
+        size = self._item_bytes(item)
+        if size > MAX_ITEM_BYTES:
+            logging.error(f"Not storing {data.message_type} {item['primary_key']['S']} of {size} bytes, "
+                          f"over the DynamoDB item limit")
+            with self._lock:
+                self.items_rejected += 1
+            return
+        with self._lock:
+            self._buffer[(table, item["primary_key"]["S"])] = item
+            if len(self._buffer) >= self.BATCH_SIZE:
+                self._submit()
+
+    def _submit(self):
+        """ Submits buffered items as one batch, called with _lock held """
+        request = {}
+        for (table, _), item in self._buffer.items():
+            request.setdefault(table, []).append({"PutRequest": {"Item": item}})
+        self._buffer = {}
+        # Failed batches are kept to be raised by flush()
+        self._futures = [future for future in self._futures if not future.done() or future.exception() is not None]
+        self._futures.append(self._executor.submit(self._write_batch, request))
+
+    def _backoff(self, attempt: int):
+        time.sleep(random.uniform(0, min(self.MAX_BACKOFF_SEC, self.backoff_sec * 2 ** attempt)))
+
+    def _write_batch(self, request: Dict[str, List[dict]]):
+        item_count = sum(len(requests) for requests in request.values())
+        attempt = 0
+        while True:
+            try:
+                with self.limit:
+                    response = self.client.batch_write_item(RequestItems=request)
+                unprocessed = response.get("UnprocessedItems") or {}
+                error = f"{sum(len(requests) for requests in unprocessed.values())} unprocessed items"
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code not in self.THROTTLE_CODES:
+                    raise
+                unprocessed = request
+                error = code
+            if not unprocessed:
+                self.limit.succeeded()
+                with self._lock:
+                    self.batches_written += 1
+                    self.items_written += item_count
+                return
+            # Unprocessed items are returned when the table is over capacity, so both are throttling
+            self.limit.throttled()
+            if attempt >= self.retries:
+                raise DynamoWriteError(f"Batch write failed after {attempt + 1} attempts: {error}", unprocessed)
+            logging.warning(f"Batch write throttled ({error}), retrying at concurrency {self.limit.limit}")
+            self._backoff(attempt)
+            request = unprocessed
+            attempt += 1
+
+    def save_message(self, data: MessageData, contents: str):
+        self._add(data, contents)
+
+    def save_batch(self, messages: Iterable[Tuple[MessageData, str]]):
+        for data, contents in messages:
+            self._add(data, contents)
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._buffer:
+                self._submit()
+            futures, self._futures = self._futures, []
+        errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
 
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
 
-# For a Boto3 client.
-dbc = boto3.client('dynamodb', endpoint_url='http://localhost:8000')
-response = dbc.list_tables()
-table_names = response["TableNames"]
-
-# dbr = boto3.resource('dynamodb', endpoint_url='http://localhost:8000')
-# table = dbr.Table('events')
-#
-# table.put()
-#
-# __TableName__ = "Events"
-#
-#
-# print(response)
-#
-# # For a Boto3 service resource
-# ddb = boto3.resource('dynamodb', endpoint_url='http://localhost:8000')
-# print(list(ddb.tables.all()))
-
-
-# For a Boto3 client.
-# ddb = boto3.client('dynamodb', endpoint_url='http://localhost:8000')
-# response = ddb.list_tables()
-
-# For a Boto3 service resource
-ddb = boto3.resource('dynamodb', endpoint_url='http://localhost:8000')
-print(list(ddb.tables.all()))
-
-table_names = ddb.tables.all()
-print(table_names)
-
-
-def create_table_finality_signature(ddb):
-    table = ddb.create_table(
-        TableName='FinalitySignature',
-        KeySchema=[
-
-        ])
-
-
-deploy = {"deploy_hash": "74e770e1c61cff900fe03802bf54de60f3af5fbcffdbff2307a9725fcc50c8f5",
-          "account": "014b466f5c6c87bb1d2566d166120e320a724231374cd0775e0e347afed70a4745",
-          "timestamp": "2021-03-26T19:52:52.078Z", "ttl": "1h", "dependencies": [],
-          "block_hash": "d0a6c35724bfe0f5935b96afee9dee07fd77a7456c445cef46c59f5754609a01", "execution_result": {
-        "Success": {"effect": {"operations": [
-            {"key": "hash-7c38c0b317f95e3304c4d894505dca282602cf5fcf2b7fe25e6c87d77262ba40", "kind": "Read"},
-            {"key": "hash-1e302ff032085443f440eed14d9202d947660ff1955b5cc1db3614ecaf366ff7", "kind": "Read"},
-            {"key": "balance-dca87e8bead2ec23f6088bbf32c476e903295c0ce74304831b3e8a48e8453b5a", "kind": "Write"},
-            {"key": "hash-ae901b66a938306696a1736bfffea46e4c9aa2145b0e6a662a71ad5defd6f661", "kind": "Read"},
-            {"key": "balance-2ee348d8ba9365e4c01053f3220457efe346551a23da533c14abaefa8dd4c24f", "kind": "Write"},
-            {"key": "bid-9bdcf9bcdb8d155cde18f9216944a3eecdaadf46438e94059d4f3c41ab0516df", "kind": "Write"},
-            {"key": "transfer-a83b288a5952e833572e7f7111dcff97b6e6517f776b78d41281ef02e8f61225", "kind": "Write"},
-            {"key": "balance-af047e42fbeb6ae5442fd477d6343e4fa61961a9c2301fcac005931221c64fe1", "kind": "Read"},
-            {"key": "deploy-74e770e1c61cff900fe03802bf54de60f3af5fbcffdbff2307a9725fcc50c8f5", "kind": "Write"},
-            {"key": "balance-a8af00247d175af03414349010b02455de006b5ad7a1ff146cbfec76506c27e3", "kind": "Write"}],
-                               "transforms": [
-                                   {"key": "bid-9bdcf9bcdb8d155cde18f9216944a3eecdaadf46438e94059d4f3c41ab0516df",
-                                    "transform": {"WriteBid": {
-                                        "validator_public_key": "014b466f5c6c87bb1d2566d166120e320a724231374cd0775e0e347afed70a4745",
-                                        "bonding_purse": "uref-2ee348d8ba9365e4c01053f3220457efe346551a23da533c14abaefa8dd4c24f-007",
-                                        "staked_amount": "49999001001012175", "delegation_rate": 10,
-                                        "vesting_schedule": {"initial_release_timestamp_millis": 1624392000000,
-                                                             "locked_amounts": null}, "delegators": {},
-                                        "inactive": false}}},
-                                   {"key": "balance-af047e42fbeb6ae5442fd477d6343e4fa61961a9c2301fcac005931221c64fe1",
-                                    "transform": "Identity"},
-                                   {"key": "balance-2ee348d8ba9365e4c01053f3220457efe346551a23da533c14abaefa8dd4c24f",
-                                    "transform": {"AddUInt512": "49999000000000000"}},
-                                   {"key": "transfer-a83b288a5952e833572e7f7111dcff97b6e6517f776b78d41281ef02e8f61225",
-                                    "transform": {"WriteTransfer": {
-                                        "deploy_hash": "74e770e1c61cff900fe03802bf54de60f3af5fbcffdbff2307a9725fcc50c8f5",
-                                        "from": "account-hash-9bdcf9bcdb8d155cde18f9216944a3eecdaadf46438e94059d4f3c41ab0516df",
-                                        "to": null,
-                                        "source": "uref-a8af00247d175af03414349010b02455de006b5ad7a1ff146cbfec76506c27e3-007",
-                                        "target": "uref-2ee348d8ba9365e4c01053f3220457efe346551a23da533c14abaefa8dd4c24f-007",
-                                        "amount": "49999000000000000", "gas": "0", "id": null}}},
-                                   {"key": "balance-a8af00247d175af03414349010b02455de006b5ad7a1ff146cbfec76506c27e3",
-                                    "transform": {"WriteCLValue": {"cl_type": "U512", "bytes": "0500460a99e8",
-                                                                   "parsed": "999000000000"}}},
-                                   {"key": "hash-ae901b66a938306696a1736bfffea46e4c9aa2145b0e6a662a71ad5defd6f661",
-                                    "transform": "Identity"},
-                                   {"key": "deploy-74e770e1c61cff900fe03802bf54de60f3af5fbcffdbff2307a9725fcc50c8f5",
-                                    "transform": {"WriteDeployInfo": {
-                                        "deploy_hash": "74e770e1c61cff900fe03802bf54de60f3af5fbcffdbff2307a9725fcc50c8f5",
-                                        "transfers": [
-                                            "transfer-a83b288a5952e833572e7f7111dcff97b6e6517f776b78d41281ef02e8f61225"],
-                                        "from": "account-hash-9bdcf9bcdb8d155cde18f9216944a3eecdaadf46438e94059d4f3c41ab0516df",
-                                        "source": "uref-a8af00247d175af03414349010b02455de006b5ad7a1ff146cbfec76506c27e3-007",
-                                        "gas": "236093720"}}},
-                                   {"key": "hash-7c38c0b317f95e3304c4d894505dca282602cf5fcf2b7fe25e6c87d77262ba40",
-                                    "transform": "Identity"},
-                                   {"key": "balance-dca87e8bead2ec23f6088bbf32c476e903295c0ce74304831b3e8a48e8453b5a",
-                                    "transform": {"AddUInt512": "1000000000"}},
-                                   {"key": "hash-1e302ff032085443f440eed14d9202d947660ff1955b5cc1db3614ecaf366ff7",
-                                    "transform": "Identity"}]},
-                    "transfers": ["transfer-a83b288a5952e833572e7f7111dcff97b6e6517f776b78d41281ef02e8f61225"],
-                    "cost": "236093720"}}}
-
-full_block = {"block_hash": "599d62a072d84545b276b6498f0e598fa606284e6413759d8690559fc95d8867",
-              "block": {
-                  "hash": "599d62a072d84545b276b6498f0e598fa606284e6413759d8690559fc95d8867",
-                  "header": {
-                      "parent_hash": "a877c332663794be00dd4f874dc13b8c58c6f20693d41a3b5b6428919d43460e",
-                      "state_root_hash": "2fc0cc09f8b03f2e5fd1942df90e511e7ec608d694782eccce575a2b8d53720a",
-                      "body_hash": "60557505f55465fbe8c04e8151b10b7086fb7c2554177e7997941a05a75ec5cd",
-                      "random_bit": true,
-                      "accumulated_seed": "ec5a1a943e612a5012578d7840cf3ebad6027dc4daeb0fb9c210d15ddc9b3271",
-                      "era_end": {
-                        "era_report": {
-                            "equivocators": [],
-                            "rewards": {
-                               "01014c1aaa70a992e7bf3445fa5871643b4207f9af97af7f8f2e309bf32822971b": 448232988,
-                               "0102b0d1560c9909760a778b4b2ef5601461221c117e57c33ca8571888515ca65d": 4924651,
-                               "0105e2c338d31db049db93012f9a158993c0f5e330bf6c71ac38c165b1047af511": 5022529,
-                               "01068e4432b4ac5f6469fe08a92f84ebb7518b1a1a7f6b42651803067035fdca82": 201708313,
-                               "010819b194079ef88b6ce54b85c3ca75318dead7984d9ff36f9fcdf84eb089d638": 83624855,
-                               "010a0edc88c2f20b0934923f7078a9c4611e37d6317309b4fc302d8222f0a1075d": 341654397551,
-                               "010fe1c87fe78e4bd89c767f1c8b9ba0a90ff5537e47e3ed006efccb8e67762830": 4924499,
-                               "0112357f15cf6461a772978c6fc72d93bc10c1abda3a85ee7b7feb593c785b95be": 6923634,
-                               "01123a33b4be7d1e7bebeb2b9c5cd93e9a1521905e9f9fd37ccb4481b5aec461a5": 5267127,
-                               "011538e2431680e2873a60c00b23839af9e45088adb240a12621479c951afc566c": 5022529,
-                               "011a65da6d839ecf30e4ef24952ee84125f7a955291cd752324ea44a98b65c7614": 5022524,
-                               "0125c16a4a387062414d59eb2a1387d3b380a1d4fede2994c582d07510a004c027": 707389749473,
-                               "01260f18d5f4939822731f010aff192dffef3243abaab455c02872ba866b663b71": 128195076894,
-                               "01267447c9ac87b4330ed3395db95efbba78394533666f29a56e8a1ec7b31abbd4": 2070731,
-                               "012836dbe9919b1ee2b93636853ac4190e891f5f815fcc8181166e308d4050ddb3": 5022529,
-                               "012a7750db3ad70a6adaecd353ddfc9c13f3694659d2e55d9460b6ca10648c02f3": 4924651,
-                               "012c5d81edbbec61d80368e2c433782fd967a734fc4a77e83629199c1a6585a814": 213549855626,
-                               "012dc55b77b2a9faf75dbaed15775ddfc48e60c4596608318c8b96b1900bdf1d5f": 9765816,
-                               "012e26890209f5234fdc707c2086ef84314bba0e2cc9c7cdbe199859152b3fdc30": 106832398693,
-                               "01325763b802697fada31b20f944d98b7090b0e7e0f654ddd31e1bc316d1d7a178": 14228791,
-                               "0135251e59c6f01800c51c4961ef37ebd34575e28c0942fdffd2ea34b09c54f86a": 641004223680,
-                               "013611a04b1ea5f3951d262716243fdad79cd7a39e103b80fde26fd48b7fa23c5d": 128006678294,
-                               "0138e7246e373b4b925e1081741794c77a5866cdf90061965442134f0fe59c60a1": 5536265,
-                               "013d357017db22c9135245601751e5da3be0de9fee01fd2ba919e07c6ee98c5837": 4920915,
-                               "013f774a58f4d40bd9b6cce7e306e53646913860ef2a111d00f0fe7794010c4012": 1643605667344,
-                               "0140e8b6d23614355e04e1e1fab97d54ea3cb6fa1e6db6c65ba6cb21ee7c6a81cc": 320494740351,
-                               "01422b1c5ed6a39ca2901f7ead65b0b2226df337fdfde53ffc0a0d5ec2aad12181": 213372330907,
-                               "0142f890ea38eacce7d24473d837147a0312c0db7400e5671fadc5b985090e1ecc": 164020204104,
-                               "0146c61d107ffb32738fdbb837213b240bf872536f326465642e467fe6884e7cdc": 7049383,
-                               "01473e65039f446dab9c1953e0ef951c1d46a60d4de44b95643bc3c80c70134af3": 4918769,
-                               "014b466f5c6c87bb1d2566d166120e320a724231374cd0775e0e347afed70a4745": 9661304,
-                               "014c07c881b5edb897e4944c5890344b7b0840fed9463183cb262c6c13c2273d6f": 106680350812,
-                               "014c28b6968597cbadb50ed0468f9a4f0dbfcac6e06737345e04e4d2f99f0002dd": 181034223493,
-                               "014d5eb3ac23735e695ae372defa057ca089a921f08a199415cc73fd118f68dc94": 106832247651,
-                               "014fdd08ed688b19cd92fb93be9b2a9108361f63edc7d0b1fda84f3e45e3bbd8e3": 187329272459,
-                               "01587265e95c4d895c912d3091b76d7d6034f9b5b6c38074c8f88244f65813cb0c": 515708364139,
-                               "0159ed106a989ec64cc9541041e05819acc1700e257e6eef56ed462044ef36dc78": 9623842,
-                               "015c3b543739fe8fa56cb1b09a91c3ed8ec0febbe6977bd8cb5273956094b8d7bb": 85463388568,
-                               "015da78bc6315643fbcf57d87a50853c67d8b271b615f38f6538f78a844cc4501d": 9727717,
-                               "015da9ac1f6508be409bc6ed45bc44c6afd6d94b90d60014576418a79b61d563a2": 534857499155,
-                               "0161a3701643407ee0094844264e43c2f8443e07c6871c16e94116a56b3028d3a5": 348856479028,
-                               "0161d871ce8dd5a7ff2b5533c8facf3907d33a79dad898484f286a35bf0cc35d46": 29285781,
-                               "0167601f851607ac0279fd8e7a2af6abe280b7c9dc52dc21d27bc0eab431d14fd4": 492281455620,
-                               "0167706181a308089391dda197cad09b836f2a2870bbf62ad7080780a8ea952669": 5022529,
-                               "01683b6e508120d7e970f86cdc29e7a317b5d18925cc368f4400c4e39e06ea879d": 106829180939,
-                               "01695a46374b2780fc8a6d3e8cd47323435c977389770f995ef3ea6f459b7f724b": 38840600,
-                               "0169740c39d54535e8702b03e80f3dc799b63c258319abe4b42547195ad0cf1b7a": 5022529,
-                               "016df1d80aafc6cca6dc54248132386a1188b665f6ce92b6f4e218fc408aa3dc4b": 152339929,
-                               "016ffbc278c0268817468117f2b59141b666422b9b251b5c2c0bb8a17c26fe575b": 4904829,
-                               "0178afbc7b204fcffd5c6832d0e04877a97571a7a9c8d021966df9d57c1742aa10": 173565458081,
-                               "0180187dda20ca4d0108ea54a31a6764bbd46c01420b1ab53e714f8761372a7ad3": 26068676,
-                               "01840a8258ad22e9f1237f4d96a36fc2841635ba8d831fb73956f55426fbce54b1": 154050935678,
-                               "01852d06432105b182c299a721cffd3ebb9ccbc5060c9bd503594b1899506bcf4a": 6176939,
-                               "01852d3355d56dcb1c62fae151aef4ab264739af6e32e247dc9b5237b096472983": 4923768,
-                               "0188a8f71663f01d2cf394d7e0ce577bd11b34bb6d2aa55f09071fb3c64f94a51b": 4924765,
-                               "0188d873a9e784e824ef3bd1581a4994fbb5eead58cb92e909542c7b9d65b15ae7": 6305324,
-                               "018977df4885899e3791ca6011ad46f3285d48a8b47900f92c5a7dd04af4c05d35": 4904296,
-                               "018b15761be0c527117c79b87ca013b014a4628f01e382902a139529406723d86b": 1643600715032,
-                               "018db4ea42689acfc05449c87eeb7970bc6f4bacd6571f8361ffc17dd9d6ae7914": 179493384987,
-                               "018dc552de3c403dbefe03a9c604e11346d96159ed49f9381a55c2e06c45197d43": 85518557227,
-                               "019078cbad006cf86c6f3e8b226f8ad3d24d346952077152d6d9a5d13f02658554": 4930493,
-                               "0190c61fd10424235f3ab035b48d11b806ad08174654c6619f3d3cc1087a9eae14": 4984014,
-                               "0190dd8430afb0958c25636596d1e98478ebe240c81260becf687cdf90ee088860": 106826800245,
-                               "01921a3c9c9837c9e11cf34d2495abb522a7d5f74bc2218df45fefb91c96deb988": 707356305878,
-                               "0192fe0efbf65cafa7aca49094af2fe01b4ed8bc8abdbd8c078476e9650c4b99ae": 136097467452,
-                               "0196948158bf5b35c0c84f680f110b8debaa4e7628e13ba336a95651a214d3b9bd": 38594241,
-                               "0199bc243a7497f5b0f384636cf5fe6c6f7f33113061de613959564c574ec8d61b": 4917735,
-                               "019ae7d932207d8fad7025ef6831ffb9ca495cb9eba65a30a35e3453640d7da7c4": 18455444,
-                               "019d4fa301d6a288609dcd2fa85dc84dbed8ee9361cbbf40e4c85071da2a4332d2": 149560951178,
-                               "01a4707d761e69f5838d77c2edcf378e9c51a82048fdafff389bba60aeff58210e": 821427650420,
-                               "01b1e495b07045f098d04d729947d8efb6a471c7b5ba69b461c980a276f56957c1": 534169970388,
-                               "01b3497e7319a842df35be58251bedd853b8ad4278e66313b5f06a189d567ad282": 9742339,
-                               "01b5f18818ac665f90ecee16280c83501f49d07e118c5dbdd2ad30a6f8f7bacafb": 39284008,
-                               "01b677d508c9b784c376c799033b20c1d1398694e2fe734f2e262a18600dc630fa": 187784964631,
-                               "01b7a5935f85710aa79e346bfe93f90d813bc20234dbd9211bcf8d2af8784520c2": 85463369103,
-                               "01b9137fcbb85baf03db2aa41e459199b27514a9943a0d2776752974c793905880": 177756327333,
-                               "01b99d5f54a5147ee34f472d546d84037007025df5e1a13cfdca7aac05e9ac5858": 6495086,
-                               "01b9c53d13b3c6021f3dcc1f7dca5c22b01b5ac6a273b8054e9a8dd090e739a848": 738023436771,
-                               "01bb61d3077d403e9429200265fbbe1f3f0521b6d07efc2daff7f29e37393c5731": 376852825556,
-                               "01bb9d7599bb8a0464946f8b7d812db16c80fb66ae345a7649d8cba96215b4a591": 210152867299,
-                               "01bdecf00f6f92d71011a0515fe918ba075abb42cbe063bb2ad10dbeacf9031168": 39032244,
-                               "01c3e639b8a789b61ec3ec10d32aa928496fd2a8239b90116db0c10008a8bb468f": 161131547175,
-                               "01c485e408cb73557a008f28a5761a7368e0a0dccfe89ea6ffcd3883d41d3065be": 132855462089,
-                               "01cb70f16e5dbfc0c0601cd6fe3d9e04e815eaebfe3e563f3d48e8035a4b8f18e2": 43896325,
-                               "01d2000024c05927e9958293bcb4de2e8f5e85b99f23e4260008e56dcd2088fd8e": 215226756338,
-                               "01d62fc9b894218bfbe8eebcc4a28a1fc4cb3a5c6120bb0027207ba8214439929e": 1643600741777,
-                               "01dbf36160e6cf1664bcf3a510e19f606c1d84dc5e53dd08d7e4a9ade9db126dff": 106829175716,
-                               "01de0f987b1085ff99283fde29f7b18b0b52c97d94f5b2124630017ada60de0982": 4922742,
-                               "01e2b343688101930b63af177df340815c1d8ce16dd9bc2f799902cb52d64bd5a5": 4903677,
-                               "01ef4f7c01b5d6c5b0b199dd1ffda9e74131c2bb49297ef28679dff34d4764324f": 789135122589,
-                               "01f210a4e89a5a4e81f4ccd6cf7a9e7c9d6dc25b168afafa7da7a5ec4809ad2649": 135570671445,
-                               "01f2470cfe9e6a34958f76e74385435ba02479c94e33f8d714b6546e18bc1d6d95": 155419354332,
-                               "01f2a124115721f18b7c1ace2b2d8b6d4980e7a7263b53936a41288fbfe2f220cb": 4920926,
-                               "01f35b161e8e73fe079e37c15b7edd58b6293c0ac41bd4cdf1ae27b970227dada2": 190845412710,
-                               "01f8684089490edcdb5feab0eee3615f26621dfd7f16419d06299466bab6fcb9f8": 192212409655,
-                               "01f8cc19ba142d7e82de13065634de13f011f3ca32141ec144cc6e4fdfd2697ce3": 137718469588,
-                               "01f93b4d887963276b11859aef9959b4caff61bd0cee5859698f4f9be367320681": 135286999640,
-                               "01f979b2820db754b82c25823f9886d3fc1e941e3442372dc9d40d0d2fd29156ce": 4923870,
-                               "01f9a00a3712a1ba5dcee00af368f07d384ccaebb3c840c34c5b322395419ba4d9": 821781708408,
-                               "01fe61249c459693809bf4f789dd38bc3b7772aa4ffaf642cc6993f4a1004df6c1": 196565652244},
-                            "inactive_validators": []},
-                        "next_era_validator_weights": {
-                                           "01014c1aaa70a992e7bf3445fa5871643b4207f9af97af7f8f2e309bf32822971b": "91057511148862",
-                                           "0102b0d1560c9909760a778b4b2ef5601461221c117e57c33ca8571888515ca65d": "1000434153177",
-                                           "0105e2c338d31db049db93012f9a158993c0f5e330bf6c71ac38c165b1047af511": "1020317620347",
-                                           "01068e4432b4ac5f6469fe08a92f84ebb7518b1a1a7f6b42651803067035fdca82": "40976585785205",
-                                           "010819b194079ef88b6ce54b85c3ca75318dead7984d9ff36f9fcdf84eb089d638": "18976634319888",
-                                           "010a0edc88c2f20b0934923f7078a9c4611e37d6317309b4fc302d8222f0a1075d": "69406311737196317",
-                                           "010fe1c87fe78e4bd89c767f1c8b9ba0a90ff5537e47e3ed006efccb8e67762830": "1000403611288",
-                                           "0112357f15cf6461a772978c6fc72d93bc10c1abda3a85ee7b7feb593c785b95be": "1406523168846",
-                                           "01123a33b4be7d1e7bebeb2b9c5cd93e9a1521905e9f9fd37ccb4481b5aec461a5": "1070006360373",
-                                           "011538e2431680e2873a60c00b23839af9e45088adb240a12621479c951afc566c": "1020317932350",
-                                           "011a65da6d839ecf30e4ef24952ee84125f7a955291cd752324ea44a98b65c7614": "1020315703550",
-                                           "0125c16a4a387062414d59eb2a1387d3b380a1d4fede2994c582d07510a004c027": "143704614437228959",
-                                           "01260f18d5f4939822731f010aff192dffef3243abaab455c02872ba866b663b71": "26042537529757074",
-                                           "012836dbe9919b1ee2b93636853ac4190e891f5f815fcc8181166e308d4050ddb3": "1020317932350",
-                                           "012a7750db3ad70a6adaecd353ddfc9c13f3694659d2e55d9460b6ca10648c02f3": "1000434386660",
-                                           "012c5d81edbbec61d80368e2c433782fd967a734fc4a77e83629199c1a6585a814": "43382166183592626",
-                                           "012dc55b77b2a9faf75dbaed15775ddfc48e60c4596608318c8b96b1900bdf1d5f": "1983905207568",
-                                           "012e26890209f5234fdc707c2086ef84314bba0e2cc9c7cdbe199859152b3fdc30": "21702758169923380",
-                                           "01325763b802697fada31b20f944d98b7090b0e7e0f654ddd31e1bc316d1d7a178": "2890548964674",
-                                           "0135251e59c6f01800c51c4961ef37ebd34575e28c0942fdffd2ea34b09c54f86a": "130218546261283593",
-                                           "013611a04b1ea5f3951d262716243fdad79cd7a39e103b80fde26fd48b7fa23c5d": "26004264783405347",
-                                           "0138e7246e373b4b925e1081741794c77a5866cdf90061965442134f0fe59c60a1": "1124681140628",
-                                           "013d357017db22c9135245601751e5da3be0de9fee01fd2ba919e07c6ee98c5837": "1000403179222",
-                                           "013f774a58f4d40bd9b6cce7e306e53646913860ef2a111d00f0fe7794010c4012": "333894743154994385",
-                                           "0140e8b6d23614355e04e1e1fab97d54ea3cb6fa1e6db6c65ba6cb21ee7c6a81cc": "65107775630168435",
-                                           "01422b1c5ed6a39ca2901f7ead65b0b2226df337fdfde53ffc0a0d5ec2aad12181": "43346102440013892",
-                                           "0142f890ea38eacce7d24473d837147a0312c0db7400e5671fadc5b985090e1ecc": "33320330425744405",
-                                           "0144e35abc4886168a53338539a8a3649ab1257d9f0c235ce38961624a025d40dd": "14973593873574",
-                                           "0146c61d107ffb32738fdbb837213b240bf872536f326465642e467fe6884e7cdc": "1432068194672",
-                                           "01473e65039f446dab9c1953e0ef951c1d46a60d4de44b95643bc3c80c70134af3": "1000394817410",
-                                           "014a1d338218b1c8aaf30a77a20cc8a88d4ba28e7118beaea718a8d4befa760882": "1992000000000",
-                                           "014b466f5c6c87bb1d2566d166120e320a724231374cd0775e0e347afed70a4745": "1962674433394",
-                                           "014c07c881b5edb897e4944c5890344b7b0840fed9463183cb262c6c13c2273d6f": "21671869989821973",
-                                           "014c28b6968597cbadb50ed0468f9a4f0dbfcac6e06737345e04e4d2f99f0002dd": "36776689663745536",
-                                           "014d5eb3ac23735e695ae372defa057ca089a921f08a199415cc73fd118f68dc94": "21702727486256932",
-                                           "014fdd08ed688b19cd92fb93be9b2a9108361f63edc7d0b1fda84f3e45e3bbd8e3": "38055514505401623",
-                                           "01587265e95c4d895c912d3091b76d7d6034f9b5b6c38074c8f88244f65813cb0c": "104764978127539216",
-                                           "0159ed106a989ec64cc9541041e05819acc1700e257e6eef56ed462044ef36dc78": "1955063952341",
-                                           "015c3b543739fe8fa56cb1b09a91c3ed8ec0febbe6977bd8cb5273956094b8d7bb": "17361692493886331",
-                                           "015da78bc6315643fbcf57d87a50853c67d8b271b615f38f6538f78a844cc4501d": "1976165128494",
-                                           "015da9ac1f6508be409bc6ed45bc44c6afd6d94b90d60014576418a79b61d563a2": "108655081236588073",
-                                           "0161a3701643407ee0094844264e43c2f8443e07c6871c16e94116a56b3028d3a5": "70869398165133148",
-                                           "0161d871ce8dd5a7ff2b5533c8facf3907d33a79dad898484f286a35bf0cc35d46": "5949341680914",
-                                           "0167601f851607ac0279fd8e7a2af6abe280b7c9dc52dc21d27bc0eab431d14fd4": "100005855085559562",
-                                           "0167706181a308089391dda197cad09b836f2a2870bbf62ad7080780a8ea952669": "1020317932350",
-                                           "01683b6e508120d7e970f86cdc29e7a317b5d18925cc368f4400c4e39e06ea879d": "21702104490101891",
-                                           "01695a46374b2780fc8a6d3e8cd47323435c977389770f995ef3ea6f459b7f724b": "7890381674086",
-                                           "0169740c39d54535e8702b03e80f3dc799b63c258319abe4b42547195ad0cf1b7a": "1020317932350",
-                                           "016df1d80aafc6cca6dc54248132386a1188b665f6ce92b6f4e218fc408aa3dc4b": "30947510925402",
-                                           "016ffbc278c0268817468117f2b59141b666422b9b251b5c2c0bb8a17c26fe575b": "1000424996732",
-                                           "0178afbc7b204fcffd5c6832d0e04877a97571a7a9c8d021966df9d57c1742aa10": "35259427002941896",
-                                           "0180187dda20ca4d0108ea54a31a6764bbd46c01420b1ab53e714f8761372a7ad3": "5295793602164",
-                                           "01840a8258ad22e9f1237f4d96a36fc2841635ba8d831fb73956f55426fbce54b1": "31295096278384101",
-                                           "01852d06432105b182c299a721cffd3ebb9ccbc5060c9bd503594b1899506bcf4a": "1254832546468",
-                                           "01852d3355d56dcb1c62fae151aef4ab264739af6e32e247dc9b5237b096472983": "1000253116522",
-                                           "0188a8f71663f01d2cf394d7e0ce577bd11b34bb6d2aa55f09071fb3c64f94a51b": "1000456043039",
-                                           "0188d873a9e784e824ef3bd1581a4994fbb5eead58cb92e909542c7b9d65b15ae7": "1280914554606",
-                                           "018b15761be0c527117c79b87ca013b014a4628f01e382902a139529406723d86b": "333893737103088073",
-                                           "018db4ea42689acfc05449c87eeb7970bc6f4bacd6571f8361ffc17dd9d6ae7914": "36463671835084940",
-                                           "018dc552de3c403dbefe03a9c604e11346d96159ed49f9381a55c2e06c45197d43": "17372899881513359",
-                                           "019078cbad006cf86c6f3e8b226f8ad3d24d346952077152d6d9a5d13f02658554": "1001620028612",
-                                           "0190c61fd10424235f3ab035b48d11b806ad08174654c6619f3d3cc1087a9eae14": "1012492574839",
-                                           "0190dd8430afb0958c25636596d1e98478ebe240c81260becf687cdf90ee088860": "21701620858016912",
-                                           "01921a3c9c9837c9e11cf34d2495abb522a7d5f74bc2218df45fefb91c96deb988": "143697820447158897",
-                                           "0192fe0efbf65cafa7aca49094af2fe01b4ed8bc8abdbd8c078476e9650c4b99ae": "27647890150559716",
-                                           "0196948158bf5b35c0c84f680f110b8debaa4e7628e13ba336a95651a214d3b9bd": "7840334181381",
-                                           "0199bc243a7497f5b0f384636cf5fe6c6f7f33113061de613959564c574ec8d61b": "1000428767443",
-                                           "019ae7d932207d8fad7025ef6831ffb9ca495cb9eba65a30a35e3453640d7da7c4": "3749183334882",
-                                           "019d4fa301d6a288609dcd2fa85dc84dbed8ee9361cbbf40e4c85071da2a4332d2": "30382966166389144",
-                                           "01a4707d761e69f5838d77c2edcf378e9c51a82048fdafff389bba60aeff58210e": "166871153954882610",
-                                           "01b1e495b07045f098d04d729947d8efb6a471c7b5ba69b461c980a276f56957c1": "108515411336058890",
-                                           "01b3497e7319a842df35be58251bedd853b8ad4278e66313b5f06a189d567ad282": "1979135509599",
-                                           "01b5f18818ac665f90ecee16280c83501f49d07e118c5dbdd2ad30a6f8f7bacafb": "7980458331411",
-                                           "01b677d508c9b784c376c799033b20c1d1398694e2fe734f2e262a18600dc630fa": "38148087331410209",
-                                           "01b7a5935f85710aa79e346bfe93f90d813bc20234dbd9211bcf8d2af8784520c2": "17361688193713063",
-                                           "01b9137fcbb85baf03db2aa41e459199b27514a9943a0d2776752974c793905880": "36110792535105373",
-                                           "01b99d5f54a5147ee34f472d546d84037007025df5e1a13cfdca7aac05e9ac5858": "2989900030000",
-                                           "01b9c53d13b3c6021f3dcc1f7dca5c22b01b5ac6a273b8054e9a8dd090e739a848": "149927778153703819",
-                                           "01bb61d3077d403e9429200265fbbe1f3f0521b6d07efc2daff7f29e37393c5731": "76556792118333282",
-                                           "01bb9d7599bb8a0464946f8b7d812db16c80fb66ae345a7649d8cba96215b4a591": "43406225015826310",
-                                           "01bdecf00f6f92d71011a0515fe918ba075abb42cbe063bb2ad10dbeacf9031168": "7929313457037",
-                                           "01c3e639b8a789b61ec3ec10d32aa928496fd2a8239b90116db0c10008a8bb468f": "32733506357468952",
-                                           "01c485e408cb73557a008f28a5761a7368e0a0dccfe89ea6ffcd3883d41d3065be": "26989284154813914",
-                                           "01cb70f16e5dbfc0c0601cd6fe3d9e04e815eaebfe3e563f3d48e8035a4b8f18e2": "8917440388039",
-                                           "01d2000024c05927e9958293bcb4de2e8f5e85b99f23e4260008e56dcd2088fd8e": "43722824738739717",
-                                           "01d62fc9b894218bfbe8eebcc4a28a1fc4cb3a5c6120bb0027207ba8214439929e": "333893742536213609",
-                                           "01dbf36160e6cf1664bcf3a510e19f606c1d84dc5e53dd08d7e4a9ade9db126dff": "21702103429059601",
-                                           "01de0f987b1085ff99283fde29f7b18b0b52c97d94f5b2124630017ada60de0982": "1000045907458",
-                                           "01e2b343688101930b63af177df340815c1d8ce16dd9bc2f799902cb52d64bd5a5": "1000433158211",
-                                           "01ef4f7c01b5d6c5b0b199dd1ffda9e74131c2bb49297ef28679dff34d4764324f": "160311000574918182",
-                                           "01f210a4e89a5a4e81f4ccd6cf7a9e7c9d6dc25b168afafa7da7a5ec4809ad2649": "27540872743121170",
-                                           "01f2470cfe9e6a34958f76e74385435ba02479c94e33f8d714b6546e18bc1d6d95": "31573087407651585",
-                                           "01f2a124115721f18b7c1ace2b2d8b6d4980e7a7263b53936a41288fbfe2f220cb": "1000404569219",
-                                           "01f35b161e8e73fe079e37c15b7edd58b6293c0ac41bd4cdf1ae27b970227dada2": "38769810379716710",
-                                           "01f8684089490edcdb5feab0eee3615f26621dfd7f16419d06299466bab6fcb9f8": "39047512691588547",
-                                           "01f8cc19ba142d7e82de13065634de13f011f3ca32141ec144cc6e4fdfd2697ce3": "27977193037724549",
-                                           "01f93b4d887963276b11859aef9959b4caff61bd0cee5859698f4f9be367320681": "27483245463219620",
-                                           "01f979b2820db754b82c25823f9886d3fc1e941e3442372dc9d40d0d2fd29156ce": "1000275522538",
-                                           "01f9a00a3712a1ba5dcee00af368f07d384ccaebb3c840c34c5b322395419ba4d9": "166943080028355470",
-                                           "01fe61249c459693809bf4f789dd38bc3b7772aa4ffaf642cc6993f4a1004df6c1": "39931863996175219"}},
-                           "timestamp": "2021-03-21T22:29:08.224Z", "era_id": 62, "height": 16407,
-                                   "protocol_version": "1.0.2"},
-                        "body": {"proposer": "018b15761be0c527117c79b87ca013b014a4628f01e382902a139529406723d86b",
-                                 "deploy_hashes": [], "transfer_hashes": []}}}
-empty_block = {"block_hash": "bd707fff6ff7e55dba6b0b49c04b90c57bdeac706230f60ed04152e7b8913101",
-               "block": {"hash": "bd707fff6ff7e55dba6b0b49c04b90c57bdeac706230f60ed04152e7b8913101",
-                         "header": {"parent_hash": "599d62a072d84545b276b6498f0e598fa606284e6413759d8690559fc95d8867",
-                                    "state_root_hash": "2fc0cc09f8b03f2e5fd1942df90e511e7ec608d694782eccce575a2b8d53720a",
-                                    "body_hash": "0937baff24a9cc6e797a16e7db13e09dc8febba820d98d99a6964f025bb6a341",
-                                    "random_bit": true,
-                                    "accumulated_seed": "0abd33f849f7990bf9f01cd45416ee786f02fbeca4038df964aae2851b1ee09a",
-                                    "era_end": null,
-                                    "timestamp": "2021-03-21T22:42:14.656Z", "era_id": 63,
-                                    "height": 16408, "protocol_version": "1.0.2"},
-                         "body": {"proposer": "013f774a58f4d40bd9b6cce7e306e53646913860ef2a111d00f0fe7794010c4012",
-                                  "deploy_hashes": [], "transfer_hashes": []}}}
-
-fin_sig = {"FinalitySignature": {"block_hash": "638351b5f1e1f662e86f7eed56cf588334c9d520bcdc331d7857e9ffb4c98a10",
-           "era_id": 63,
-           "signature": "01d745a57bcba6af42d6ff1549ea6952dcdce2989a317d7ecd83ac5ef37fe13bfadea96e87edf0e15149ce1fa072684999a4182f7b396b7c64fc6c0a0153fab10a",
-           "public_key": "01852d3355d56dcb1c62fae151aef4ab264739af6e32e247dc9b5237b096472983"}}
+    def get(self, data: MessageData) -> Optional[str]:
+        """ Stored data string of the event with the keys of data, or None """
+        table, item = self._item(data, data.full_msg)
+        _, partition_key, sort_key = self._schema(data.message_type)
+        key = {name: item[name] for name, _ in filter(None, (partition_key, sort_key))}
+        stored = self.client.get_item(TableName=table, Key=key).get("Item")
+        return stored["data"]["S"] if stored else None
@@ -0,0 +1,107 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+import config
+from event_types import validator_weights
+from node_rpc import RpcClient
+
+
+class EraWeightsStore:
+    """
+    Validator weights per era on disk, as era_<era_id>.json of {validator_public_key: weight} in weights_dir.
+
+    Weights of an era never change once its previous era's switch block exists, so they are saved as seen
+    and a restart only needs RPC calls for eras it has not seen.  Files are written atomically.
+    """
+
+    def __init__(self, weights_dir: Path = config.ERA_WEIGHTS_DIR):
+        self.weights_dir = Path(weights_dir)
+
+    def _path(self, era_id: int) -> Path:
+        return self.weights_dir / f"era_{era_id}.json"
+
+    def get(self, era_id: int) -> Optional[Dict[str, int]]:
+        path = self._path(era_id)
+        if not path.exists():
+            return None
+        return {validator: int(weight) for validator, weight in json.loads(path.read_text()).items()}
+
+    def put(self, era_id: int, weights: Dict[str, int]):
+        self.weights_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(era_id)
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with open(tmp_path, 'w') as f:
+            # Weights are U512, kept as strings as in the event stream
+            json.dump({validator: str(weight) for validator, weight in weights.items()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+class SwitchBlockFinder:
+    """
+    Finds the switch block ending an era by block height, instead of walking parent hashes back one block at
+    a time.
+
+    The first block of the following era is estimated from the average blocks per era, and each probe jumps
+    just past the estimated boundary from the side it landed on, so the boundary is bracketed within about an
+    era in a few calls and then bisected.  After MAX_LEAPS jumps it falls back to bisection, so it takes at
+    most MAX_LEAPS more calls than a binary search if era lengths vary widely.
+    """
+    # Eras to jump from the side a probe landed on, past the estimated boundary so the next lands on the other
+    OVERSHOOT = 1.1
+    MAX_LEAPS = 4
+
+    def __init__(self, client: RpcClient):
+        self.client = client
+        self.calls = 0
+
+    def _header(self, block_height: int = None, block_hash: str = None) -> dict:
+        self.calls += 1
+        return self.client.get_block(block_hash=block_hash, block_height=block_height)["block"]["header"]
+
+    def first_height_of_era(self, era_id: int, known_height: int, known_era_id: int) -> int:
+        """ Height of the first block in era_id, given a block at known_height in known_era_id >= era_id """
+        if era_id == 0:
+            return 0
+        blocks_per_era = known_height / known_era_id
+        # Invariant: era of block lo < era_id <= era of block hi, starting from genesis in era 0
+        lo, lo_era = 0, 0
+        hi, hi_era = known_height, known_era_id
+        from_hi = False
+        leaps = 0
+        while hi - lo > 1:
+            if leaps < self.MAX_LEAPS and not (lo_era == era_id - 1 and hi_era == era_id):
+                leaps += 1
+                if from_hi:
+                    probe = hi - round((hi_era - era_id + self.OVERSHOOT) * blocks_per_era)
+                else:
+                    probe = lo + round((era_id - lo_era - 1 + self.OVERSHOOT) * blocks_per_era)
+            else:
+                probe = (lo + hi) // 2
+            probe = min(max(probe, lo + 1), hi - 1)
+            probe_era = self._header(block_height=probe)["era_id"]
+            from_hi = probe_era >= era_id
+            if from_hi:
+                hi, hi_era = probe, probe_era
+            else:
+                lo, lo_era = probe, probe_era
+        return hi
+
+    def switch_block_header(self, era_id: int, known_height: int, known_era_id: int) -> dict:
+        """ Header of the last block in era_id, given a later block at known_height in known_era_id """
+        first_height = self.first_height_of_era(era_id + 1, known_height, known_era_id)
+        return self._header(block_height=first_height - 1)
+
+    def era_weights(self, era_id: int, block_hash: str = None) -> Dict[str, int]:
+        """
+        Validator weights of era_id from the previous era's switch block, searching back from block_hash in
+        era_id or later, or from the latest block.
+        """
+        if era_id == 0:
+            return {}
+        header = self._header(block_hash=block_hash)
+        switch_header = self.switch_block_header(era_id - 1, header["height"], header["era_id"])
+        return validator_weights(switch_header["era_end"])
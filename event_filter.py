@@ -0,0 +1,128 @@
+import functools
+import re
+from typing import Any, Callable, Dict, Union
+
+from message_structure import MessageData, NestedDict, ROOT_KEY_RE
+
+# Filters on the raw data string of events, so consumers interested in a few events do not parse the rest:
+#
+#     proposed = EventFilter(Match(BLOCK_ADDED, {"block.body.proposer": my_key}))
+#     for msg in EventStreamReader(SSE_SERVER_MAIN_URL).messages(event_filter=proposed):
+#
+# The message type is checked against the start of the data.  Each field condition is then checked on the values
+# of its last path name found by targeted search of the data, which can only reject.  An event is parsed to check
+# the full field paths only when all conditions may match.
+
+
+# Each "name": with its value if a string, int or null, as FIELD_VALUE_RE of message_structure
+KEY_VALUE_RE = r'"{}"\s*:\s*(?:"([^"\\]*)"|(-?\d+)|(null))?'
+
+
+@functools.lru_cache(maxsize=None)
+def _key_value_re(name: str):
+    return re.compile(KEY_VALUE_RE.format(re.escape(name)))
+
+
+class Condition:
+    """
+    Field at path, such as "block.header.height", equal to expected, or for which expected(value) is True.
+    A field that is missing or null does not match.
+    """
+    __slots__ = ("path", "predicate", "needle", "key_value_re")
+
+    def __init__(self, path: str, expected: Union[Any, Callable[[Any], bool]]):
+        names = path.split(".")
+        self.path = tuple(names)
+        self.key_value_re = _key_value_re(names[-1])
+        self.needle = None
+        if callable(expected):
+            self.predicate = expected
+        else:
+            self.predicate = lambda value: value == expected
+            # Text that must be in the data for the value to be there
+            if isinstance(expected, int) and not isinstance(expected, bool):
+                self.needle = str(expected)
+            elif isinstance(expected, str) and '"' not in expected and "\\" not in expected:
+                self.needle = f'"{expected}"'
+
+    def _test(self, value) -> bool:
+        if value is None:
+            return False
+        try:
+            return bool(self.predicate(value))
+        except (TypeError, ValueError, AttributeError):
+            return False
+
+    def may_match(self, data: str) -> bool:
+        """ False if the field can not match, from a search of data without parsing """
+        if self.needle is not None and self.needle not in data:
+            return False
+        for match in self.key_value_re.finditer(data):
+            text, number, null = match.groups()
+            if text is not None:
+                value = text
+            elif number is not None:
+                value = int(number)
+            elif null is None:
+                # Objects, arrays and booleans are not extracted, so can only be checked by parsing
+                return True
+            else:
+                continue
+            if self._test(value):
+                return True
+        return False
+
+    def matches(self, body: NestedDict) -> bool:
+        try:
+            value = body[self.path]
+        except AttributeError:
+            # A list on the path
+            return False
+        return self._test(value)
+
+
+class Match:
+    """ Events of message_type with all of conditions, which are {field path: expected value or predicate} """
+
+    def __init__(self, message_type: str, conditions: Dict[str, Any] = None):
+        self.message_type = message_type
+        # Node sends JSON without whitespace, so type is the first key
+        self.prefix = f'{{"{message_type}"'
+        self.conditions = [Condition(path, expected) for path, expected in (conditions or {}).items()]
+
+    def matches(self, data: str) -> bool:
+        """ True if data, already known to be of message_type, has all conditions """
+        if not self.conditions:
+            return True
+        if not all(condition.may_match(data) for condition in self.conditions):
+            return False
+        body = MessageData(data).data
+        return all(condition.matches(body) for condition in self.conditions)
+
+
+class EventFilter:
+    """ Accepts events with any of matches, counting accepted and rejected """
+
+    def __init__(self, *matches: Match):
+        self.matches = matches
+        self._prefixes = tuple({match.prefix for match in matches})
+        self.accepted = 0
+        self.rejected = 0
+
+    def _match_type(self, data: str, match: Match) -> bool:
+        if data.startswith(match.prefix):
+            return True
+        if data.startswith('{"'):
+            return False
+        # Not in the compact form sent by the node
+        root = ROOT_KEY_RE.match(data)
+        return root is not None and root.group(1) == match.message_type
+
+    def accepts(self, data: str) -> bool:
+        if data.startswith(self._prefixes) or not data.startswith('{"'):
+            for match in self.matches:
+                if self._match_type(data, match) and match.matches(data):
+                    self.accepted += 1
+                    return True
+        self.rejected += 1
+        return False
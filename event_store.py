@@ -0,0 +1,62 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, Optional, Tuple
+
+import config
+from message_structure import MessageData
+
+
+class EventStore(ABC):
+    """
+    Storage backend for the event pipeline.
+
+    save_message is called with the routing MessageData and the original message data string to store.
+    Backends are not required to be thread safe for concurrent save_message calls unless noted.
+    Used as a context manager, the store is closed on exit.
+    """
+
+    @abstractmethod
+    def save_message(self, data: MessageData, contents: str):
+        """ Save one event """
+
+    def save_batch(self, messages: Iterable[Tuple[MessageData, str]]):
+        """ Save many (MessageData, contents) and flush once """
+        for data, contents in messages:
+            self.save_message(data, contents)
+        self.flush()
+
+    def flush(self):
+        """ Make saved messages durable """
+        pass
+
+    def stored_keys(self) -> Iterable[Tuple[Optional[int], str]]:
+        """ (era_id, primary_key) of stored events, era_id None if not known, used to skip them when read again """
+        return ()
+
+    def is_stored(self, data: MessageData) -> bool:
+        """ True if the event is known to be stored, False if not or it can't be checked cheaply """
+        return False
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def get_event_store(backend: str = None) -> EventStore:
+    """ Create store for backend name, from config.STORE_BACKEND if not given """
+    backend = backend or config.STORE_BACKEND
+    if backend == "directory":
+        from catalog import default_catalog
+        from directory_store import DirectoryStore
+        return DirectoryStore(config.DATA_DIR, catalog=default_catalog())
+    if backend == "segment_log":
+        from segment_log_store import SegmentLogStore
+        return SegmentLogStore(config.LOG_DIR)
+    if backend == "dynamodb":
+        from dynamdb_store import DynamoStore
+        return DynamoStore()
+    raise ValueError(f"Unknown store backend: {backend}")
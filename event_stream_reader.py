@@ -1,15 +1,39 @@
-from sseclient import SSEClient, Event
 from time import sleep
 from requests.exceptions import ConnectionError
+import aiohttp
+import asyncio
+import mmap
+import os
+import requests
+from typing import Callable, Optional
+import json
+import functools
 import random
 import logging
 
+import metrics
+from dump_index import DumpIndex
+from event_filter import EventFilter
+from message_structure import API_VERSION
+from sse_parser import SSEFrameParser, frame_id, iter_frames, parse_frame
+from stream_checkpoint import StreamCheckpoint
+
+# Number of messages read from a file between handing control back to the event loop.
+ASYNC_YIELD_EVERY = 100
+CONNECT_TIMEOUT_SEC = 30
+# Start of an ApiVersion frame in a dump file
+API_VERSION_FRAME = f'data:{{"{API_VERSION}"'.encode()
+
 
 def node_message_streamer(server: str, start_from: int = 0):
     """ yields messages from a node server """
-    messages = SSEClient(f"{server}?start_from={start_from}")
-    for msg in messages:
-        yield msg
+    parser = SSEFrameParser()
+    with requests.get(server, params={"start_from": start_from}, stream=True,
+                      timeout=(CONNECT_TIMEOUT_SEC, None)) as response:
+        response.raise_for_status()
+        # chunk_size of None yields data as it arrives, rather than waiting to fill a chunk
+        for chunk in response.iter_content(chunk_size=None):
+            yield from parser.feed(chunk)
 
 
 def file_message_streamer(server: str, start_from):
@@ -17,19 +41,55 @@ def file_message_streamer(server: str, start_from):
     Simulates live event stream by using a dump file of the event stream from:
     `curl -sN host_ip:9999/events > dump_file`
 
-    server should be full path to file
+    server should be full path to file.  A DumpIndex sidecar file is used to seek to start_from.
     """
-    for_processing = []
-    for line in open(server, 'r'):
-        if line == "\n":
-            if for_processing != [':\n']:
-                msg = Event.parse(''.join(for_processing))
-                cur_id = int(msg.id) if msg.id is not None else 0
-                if cur_id >= int(start_from):
+    start_from = int(start_from)
+    offset = DumpIndex(server).update().offset_for(start_from) if start_from > 0 else 0
+    with open(server, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            for frame_start, frame_end in iter_frames(buffer):
+                # Messages without id, such as ApiVersion, are sent by the node on every connection.
+                if frame_id(buffer, frame_start, frame_end) is not None:
+                    offset = max(offset, frame_start)
+                    break
+                msg = parse_frame(buffer, frame_start, frame_end)
+                if msg is not None:
                     yield msg
-            for_processing = []
-            continue
-        for_processing.append(line)
+            for frame_start, frame_end in iter_frames(buffer, offset):
+                msg_id = frame_id(buffer, frame_start, frame_end)
+                if msg_id is not None:
+                    if msg_id >= start_from:
+                        yield parse_frame(buffer, frame_start, frame_end)
+                elif buffer[frame_start:frame_start + len(API_VERSION_FRAME)] == API_VERSION_FRAME:
+                    # Node restarted while the dump was recorded, as in dumps joined together
+                    yield parse_frame(buffer, frame_start, frame_end)
+
+
+async def async_node_message_streamer(server: str, start_from: int = 0):
+    """ yields messages from a node server without blocking the event loop """
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT_SEC)
+    parser = SSEFrameParser()
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.get(server, params={"start_from": start_from}) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_any():
+                for msg in parser.feed(chunk):
+                    yield msg
+
+
+async def async_file_message_streamer(server: str, start_from: int, message_streamer=None):
+    """
+    Async wrapper over a file based streamer, handing control back to the event loop
+    every ASYNC_YIELD_EVERY messages so other streams on the loop are serviced.
+    """
+    if message_streamer is None:
+        message_streamer = file_message_streamer
+    for count, msg in enumerate(message_streamer(server, start_from)):
+        if count % ASYNC_YIELD_EVERY == 0:
+            await asyncio.sleep(0)
+        yield msg
 
 
 def file_message_streamer_with_disconnects(server: str, start_from: int):
@@ -43,49 +103,203 @@ def file_message_streamer_with_disconnects(server: str, start_from: int):
         yield msg
 
 
+class NodeRestartDetected(Exception):
+    """ Stream shows the node restarted, so message ids have started over """
+
+
 class EventStreamReader:
-    """ Read the event stream of a casper-node """
+    """
+    Read the event stream of a casper-node
+
+    The checkpoint moves past a message once the consumer returns for it.  With checkpoint_when_saved, it is
+    only moved by calling the callback from saved_callback(), for consumers that store messages later.
+    """
     RECONNECT_DELAY_SEC = 5
     RECONNECT_COUNT = 1500
 
-    def __init__(self, server_address: str, start_from: int = 0, message_streamer=None):
+    def __init__(self, server_address: str, start_from: int = 0, message_streamer=None,
+                 async_message_streamer=None, checkpoint: Optional[StreamCheckpoint] = None, name: str = None,
+                 checkpoint_when_saved: bool = False):
         self.server = server_address
+        self.checkpoint_when_saved = checkpoint_when_saved
+        # Counts restarts from 0, so saved callbacks from before one are ignored
+        self._restarts = 0
+        # Stream label for metrics
+        self.name = name or server_address
+        self._disconnect_timer = metrics.DisconnectTimer(self.name)
         self.start_from = start_from
         self.last_msg_id = -1
+        self.api_version = None
+        self.checkpoint = checkpoint
+        if checkpoint is not None:
+            self.api_version = checkpoint.api_version
+            if checkpoint.last_msg_id >= 0:
+                self.last_msg_id = checkpoint.last_msg_id
+                self.start_from = checkpoint.start_from
         if message_streamer is None:
             self._message_streamer = node_message_streamer
         else:
             self._message_streamer = message_streamer
+        if async_message_streamer is None:
+            self._async_message_streamer = async_node_message_streamer
+        else:
+            self._async_message_streamer = async_message_streamer
 
-    def messages(self):
+    def _check_message(self, message) -> bool:
+        """
+        Returns True if message should be yielded.
+
+        Raises NodeRestartDetected when a new ApiVersion is seen, or the id does not move forward.
+        """
+        # SSE may send empty messages and ApiVersion is sent without id on connection.
+        if message.id is None:
+            if message.data.startswith(f'{{"{API_VERSION}"'):
+                api_version = json.loads(message.data)[API_VERSION]
+                old_api_version, self.api_version = self.api_version, api_version
+                if old_api_version is not None and api_version != old_api_version:
+                    raise NodeRestartDetected(f"ApiVersion changed from {old_api_version} to {api_version}")
+            return False
+        if int(message.id) <= self.last_msg_id:
+            raise NodeRestartDetected(f"msg.id {message.id} is not after last msg.id {self.last_msg_id}")
+        return True
+
+    def _received(self, message):
+        """ Called as message is yielded, so a reconnect resumes after it """
+        self.last_msg_id = int(message.id)
+        self.start_from = self.last_msg_id + 1
+        if metrics.ENABLED:
+            metrics.LAST_MSG_ID.set(self.last_msg_id, self.name)
+            self._disconnect_timer.connected()
+
+    def _disconnected(self):
+        """ Called when the stream ended or failed, before the delay to reconnect """
+        if metrics.ENABLED:
+            metrics.RECONNECTS.inc(self.name)
+            self._disconnect_timer.disconnected()
+
+    def _processed(self):
+        """ Called once the consumer returns for the message, so it is safe to persist """
+        if self.checkpoint is not None and not self.checkpoint_when_saved:
+            self.checkpoint.update(self.last_msg_id)
+
+    def saved_callback(self) -> Callable[[], None]:
+        """ Callback moving the checkpoint past the message being consumed, once the consumer has stored it """
+        return functools.partial(self._saved, self.last_msg_id, self._restarts)
+
+    def _saved(self, msg_id: int, restarts: int):
+        if self.checkpoint is not None and restarts == self._restarts and msg_id > self.checkpoint.last_msg_id:
+            self.checkpoint.update(msg_id)
+
+    def _restart_from_zero(self, error: NodeRestartDetected):
+        logging.error(f"Node restart detected: {error}. Restarting from 0.")
+        self.last_msg_id = -1
+        self.start_from = 0
+        self._restarts += 1
+        if self.checkpoint is not None:
+            self.checkpoint.reset(self.api_version)
+
+    def messages(self, event_filter: EventFilter = None):
         """
         Blocking method that continuously yields messages from the SSE server.
 
-        Updates self.last_id for each message.  If SSE queue outruns client and is disconnected,
-        it will resume at last_id.
+        Updates self.last_msg_id for each message.  If SSE queue outruns client and is disconnected,
+        it will resume at last_msg_id + 1.  Only when the node is detected to have restarted will it
+        start again from 0.
+
+        With event_filter, only messages it accepts are yielded, and the rest are passed over as processed.
         """
         reconnect_count = 0
         while reconnect_count < self.RECONNECT_COUNT:
             reconnect_count += 1
             try:
-                # On restart we might crawl through a bunch, but this doesn't miss them if it is a server restart.
-                self.start_from = 0
                 for message in self._message_streamer(self.server, self.start_from):
-                    # SSE may send empty messages.  We ignore those.
-                    if message.id is not None:
+                    if self._check_message(message):
                         reconnect_count = 0
-                        self.last_msg_id = int(message.id)
-                        self.start_from = self.last_msg_id + 1
-                        yield message
+                        self._received(message)
+                        if event_filter is not None and not event_filter.accepts(message.data):
+                            self._processed()
+                            continue
+                        try:
+                            yield message
+                        finally:
+                            # Also when consumer stops iteration, as it has the message.
+                            self._processed()
                 logging.info("Stream ended without error, retrying after delay.")
+                self._disconnected()
                 sleep(self.RECONNECT_DELAY_SEC)
+            except NodeRestartDetected as e:
+                # Message ids are from the new node process, so reconnect from the start without delay.
+                self._restart_from_zero(e)
             except ConnectionError:
                 logging.error(f"Connection Error, last msg.id = {self.last_msg_id}, restarting after delay.")
+                self._disconnected()
                 # Most likely server being restarted. Give some time before retry.
                 sleep(self.RECONNECT_DELAY_SEC)
             except Exception as e:
                 logging.error(f"Error occurred: {e}")
+                self._disconnected()
                 sleep(self.RECONNECT_DELAY_SEC)
         else:
             logging.error(f"Reconnect count: {self.RECONNECT_COUNT} exceeded. Exiting...")
 
+    async def async_messages(self, event_filter: EventFilter = None):
+        """
+        Async version of messages() for use on an asyncio event loop.
+
+        Reconnect and event_filter behavior match messages(), but waiting is done with asyncio.sleep so other
+        streams on the same loop keep being serviced.
+        """
+        reconnect_count = 0
+        while reconnect_count < self.RECONNECT_COUNT:
+            reconnect_count += 1
+            try:
+                async for message in self._async_message_streamer(self.server, self.start_from):
+                    if self._check_message(message):
+                        reconnect_count = 0
+                        self._received(message)
+                        if event_filter is not None and not event_filter.accepts(message.data):
+                            self._processed()
+                            continue
+                        try:
+                            yield message
+                        finally:
+                            # Also when consumer stops iteration, as it has the message.
+                            self._processed()
+                logging.info("Stream ended without error, retrying after delay.")
+                self._disconnected()
+                await asyncio.sleep(self.RECONNECT_DELAY_SEC)
+            except NodeRestartDetected as e:
+                # Message ids are from the new node process, so reconnect from the start without delay.
+                self._restart_from_zero(e)
+            except (ConnectionError, aiohttp.ClientError):
+                logging.error(f"Connection Error, last msg.id = {self.last_msg_id}, restarting after delay.")
+                self._disconnected()
+                # Most likely server being restarted. Give some time before retry.
+                await asyncio.sleep(self.RECONNECT_DELAY_SEC)
+            except Exception as e:
+                logging.error(f"Error occurred: {e}")
+                self._disconnected()
+                await asyncio.sleep(self.RECONNECT_DELAY_SEC)
+        else:
+            logging.error(f"Reconnect count: {self.RECONNECT_COUNT} exceeded. Exiting...")
+
+
+async def _consume_stream(stream_reader: EventStreamReader, handler):
+    async for message in stream_reader.async_messages():
+        await handler(message)
+
+
+async def multiplex_streams(readers_and_handlers):
+    """
+    Reads any number of streams on the running event loop with a single thread.
+
+    readers_and_handlers is an iterable of (EventStreamReader, async handler) pairs.  Each handler is awaited
+    with every message from its reader, so a slow handler only delays its own stream.
+    Returns when all streams have ended.
+    """
+    tasks = [asyncio.create_task(_consume_stream(reader, handler)) for reader, handler in readers_and_handlers]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,144 @@
+import functools
+from typing import Optional
+
+
+# Typed, slotted classes for the data of each event type, decoded once against a schema so later use is plain
+# attribute access rather than NestedDict lookups.
+#
+# SCHEMA is a tuple of (attribute, path in event data, converter, required).  A missing required field raises
+# ValueError, so MessageData can fall back to NestedDict access for data it does not recognize.
+
+_MISSING = object()
+
+
+@functools.lru_cache(maxsize=None)
+def _schema_groups(cls) -> tuple:
+    """ SCHEMA of cls as ((path of parent dict, ((attr, key, converter, required), ...)), ...) """
+    groups = {}
+    for attr, path, converter, required in cls.SCHEMA:
+        groups.setdefault(path[:-1], []).append((attr, path[-1], converter, required))
+    return tuple((parent_path, tuple(fields)) for parent_path, fields in groups.items())
+
+
+def _tuple(value) -> tuple:
+    return tuple(value)
+
+
+def validator_weights(era_end: Optional[dict]) -> dict:
+    """ {validator_public_key: weight} from next_era_validator_weights of a switch block's era_end """
+    if era_end is None:
+        return {}
+    return {data["validator"]: int(data["weight"]) for data in era_end["next_era_validator_weights"]}
+
+
+class EventData:
+    __slots__ = ()
+    SCHEMA = ()
+
+    @classmethod
+    def from_data(cls, data: dict):
+        """
+        Decode from the dict under the root message type key, as parsed by json.loads or a NestedDict of it.
+        Each nested dict holding fields, such as block.header, is found once for all its fields.
+        """
+        obj = cls.__new__(cls)
+        for parent_path, fields in _schema_groups(cls):
+            parent = data
+            for key in parent_path:
+                parent = parent.get(key, _MISSING) if isinstance(parent, dict) else _MISSING
+                if parent is _MISSING or parent is None:
+                    break
+            for attr, key, converter, required in fields:
+                if parent is None:
+                    value = None
+                else:
+                    value = parent.get(key, _MISSING) if isinstance(parent, dict) else _MISSING
+                if value is _MISSING:
+                    if required:
+                        raise ValueError(f"{cls.__name__} missing field: {'.'.join(parent_path + (key,))}")
+                    value = None
+                elif value is not None and converter is not None:
+                    value = converter(value)
+                setattr(obj, attr, value)
+        return obj
+
+    def __repr__(self):
+        fields = ", ".join(f"{attr}={getattr(self, attr)!r}" for attr in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class BlockAdded(EventData):
+    __slots__ = ("block_hash", "parent_hash", "state_root_hash", "era_id", "height", "timestamp", "protocol_version",
+                 "era_end", "proposer", "deploy_hashes", "transfer_hashes")
+    SCHEMA = (("block_hash", ("block_hash",), None, True),
+              ("parent_hash", ("block", "header", "parent_hash"), None, True),
+              ("state_root_hash", ("block", "header", "state_root_hash"), None, False),
+              ("era_id", ("block", "header", "era_id"), int, True),
+              ("height", ("block", "header", "height"), int, True),
+              ("timestamp", ("block", "header", "timestamp"), None, True),
+              ("protocol_version", ("block", "header", "protocol_version"), None, False),
+              ("era_end", ("block", "header", "era_end"), None, False),
+              ("proposer", ("block", "body", "proposer"), None, True),
+              ("deploy_hashes", ("block", "body", "deploy_hashes"), _tuple, True),
+              ("transfer_hashes", ("block", "body", "transfer_hashes"), _tuple, True))
+
+    @property
+    def is_switch_block(self) -> bool:
+        return self.era_end is not None
+
+    @property
+    def next_era_validator_weights(self) -> dict:
+        return validator_weights(self.era_end)
+
+
+class DeployProcessed(EventData):
+    __slots__ = ("deploy_hash", "account", "timestamp", "ttl", "dependencies", "block_hash", "execution_result")
+    SCHEMA = (("deploy_hash", ("deploy_hash",), None, True),
+              ("account", ("account",), None, True),
+              ("timestamp", ("timestamp",), None, True),
+              ("ttl", ("ttl",), None, True),
+              ("dependencies", ("dependencies",), _tuple, False),
+              ("block_hash", ("block_hash",), None, True),
+              ("execution_result", ("execution_result",), None, True))
+
+    @property
+    def is_success(self) -> bool:
+        return "Success" in self.execution_result
+
+
+class DeployAccepted(EventData):
+    __slots__ = ("hash", "account", "timestamp", "ttl", "chain_name", "header", "payment", "session", "approvals")
+    SCHEMA = (("hash", ("hash",), None, True),
+              ("account", ("header", "account"), None, True),
+              ("timestamp", ("header", "timestamp"), None, True),
+              ("ttl", ("header", "ttl"), None, True),
+              ("chain_name", ("header", "chain_name"), None, False),
+              ("header", ("header",), None, True),
+              ("payment", ("payment",), None, False),
+              ("session", ("session",), None, False),
+              ("approvals", ("approvals",), None, False))
+
+
+class FinalitySignature(EventData):
+    __slots__ = ("block_hash", "era_id", "signature", "public_key")
+    SCHEMA = (("block_hash", ("block_hash",), None, True),
+              ("era_id", ("era_id",), int, True),
+              ("signature", ("signature",), None, True),
+              ("public_key", ("public_key",), None, True))
+
+
+class Step(EventData):
+    __slots__ = ("era_id", "execution_effect")
+    SCHEMA = (("era_id", ("era_id",), int, True),
+              ("execution_effect", ("execution_effect",), None, False))
+
+
+class Fault(EventData):
+    __slots__ = ("era_id", "public_key", "timestamp")
+    SCHEMA = (("era_id", ("era_id",), int, True),
+              ("public_key", ("public_key",), None, True),
+              ("timestamp", ("timestamp",), None, False))
+
+
+EVENT_TYPES = {cls.__name__: cls for cls in (BlockAdded, DeployProcessed, DeployAccepted, FinalitySignature, Step,
+                                               Fault)}
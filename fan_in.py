@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import metrics
+from event_stream_reader import EventStreamReader
+from message_structure import MessageData, CONTENT_KEY_TYPES
+
+# Seconds between checks for the consumer stopping, by node threads waiting on a full queue
+STOP_CHECK_SEC = 0.5
+
+
+def content_key(data: str, message: Optional[MessageData] = None) -> str:
+    """
+    Key of an event that is the same whichever node sent it, a digest of the data for types without one.
+    message is the MessageData of data, if already made.
+    """
+    if message is None:
+        message = MessageData(data, lazy=True)
+    if message.message_type in CONTENT_KEY_TYPES:
+        return message.primary_key
+    return "digest-" + hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
+class NodeStats:
+    __slots__ = ("received", "first", "duplicates", "total_lag_sec", "max_lag_sec")
+
+    def __init__(self):
+        self.received = 0
+        # Events this node delivered before any other node
+        self.first = 0
+        self.duplicates = 0
+        self.total_lag_sec = 0.0
+        self.max_lag_sec = 0.0
+
+    def as_dict(self) -> dict:
+        return {"received": self.received, "first": self.first, "duplicates": self.duplicates,
+                "avg_lag_sec": self.total_lag_sec / self.duplicates if self.duplicates else 0.0,
+                "max_lag_sec": self.max_lag_sec}
+
+
+class FanInReader:
+    """
+    Reads the same event stream from several nodes at once and yields each event the first time any node
+    delivers it, so one node restarting or falling behind does not delay or interrupt the stream.
+
+    Message ids are local to a node, so each reader keeps its own checkpoint and events are matched across
+    nodes by content_key, remembering the last dedupe_size keys.  Per node stats are kept by reader name: how
+    many events it delivered first, and for the others, how long after the first node it delivered them.
+
+    A node checkpoint moves past a message once it is queued here, so after a crash up to queue_size messages
+    per node may be skipped on that node.  They are normally still delivered by another node.
+    """
+
+    def __init__(self, readers: List[EventStreamReader], dedupe_size: int = 200000, queue_size: int = 1000):
+        self.readers = readers
+        self.dedupe_size = dedupe_size
+        self.queue_size = queue_size
+        # content_key -> time first delivered
+        self._seen = OrderedDict()
+        self.node_stats = {reader.name: NodeStats() for reader in readers}
+        self.emitted = 0
+
+    def _accept(self, node: str, msg) -> bool:
+        """ Records msg from node, returns True if no node delivered it before """
+        now = time.monotonic()
+        key = content_key(msg.data)
+        stats = self.node_stats[node]
+        stats.received += 1
+        first_seen = self._seen.get(key)
+        if first_seen is not None:
+            lag = now - first_seen
+            stats.duplicates += 1
+            stats.total_lag_sec += lag
+            stats.max_lag_sec = max(stats.max_lag_sec, lag)
+            if metrics.ENABLED:
+                metrics.FAN_IN_LAG.observe(lag, node)
+            return False
+        self._seen[key] = now
+        if len(self._seen) > self.dedupe_size:
+            self._seen.popitem(last=False)
+        stats.first += 1
+        self.emitted += 1
+        if metrics.ENABLED:
+            metrics.FAN_IN_FIRST.inc(node)
+        return True
+
+    def stats(self) -> dict:
+        return {"emitted": self.emitted, "nodes": {node: stats.as_dict() for node, stats in self.node_stats.items()}}
+
+    async def _read_node(self, reader: EventStreamReader, messages: asyncio.Queue):
+        async for msg in reader.async_messages():
+            await messages.put((reader.name, msg))
+
+    async def async_messages(self):
+        """
+        Yields each event once, reading all nodes on the running event loop, until all node streams end.
+        An exception reading a node is raised once the events already read are yielded.
+        """
+        messages = asyncio.Queue(maxsize=self.queue_size * len(self.readers))
+        tasks = [asyncio.create_task(self._read_node(reader, messages)) for reader in self.readers]
+        done = asyncio.gather(*tasks)
+        try:
+            while not (done.done() and messages.empty()):
+                getter = asyncio.ensure_future(messages.get())
+                await asyncio.wait((getter, done), return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+                node, msg = getter.result()
+                if self._accept(node, msg):
+                    yield msg
+            done.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    def _put(messages: queue.Queue, item: tuple, stop: threading.Event) -> bool:
+        """ Waits for room in messages, returns False if the consumer stopped first """
+        while not stop.is_set():
+            try:
+                messages.put(item, timeout=STOP_CHECK_SEC)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read_node_thread(self, reader: EventStreamReader, messages: queue.Queue, stop: threading.Event,
+                          errors: list):
+        try:
+            for msg in reader.messages():
+                if not self._put(messages, (reader.name, msg), stop):
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # Tells the consumer this node's stream has ended
+            self._put(messages, (reader.name, None), stop)
+
+    def messages(self):
+        """ Blocking version of async_messages(), reading each node on its own thread """
+        messages = queue.Queue(maxsize=self.queue_size * len(self.readers))
+        stop = threading.Event()
+        errors = []
+        for reader in self.readers:
+            threading.Thread(target=self._read_node_thread, args=(reader, messages, stop, errors),
+                             name=f"fan_in_{reader.name}", daemon=True).start()
+        running = len(self.readers)
+        try:
+            while running:
+                node, msg = messages.get()
+                if msg is None:
+                    running -= 1
+                elif self._accept(node, msg):
+                    yield msg
+            if errors:
+                raise errors[0]
+        finally:
+            stop.set()
@@ -1,190 +1,276 @@
 #!/usr/bin/env python3
-import time
-from typing import Union
-import json
-import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from itertools import chain
 import signal
+import threading
+import time
+from typing import Callable
 
-from event_stream_reader import EventStreamReader
+from event_stream_reader import EventStreamReader, multiplex_streams
 import config
+from fan_in import FanInReader
+from gap_fill import GapFiller, GapTracker
+import metrics
+from catalog import Catalog, catalog_for
+from directory_store import era_directory_name
+from event_store import get_event_store
 from message_structure import MessageData
-from generate_finality_signatures import generate_finality_signatures_for_block
-from node_rpc import get_deploy, get_block
+from sse_parser import SSEMessage
+from stream_checkpoint import StreamCheckpoint
+from write_behind import WriteBehindQueue, WriteFailed
+from finsig_backfill import FinsigBackfill
+from reconcile import Reconciler
+from rpc_cache import default_cache
+from seen_events import SeenEvents
 
 
-esr_main = EventStreamReader(config.SSE_SERVER_MAIN_URL)
-esr_deploys = EventStreamReader(config.SSE_SERVER_DEPLOYS_URL)
-esr_sigs = EventStreamReader(config.SSE_SERVER_SIGS_URL)
+def stream_checkpoint(name: str) -> StreamCheckpoint:
+    return StreamCheckpoint(config.CHECKPOINT_DIR / f"{name}.json")
 
 
-# Three message types:
-# DeployProcessed - Has no era_id, can store in block-hash folder and move into era_id folder when we get BlockAdded
-#   Final location: era_<era_id>/<block_hash>/deploy-<deploy_hash>
-# BlockAdded - Has era_id, can store in era_id folder
-#   Final location: era_<era_id>/block-<block_hash>
-# FinalitySignature = Has era_id, can store in era_id folder
-#   Final location: era_<era_id>/<block_hash>/finsig-<block_hash>-<public_key>
+def stream_reader(name: str, url: str):
+    """
+    Reader of a stream from config.SSE_SERVERS.  With more than one node, each event is yielded the first
+    time any node sends it, and each node keeps its own checkpoint as message ids differ between nodes.
+    Node urls are url with config.BASE_SERVER replaced, and the first node keeps the checkpoint of name.
 
+    With one node, the checkpoint only moves past events once write_queue has saved them.
+    """
+    if len(config.SSE_SERVERS) == 1:
+        return EventStreamReader(url, checkpoint=stream_checkpoint(name), name=name, checkpoint_when_saved=True)
+    return FanInReader([EventStreamReader(url.replace(config.BASE_SERVER, server),
+                                          checkpoint=stream_checkpoint(name if index == 0 else f"{name}_{server}"),
+                                          name=f"{name}@{server}")
+                        for index, server in enumerate(config.SSE_SERVERS)])
 
-def era_directory_name(era_id: Union[str, int]) -> str:
-    return f"era_{era_id}"
 
+def node_readers(reader) -> list:
+    return reader.readers if isinstance(reader, FanInReader) else [reader]
 
-def save_file_in_directory(directory: str, filename: str, contents: str, root_dir: Path = config.DATA_DIR):
-    """ Creates directory if needed and saves file to filename in directory """
-    target_dir = root_dir / directory
-    target_dir.mkdir(parents=True, exist_ok=True)
-    file_path = target_dir / filename
-    file_path.write_text(contents)
 
+# All streams are read on one event loop.  Add more streams or nodes here without adding threads.
+stream_readers = {name: stream_reader(name, url)
+                  for name, url in (("deploys", config.SSE_SERVER_DEPLOYS_URL),
+                                    ("main", config.SSE_SERVER_MAIN_URL),
+                                    ("sigs", config.SSE_SERVER_SIGS_URL))}
 
-def move_deploys_to_era(directory: str, era_id: str, root_dir: Path = config.DATA_DIR):
-    """ Moves all temp stored deploys into the proper era directory """
-    source_dir = root_dir / directory
-    target_dir = root_dir / era_directory_name(era_id) / directory
-    if source_dir.exists():
-        target_dir.mkdir(parents=True, exist_ok=True)
-        for src_file in source_dir.glob("deploy-*"):
-            src_file.rename(target_dir / src_file.name)
-        source_dir.rmdir()
+# Blocking disk work is run here so it does not stall reading of the streams.
+disk_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="file_store_disk")
+# Set on shutdown, so a running reconcile of old deploy-accepted files does not hold up the exit
+reconcile_stop = threading.Event()
 
+# Backend from config.STORE_BACKEND, "directory" keeps the era and block directory layout.  Created when main()
+# starts, so importing this module does not create the store or its catalog.
+store = None
 
-def move_deploy_accepted_to_era(block: MessageData, era_id: str, root_dir: Path = config.DATA_DIR):
-    """ Moves all deploy-accepted into the proper era and block directory """
-    target_dir = root_dir / era_directory_name(era_id) / block.block_hash
-    for td_hash in chain(block.get_deploy_hashes(), block.get_transfer_hashes()):
-        source_file = root_dir / 'deploy_accepted' / f'deploy-accepted-{td_hash}'
-        target_dir.mkdir(parents=True, exist_ok=True)
-        try:
-            source_file.rename(target_dir / source_file.name)
-        except FileNotFoundError:
-            continue
 
+def create_write_queue() -> WriteBehindQueue:
+    # asyncio.Queue must be created with the running loop in Python < 3.10
+    return WriteBehindQueue(store, disk_executor, config.WRITE_QUEUE_SIZE, config.WRITE_BATCH_SIZE,
+                            config.WRITE_FLUSH_INTERVAL_SEC, config.WRITE_BACKPRESSURE,
+                            on_saved=seen_events.add_saved if seen_events is not None else None)
 
-def save_files(stream_reader):
-    global stop_threads
-    for msg in stream_reader.messages():
-        if stop_threads:
-            return
-        if not msg:
-            continue
-        data = MessageData(msg.data)
-        era_id = data.era_id
-        if data.is_deploy_accepted:
-            directory = "deploy_accepted"
-        else:
-            # We don't have a block for deploys yet as they process before the era_id is known.
-            # Using a directory name in root data directory as block_hash
-            directory = era_directory_name(era_id) if not data.is_deploy_processed else data.block_hash
-
-        # We can go directly into a era/block_hash structure for finality_signatures
-        if data.is_finality_signature:
-            directory += f"/{data.block_hash}"
-        # Deploys are made into block-<block_hash> directory that needs to be moved once BlockAdded test is what era the
-        # Block was in.
-        save_file_in_directory(directory, data.primary_key, msg.data)
-        if data.is_block_added:
-            # When a block is added, we know what the block era is for deploys stored, so we can copy them over.
-            move_deploys_to_era(data.block_hash, era_id)
-            move_deploy_accepted_to_era(data, era_id)
-
-
-def get_era_directories(data_dir: Path = config.DATA_DIR):
-    """ return era directory Paths in order of era """
-    return sorted([era_dir for era_dir in data_dir.glob("era_*")], key=lambda d: int(str(d).split('era_')[-1]))
 
+write_queue = None
 
-def get_block_hashes_from_dir(era_dir: Path):
-    for block_file in era_dir.glob("block-*"):
-        yield block_file.name.split("block-")[-1]
+# Events already in store, which are skipped when read again.  Loaded from the store when main() starts.
+seen_events = None
 
+# Finds events lost from the streams, so they are fetched by RPC rather than re-crawling.  Message ids are only
+# checked for skips when reading one node, as a fan in reader yields ids of different nodes.
+gap_tracker = GapTracker() if config.GAP_FILL_ENABLED else None
+track_msg_ids = len(config.SSE_SERVERS) == 1
+GAP_FILL_STREAM = "gap_fill"
 
-def is_missing_finsig_files(hash_dir: Path) -> bool:
-    if not hash_dir.exists():
-        return True
-    return len(list(hash_dir.glob("finsig*"))) == 0
 
+def when_saved(saved):
+    if saved is not None:
+        write_queue.when_saved(saved)
 
-def recreate_finality_signatures(data_dir: Path = config.DATA_DIR):
-    for era_dir in get_era_directories(data_dir):
-        for hash in get_block_hashes_from_dir(era_dir):
-            finsig_path = era_dir / hash
-            if is_missing_finsig_files(finsig_path):
-                try:
-                    for finsig in generate_finality_signatures_for_block(hash):
-                        data = MessageData(json.dumps(finsig))
-                        save_file_in_directory(f"{era_dir.name}/{hash}", data.primary_key, finsig)
-                        print(finsig)
-                except Exception as e:
-                    print(e)
-
-
-def move_old_deploy_accepted(data_dir: Path = config.DATA_DIR):
-    source_dir = data_dir / "deploy_accepted"
-    if not source_dir.exists():
+
+async def save_files(msg, stream: str = "", saved: Callable[[], None] = None):
+    """
+    Async handler for a stream message, written to store in batches by write_queue.
+    saved, if given, is called once the message and all before it are stored, or skipped.
+    """
+    if not msg:
+        when_saved(saved)
         return
-    for src_file in source_dir.glob("deploy-accepted-*"):
-        deploy_hash = src_file.name.split('-')[-1]
-        deploy = get_deploy(deploy_hash)
-        results = deploy["execution_results"]
-        if results:
-            block_hash = results[0]["block_hash"]
-            block = get_block(block_hash=block_hash)
-            era_id = block["block"]["header"]["era_id"]
-            target_dir = data_dir / era_directory_name(era_id) / block_hash
-            target_dir.mkdir(parents=True, exist_ok=True)
-            try:
-                print(f"Moving: {src_file}")
-                src_file.rename(target_dir / src_file.name)
-            except FileNotFoundError:
-                continue
-        time.sleep(0.01)
-
-
-def thread_save(name, stream_reader):
-    print(f"Starting {name} store thread.")
-    global stop_threads
-    while not stop_threads:
+    if metrics.ENABLED:
+        data = _parse_with_metrics(msg, stream)
+    else:
+        # Only routing fields are needed, as msg.data is written out as is.
+        data = MessageData(msg.data, lazy=True)
+    if gap_tracker is not None:
+        gap_tracker.observe(data, stream, msg.id if track_msg_ids else None)
+    # BlockAdded is always saved, as storing it moves and writes the deploys waiting for the block
+    if seen_events is not None and not data.is_block_added and await seen_events.is_stored_async(data, disk_executor):
+        when_saved(saved)
+        return
+    await write_queue.put(data, msg.data, saved)
+
+
+def _parse_with_metrics(msg, stream: str) -> MessageData:
+    start = time.perf_counter()
+    data = MessageData(msg.data, lazy=True)
+    message_type = data.message_type
+    metrics.PARSE_SECONDS.observe(time.perf_counter() - start, message_type)
+    metrics.EVENTS.inc(stream, message_type)
+    if data.is_block_added:
+        # Only a metric, so a block without a usable timestamp is still stored
         try:
-            save_files(stream_reader)
-        except Exception as e:
-            print(f"file_store ({name}) exceptions: {e}")
-    print(f"Stopped {name} store thread.")
+            metrics.observe_block_lag(stream, data.event.timestamp)
+        except (AttributeError, TypeError, ValueError):
+            pass
+    return data
 
 
-def save_deploys():
-    thread_save("deploys", esr_deploys)
+def get_era_directories(data_dir: Path = config.DATA_DIR, catalog: Catalog = None):
+    """ return era directory Paths in order of era """
+    catalog = catalog or catalog_for(data_dir)
+    if catalog is None:
+        return sorted([era_dir for era_dir in data_dir.glob("era_*")], key=lambda d: int(str(d).split('era_')[-1]))
+    return [data_dir / era_directory_name(era_id) for era_id in catalog.eras()]
 
 
-def save_main():
-    thread_save("main", esr_main)
+def get_block_hashes_from_dir(era_dir: Path, catalog: Catalog = None):
+    catalog = catalog or catalog_for(era_dir.parent)
+    if catalog is None:
+        for block_file in era_dir.glob("block-*"):
+            yield block_file.name.split("block-")[-1]
+        return
+    yield from catalog.blocks_for_era(int(era_dir.name.split('era_')[-1]))
 
 
-def save_sigs():
-    thread_save("sigs", esr_sigs)
+def is_missing_finsig_files(hash_dir: Path, catalog: Catalog = None) -> bool:
+    # Block directories are in era directories of the data directory
+    catalog = catalog or catalog_for(hash_dir.parent.parent)
+    if catalog is None:
+        return not hash_dir.exists() or len(list(hash_dir.glob("finsig*"))) == 0
+    return catalog.finsig_count(hash_dir.name) == 0
 
 
-def exit_gracefully(self, *args):
-    print("Stopping threads...")
-    global stop_threads
-    stop_threads = True
-    global threads
-    for thread in threads:
-        thread.join()
+def recreate_finality_signatures(data_dir: Path = config.DATA_DIR):
+    """ Creates finality signature files from block proofs, for blocks stored without them """
+    FinsigBackfill(data_dir, catalog=catalog_for(data_dir)).run()
 
 
-stop_threads = False
-threads = [threading.Thread(target=save_deploys),
-           threading.Thread(target=save_main),
-           threading.Thread(target=save_sigs)]
-for thread in threads:
-    thread.start()
+def move_old_deploy_accepted(data_dir: Path = config.DATA_DIR, stop: threading.Event = None):
+    """ Moves deploy-accepted files of already executed deploys into their era and block directory """
+    Reconciler(data_dir, cache=default_cache(), catalog=catalog_for(data_dir), stop=stop).run()
 
-signal.signal(signal.SIGINT, exit_gracefully)
-signal.signal(signal.SIGTERM, exit_gracefully)
 
-# Move old deploy-accepted if re-pulled
-time.sleep(30)
-move_old_deploy_accepted()
+def stream_handler(name, reader):
+    """
+    Wraps save_files so an exception saving one message does not stop the stream, unless the store has
+    failed.  The checkpoint of reader moves past each message once it is saved.
+    """
+    async def handler(msg):
+        saved = None
+        if isinstance(reader, EventStreamReader) and reader.checkpoint_when_saved:
+            saved = reader.saved_callback()
+        try:
+            await save_files(msg, name, saved)
+        except WriteFailed:
+            raise
+        except Exception as e:
+            print(f"file_store ({name}) exceptions: {e}")
+            when_saved(saved)
+    return handler
+
+
+async def fill_gaps(interval_sec: float = config.GAP_FILL_INTERVAL_SEC, filler: GapFiller = None):
+    """
+    Every interval_sec, fetches events found missing by gap_tracker and saves them as if streamed.
+    Gaps that could not be filled are given back to gap_tracker, to be tried again at the next interval.
+    """
+    filler = filler or GapFiller()
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval_sec)
+        gaps = gap_tracker.take_gaps()
+        if not gaps:
+            continue
+        print(f"Filling gaps: {len(gaps.heights)} blocks, {len(gaps.unsigned_blocks)} unsigned blocks, "
+              f"{len(gaps.deploys)} deploys")
+        try:
+            events, unfilled = await loop.run_in_executor(None, filler.fill, gaps)
+        except Exception as e:
+            print(f"Gap fill failed: {e}")
+            gap_tracker.retry(gaps, gaps)
+            continue
+        for contents in events:
+            await save_files(SSEMessage(contents), GAP_FILL_STREAM)
+        if metrics.ENABLED:
+            metrics.GAP_FILLED.inc(amount=len(events))
+        if unfilled:
+            print(f"Could not fill: {len(unfilled.heights)} blocks, {len(unfilled.unsigned_blocks)} unsigned blocks, "
+                  f"{len(unfilled.deploys)} deploys")
+        gap_tracker.retry(gaps, unfilled)
+
+
+async def delayed_move_old_deploy_accepted(delay_sec: int = 30):
+    await asyncio.sleep(delay_sec)
+    await asyncio.get_running_loop().run_in_executor(disk_executor, move_old_deploy_accepted, config.DATA_DIR,
+                                                     reconcile_stop)
+
+
+async def load_seen_events() -> SeenEvents:
+    start = time.perf_counter()
+    seen = await asyncio.get_running_loop().run_in_executor(disk_executor, SeenEvents.from_store, store)
+    print(f"Loaded {len(seen)} stored event keys in {time.perf_counter() - start:.1f}s")
+    return seen
+
+
+async def main():
+    global store, write_queue, seen_events
+    loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, main_task.cancel)
+
+    store = get_event_store()
+    if config.SEEN_FILTER_ENABLED:
+        seen_events = await load_seen_events()
+
+    write_queue = create_write_queue()
+    if config.METRICS_ENABLED:
+        metrics.start_server()
+        metrics.WRITE_QUEUE_DEPTH.set_function(lambda: write_queue.depth)
+        print(f"Serving metrics at http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
+    flusher = asyncio.create_task(write_queue.run())
+    print(f"Starting store streams: {', '.join(stream_readers)}")
+    try:
+        streams = ((reader, stream_handler(name, reader)) for name, reader in stream_readers.items())
+        tasks = [multiplex_streams(streams),
+                 # Move old deploy-accepted if re-pulled
+                 delayed_move_old_deploy_accepted(),
+                 # Ends the streams if the store fails, so checkpoints stay at the last saved events
+                 asyncio.shield(flusher)]
+        if gap_tracker is not None:
+            tasks.append(fill_gaps())
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        print("Stopping streams...")
+    finally:
+        # Queued messages are written before checkpoints are saved, and checkpoints are saved before waiting on
+        # anything else, so a slow shutdown still resumes from the last saved events.
+        await write_queue.drain()
+        flusher.cancel()
+        for name, reader in stream_readers.items():
+            if isinstance(reader, FanInReader):
+                print(f"Fan in ({name}): {reader.stats()}")
+            for node_reader in node_readers(reader):
+                node_reader.checkpoint.flush()
+        print(f"Write queue: {write_queue.stats()}")
+        if seen_events is not None:
+            print(f"Skipped {seen_events.skipped} events already stored")
+        reconcile_stop.set()
+        disk_executor.shutdown(wait=True, cancel_futures=True)
+        store.close()
+    print("Stopped store streams.")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class EraValidators:
+    """ Validators of an era by index, with their weights and the weight needed to finalize a block """
+    __slots__ = ("index", "weights", "total_weight", "required_weight")
+
+    def __init__(self, weights: Dict[str, int], threshold: float):
+        self.index = {public_key: position for position, public_key in enumerate(weights)}
+        self.weights = list(weights.values())
+        self.total_weight = sum(self.weights)
+        self.required_weight = self.total_weight * threshold
+
+
+class BlockSignatures:
+    """ Which validators of the era signed a block, one byte per validator, and their total weight """
+    __slots__ = ("era_id", "signed", "weight")
+
+    def __init__(self, era_id: int, validator_count: int):
+        self.era_id = era_id
+        self.signed = bytearray(validator_count)
+        self.weight = 0
+
+
+class FinalityTracker:
+    """
+    Detects blocks finalized by finality signatures of more than threshold of the era's validator weight.
+
+    Validators are numbered per era, and each block waiting for finality holds a byte per validator of who
+    signed it, so a validator's weight is only counted once however often its signature is received.
+    Finalized blocks are dropped and only their hash is remembered, up to finalized_memory of them, so late
+    signatures don't announce them again.  Blocks of eras more than keep_eras behind the newest era are
+    dropped with the era.
+    """
+
+    def __init__(self, threshold: float = 0.67, keep_eras: int = 2, finalized_memory: int = 10000):
+        self.threshold = threshold
+        self.keep_eras = keep_eras
+        self.finalized_memory = finalized_memory
+        self._eras = {}
+        # block_hash -> BlockSignatures of blocks not yet finalized
+        self._blocks = {}
+        self._finalized = OrderedDict()
+        self.duplicates = 0
+        self.unknown_validators = 0
+
+    def has_era(self, era_id: int) -> bool:
+        return era_id in self._eras
+
+    def add_era(self, era_id: int, weights: Dict[str, int]):
+        """ Sets validator weights for era, dropping eras and their blocks more than keep_eras behind it """
+        self._eras[era_id] = EraValidators(weights, self.threshold)
+        delete_era = era_id - self.keep_eras
+        for old_era in [key for key in self._eras if key <= delete_era]:
+            print(f"Removing Era data for era_id: {old_era}")
+            del self._eras[old_era]
+        for block_hash in [key for key, block in self._blocks.items() if block.era_id not in self._eras]:
+            del self._blocks[block_hash]
+
+    def add_signature(self, era_id: int, block_hash: str, public_key: str) -> bool:
+        """
+        Records signature of block by validator in era_id, which must have been added.
+
+        Returns True only for the signature that finalizes the block.
+        """
+        if block_hash in self._finalized:
+            return False
+        era = self._eras[era_id]
+        position = era.index.get(public_key)
+        if position is None:
+            self.unknown_validators += 1
+            return False
+        block = self._blocks.get(block_hash)
+        if block is None:
+            block = self._blocks[block_hash] = BlockSignatures(era_id, len(era.weights))
+        if block.signed[position]:
+            self.duplicates += 1
+            return False
+        block.signed[position] = 1
+        block.weight += era.weights[position]
+        if block.weight <= era.required_weight:
+            return False
+        del self._blocks[block_hash]
+        self._finalized[block_hash] = era_id
+        if len(self._finalized) > self.finalized_memory:
+            self._finalized.popitem(last=False)
+        return True
+
+    def is_finalized(self, block_hash: str) -> bool:
+        """ True if block was finalized, among the last finalized_memory blocks """
+        return block_hash in self._finalized
+
+    def signed_weight(self, block_hash: str) -> Optional[int]:
+        """ Weight of validators that signed block, or None if it is not waiting for finality """
+        block = self._blocks.get(block_hash)
+        return None if block is None else block.weight
+
+    @property
+    def pending_blocks(self) -> int:
+        return len(self._blocks)
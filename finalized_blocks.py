@@ -1,12 +1,20 @@
-from sseclient import SSEClient
-import requests
-
-from time import sleep
-from collections import defaultdict
-import json
-
-# This script is a full stand-alone example of detecting when blocks have been finalized and are irreversible.
-# Required python3 packages: requests, sseclient
+import queue
+import threading
+import time
+from typing import List
+
+from era_weights import EraWeightsStore, SwitchBlockFinder
+from event_stream_reader import EventStreamReader
+from event_types import BlockAdded, FinalitySignature
+from fan_in import FanInReader
+from finality_tracker import FinalityTracker
+from message_structure import MessageData
+from node_rpc import RpcClient, RpcError
+from rpc_cache import default_cache
+from signature_verifier import SignatureVerifier
+
+# This script is an example of detecting when blocks have been finalized and are irreversible.
+# Required python3 packages: requests, aiohttp, cryptography
 #
 # A block is proposed and then validating nodes provide a finality signature as their indication
 # that the block is final.
@@ -26,140 +34,134 @@ import json
 
 BASE_SERVER = "3.14.161.135"
 RPC_SERVER_URL = f"http://{BASE_SERVER}:7777/rpc"
-SSE_SERVER_URL = f"http://{BASE_SERVER}:9999/events"
-
+# Signatures are taken from whichever of these nodes sends them first, so a node restarting does not delay finality
+SSE_SERVERS = [BASE_SERVER]
+# Wait before retrying RPC calls for validator weights of an era, after they failed
+ERA_RPC_RETRY_SEC = 30
+# Longest wait between counting verified signatures while no events arrive
+DRAIN_INTERVAL_SEC = 0.1
 
-RECONNECT_DELAY_SEC = 5
-RECONNECT_COUNT = 1500
+rpc_client = RpcClient(RPC_SERVER_URL, cache=default_cache())
 
 
 def event_stream_messages():
     """
-    Blocking method that continuously yields messages from the SSE server.
+    Blocking method that continuously yields messages from the SSE servers, each message once.
     """
-    reconnect_count = 0
-    while reconnect_count < RECONNECT_COUNT:
-        reconnect_count += 1
-        try:
-            # On restart we might crawl through a bunch, but this doesn't miss them if it is a server restart.
-            for message in SSEClient(f"{SSE_SERVER_URL}?start_from=0"):
-                # SSE may send empty messages.  We ignore those.
-                if message.id is not None:
-                    reconnect_count = 0
-                    yield message
-            print("Stream ended without error, retrying after delay.")
-        except Exception as e:
-            print(f"Error occurred: {e}")
-        sleep(RECONNECT_DELAY_SEC)
-    else:
-        print(f"Reconnect count: {RECONNECT_COUNT} exceeded. Exiting...")
+    # On restart we might crawl through a bunch, but this doesn't miss them if it is a server restart.
+    readers = [EventStreamReader(f"http://{server}:9999/events", start_from=0, name=server) for server in SSE_SERVERS]
+    yield from FanInReader(readers).messages()
 
 
 class EraData:
-    def __init__(self):
-        self._era_data = defaultdict(dict)
-        # This is the main data structure that could be represented by a database or other store
-        # {<era_id>:
-        #           "weights": {<validator_key>: <validator_weight>, ...},
-        #           "total_weight": <int total of all validator_weights>,
-        #           "block_signatures": {"block_hash": [<public_key of validator signature>, ...], ...}
-        # }
-
-    @staticmethod
-    def _get_block_data_from_rpc(block_hash=None) -> tuple:
-        """
-        Returns (height, era_id, parent_hash, era_end) from block queried by block_height.
-        If no block_height is given it will return the latest block.
-        """
-        if block_hash:
-            params = [{"Hash": block_hash}]
-        else:
-            params = []
-
-        payload = json.dumps({"jsonrpc": "2.0", "method": "chain_get_block", "params": params, "id": 1})
-        headers = {'content-type': "application/json", 'cache-control': "no-cache"}
-        try:
-            response = requests.request("POST", RPC_SERVER_URL, data=payload, headers=headers)
-            json_data = json.loads(response.text)
-            block_data = json_data["result"]
-            block_header = block_data["block"]["header"]
-            return block_header["height"], block_header["era_id"], block_header["parent_hash"], block_header["era_end"]
-        except Exception as e:
-            print(f"Error during RPC call: {e}")
+    def __init__(self, client: RpcClient = rpc_client, weights_store: EraWeightsStore = None):
+        self.rpc_client = client
+        self.weights_store = weights_store or EraWeightsStore()
+        # Validator weights by era and signatures of blocks waiting for finality, which could be represented
+        # by a database or other store.  Each validator's weight counts once per block, however many times
+        # its signature is received, such as when crawling again from start_from=0.
+        self.tracker = FinalityTracker()
+        # Signatures of eras whose weights could not be retrieved yet, by era, and when to retry the RPC calls
+        self.waiting = {}
+        self._rpc_retry_at = {}
 
     def _populate_validator_data_from_rpc(self, era_id: int, block_hash: str) -> None:
         """
         This loads initial validator weight information on startup as we have not received a switch block from the
         event stream yet.
 
-        This should be used sparingly as it is VERY slow compared to just parsing the event stream.
+        Weights saved by an earlier run are used without RPC calls.  Otherwise the switch block before era_id is
+        found by block height, which takes a handful of calls rather than one per block of the era.
         """
-        print(f"Retrieving validator info from RPC for era: {era_id}")
-        block_height, cur_era_id, parent_hash, era_end = self._get_block_data_from_rpc(block_hash)
-
-        # Walk the parent hashes back until we get switch block before era_id needed for validator info.
-        while cur_era_id == era_id:
-            block_height, cur_era_id, parent_hash, era_end = self._get_block_data_from_rpc(parent_hash)
-
-        self._add_era_data(era_id, era_end["next_era_validator_weights"])
-
-    def era_data(self, era_id: int, block_hash: str) -> dict:
+        weights = self.weights_store.get(era_id)
+        if weights is None:
+            print(f"Retrieving validator info from RPC for era: {era_id}")
+            finder = SwitchBlockFinder(self.rpc_client)
+            try:
+                weights = finder.era_weights(era_id, block_hash)
+            except RpcError as e:
+                self._rpc_retry_at[era_id] = time.monotonic() + ERA_RPC_RETRY_SEC
+                print(f"Error during RPC call: {e}, retrying in {ERA_RPC_RETRY_SEC}s")
+                return
+            print(f"Found validator info for era {era_id} in {finder.calls} RPC calls")
+            self.weights_store.put(era_id, weights)
+        self.tracker.add_era(era_id, weights)
+
+    def ensure_era_data(self, era_id: int, block_hash: str) -> bool:
         """
-        Returns data about that era.  If it does not exist, this is before we populated with
+        Makes sure validator weights of that era are known.  If not, this is before we populated with
         era_end from the switch block stream, so we retrieve with the RPC.
 
-        After the first switch block, this should not require RPC use.
+        After the first switch block, this should not require RPC use.  Returns False if weights are not known,
+        and does not call the RPC again until ERA_RPC_RETRY_SEC after a failure.
         """
-        if era_id not in self._era_data:
+        if not self.tracker.has_era(era_id) and time.monotonic() >= self._rpc_retry_at.get(era_id, 0):
             self._populate_validator_data_from_rpc(era_id, block_hash)
-        return self._era_data[era_id]
+        return self.tracker.has_era(era_id)
 
-    def _add_era_data(self, next_era_id: int, next_era_validator_weights: dict) -> None:
+    def process_finality_signature(self, fin_sig: FinalitySignature) -> bool:
         """
-        Creates expected self._era_data structures and validator weights for block finalization detection
-        """
-        weights = {data["validator"]: int(data["weight"]) for data in next_era_validator_weights}
-        self._era_data[next_era_id]["weights"] = weights
-        self._era_data[next_era_id]["total_weight"] = sum(weights.values())
-        self._era_data[next_era_id]["block_weight"] = defaultdict(int)
-
-        # We are pruning data to keep current and next as finalization signatures for the switch block
-        # will come in after the switch block is received.
-        delete_era = next_era_id - 2
-        for key in [key for key in self._era_data if key <= delete_era]:
-            print(f"Removing Era data for era_id: {key}")
-            del self._era_data[key]
-
-    def process_finality_signature(self, fin_sig: dict) -> bool:
+        Processes a finality signature from the event stream, which must have been verified by SignatureVerifier
+        as only verified weight counts toward finality.
+
+        Returns True only for the signature that finalizes the block.  If the weights of its era are not known,
+        the signature is kept for retry_waiting().
         """
-        Processes the finality signature received from the event stream.
+        if not self.ensure_era_data(fin_sig.era_id, fin_sig.block_hash):
+            self.waiting.setdefault(fin_sig.era_id, []).append(fin_sig)
+            return False
+        return self.tracker.add_signature(fin_sig.era_id, fin_sig.block_hash, fin_sig.public_key)
 
-        Returns True is block has been finalized after including this signature
+    def retry_waiting(self) -> List[FinalitySignature]:
+        """
+        Processes kept signatures of eras whose weights are now known or due for another RPC attempt.
+        Returns the signatures that finalize their blocks.
         """
-        era_id = fin_sig["era_id"]
-        block_hash = fin_sig["block_hash"]
-        ed = self.era_data(era_id, block_hash)
-        signature = fin_sig["signature"]
-        # TODO: Validate signature
-        validator_key = fin_sig["public_key"]
-        validator_weight = ed["weights"].get(validator_key, 0) 
-        ed["block_weight"][block_hash] += validator_weight
-        weight_ratio = ed["block_weight"][block_hash] / ed["total_weight"]
-        return weight_ratio > 0.67
-
-    def process_block(self, block: dict) -> None:
+        now = time.monotonic()
+        ready = [era_id for era_id in self.waiting
+                 if self.tracker.has_era(era_id) or now >= self._rpc_retry_at.get(era_id, 0)]
+        finalized = []
+        for era_id in ready:
+            for fin_sig in self.waiting.pop(era_id):
+                if self.process_finality_signature(fin_sig):
+                    finalized.append(fin_sig)
+        return finalized
+
+    def process_block(self, block: BlockAdded) -> None:
         """
         This will be called with each block received.  If the block has era_end data, this will be used to update
         next era_id's validator weight.
         """
-        block_hash = block["block_hash"]
-        era_id = block["block"]["header"]["era_id"]
-        print(f"Block received: {block_hash}, Era: {era_id}")
-        era_end = block["block"]["header"]["era_end"]
-        if era_end is not None:
-            next_era = era_id + 1
+        print(f"Block received: {block.block_hash}, Era: {block.era_id}")
+        if block.is_switch_block:
+            next_era = block.era_id + 1
             print(f"Adding validator data for Era {next_era}")
-            self._add_era_data(next_era, era_end["next_era_validator_weights"])
+            # Current and next era are kept, as finality signatures for the switch block
+            # will come in after the switch block is received.
+            self.tracker.add_era(next_era, block.next_era_validator_weights)
+            self.weights_store.put(next_era, block.next_era_validator_weights)
+
+
+def read_events(events: queue.Queue):
+    """
+    Puts each BlockAdded and FinalitySignature event from the SSE servers on events, run on its own thread.
+    The exception ending the stream, or None if it ends, is put last.
+    """
+    try:
+        for msg in event_stream_messages():
+            if not msg:
+                continue
+            data = MessageData(msg.data)
+            if data.is_finality_signature or data.is_block_added:
+                event = data.event
+                if event is None:
+                    print(f"Skipping {data.message_type} not matching its schema, id: {msg.id}")
+                else:
+                    events.put(event)
+    except Exception as e:
+        events.put(e)
+    else:
+        events.put(None)
 
 
 def stream_block_finalization():
@@ -167,24 +169,36 @@ def stream_block_finalization():
     Main method to announce block reception and finalization.
     """
     era_data = EraData()
-
-    # Store finalized_block used to announce so we only announce once
-    finalized_block_hash = ''
-    # Loop through all messages streamed out and process
-    for msg in event_stream_messages():
-        if not msg:
-            continue
-        json_data = json.loads(msg.data)
-        msg_type = next(iter(json_data.keys()))
-        data = json_data[msg_type]
-        if msg_type == "FinalitySignature":
-            block_hash = data["block_hash"]
-            if era_data.process_finality_signature(data) and finalized_block_hash != block_hash:
-                finalized_block_hash = block_hash
-                # This could be a call to your system marking a block finalized
-                print(f"Block finalized: {finalized_block_hash}")
-        elif msg_type == "BlockAdded":
-            era_data.process_block(data)
-
-
-stream_block_finalization()
+    # Signatures are verified in batches on other processes and counted as their batches complete
+    verifier = SignatureVerifier()
+    events = queue.Queue()
+    threading.Thread(target=read_events, args=(events,), daemon=True, name="event_stream").start()
+
+    try:
+        while True:
+            # Verified signatures are counted every DRAIN_INTERVAL_SEC, whether or not more events arrive
+            try:
+                event = events.get(timeout=DRAIN_INTERVAL_SEC)
+            except queue.Empty:
+                pass
+            else:
+                if event is None:
+                    break
+                if isinstance(event, Exception):
+                    raise event
+                if isinstance(event, FinalitySignature):
+                    verifier.add(event)
+                else:
+                    era_data.process_block(event)
+            for fin_sig in verifier.verified():
+                if era_data.process_finality_signature(fin_sig):
+                    # This could be a call to your system marking a block finalized
+                    print(f"Block finalized: {fin_sig.block_hash}")
+            for fin_sig in era_data.retry_waiting():
+                print(f"Block finalized: {fin_sig.block_hash}")
+    finally:
+        verifier.close()
+
+
+if __name__ == '__main__':
+    stream_block_finalization()
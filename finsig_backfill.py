@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, Tuple
+
+import config
+from catalog import Catalog, default_catalog
+from directory_store import DirectoryStore
+from generate_finality_signatures import finality_signatures_from_block
+from message_structure import MessageData
+from node_rpc import RpcClient, RpcError
+from rpc_cache import default_cache
+
+
+def blocks_missing_finsigs(data_dir: Path = config.DATA_DIR) -> List[Tuple[int, str]]:
+    """
+    Returns [(era_id, block_hash), ...] of blocks without finality signature files, in era order.
+    One scandir per era directory, and per existing block directory only until the first finsig file.
+    """
+    if not data_dir.exists():
+        return []
+    eras = sorted((int(entry.name.split('era_')[-1]), entry.path) for entry in os.scandir(data_dir)
+                  if entry.is_dir() and entry.name.startswith("era_"))
+    missing = []
+    for era_id, era_path in eras:
+        block_hashes = []
+        block_dirs = set()
+        for entry in os.scandir(era_path):
+            if entry.name.startswith("block-"):
+                block_hashes.append(entry.name[len("block-"):])
+            elif entry.is_dir():
+                block_dirs.add(entry.name)
+        for block_hash in sorted(block_hashes):
+            if block_hash not in block_dirs or not _has_finsig(os.path.join(era_path, block_hash)):
+                missing.append((era_id, block_hash))
+    return missing
+
+
+def _has_finsig(block_path: str) -> bool:
+    with os.scandir(block_path) as entries:
+        return any(entry.name.startswith("finsig") for entry in entries)
+
+
+class FinsigBackfill:
+    """
+    Recreates finality signature files from block proofs for blocks stored without them.
+
+    The blocks missing signatures are found from the catalog if given, else in one pass over the directories,
+    and saved as an index in state_dir, with completed blocks appended to a done file after each batch is
+    written.  A rerun after an interrupted run resumes from these files without scanning again, unless rescan is
+    requested.  They are removed once a run completes, so the next run scans for blocks stored since.  Blocks
+    are fetched with JSON-RPC batches of batch_size on up to workers threads and written with one
+    DirectoryStore.save_batch per batch.  Failed blocks are still missing signatures, so the next run retries them.
+    """
+
+    def __init__(self, data_dir: Path = config.DATA_DIR, state_dir: Path = config.CHECKPOINT_DIR,
+                 client: RpcClient = None, workers: int = config.BACKFILL_WORKERS,
+                 batch_size: int = config.BACKFILL_BATCH_SIZE, progress_interval_sec: float = 10,
+                 catalog: Catalog = None):
+        self.data_dir = Path(data_dir)
+        self.catalog = catalog
+        self.index_path = Path(state_dir) / "finsig_backfill.index"
+        self.done_path = Path(state_dir) / "finsig_backfill.done"
+        self.client = client or RpcClient(pool_size=workers, cache=default_cache())
+        self.workers = workers
+        self.batch_size = batch_size
+        self.progress_interval_sec = progress_interval_sec
+        # Only finality signatures are written, which never wait for a block
+        self.store = DirectoryStore(self.data_dir, catalog=catalog, journal=False)
+        self.blocks_done = 0
+        self.blocks_failed = 0
+        self.finsigs_written = 0
+
+    def _load_todo(self, rescan: bool) -> List[Tuple[int, str]]:
+        if rescan or not self.index_path.exists():
+            start = time.perf_counter()
+            if self.catalog is not None:
+                missing = self.catalog.blocks_missing_finsigs()
+            else:
+                missing = blocks_missing_finsigs(self.data_dir)
+            print(f"Indexed {len(missing)} blocks missing finality signatures in {time.perf_counter() - start:.1f}s")
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.index_path.with_suffix(".tmp")
+            tmp_path.write_text("".join(f"{era_id} {block_hash}\n" for era_id, block_hash in missing))
+            os.replace(tmp_path, self.index_path)
+            self.done_path.write_text("")
+            return missing
+        missing = [(int(era_id), block_hash) for era_id, block_hash in
+                   (line.split() for line in self.index_path.read_text().splitlines() if line)]
+        done = set(self.done_path.read_text().split()) if self.done_path.exists() else set()
+        return [(era_id, block_hash) for era_id, block_hash in missing if block_hash not in done]
+
+    def _save_batch(self, block_hashes: List[str], results: list):
+        messages = []
+        done = []
+        for block_hash, result in zip(block_hashes, results):
+            try:
+                if isinstance(result, RpcError):
+                    raise result
+                finsigs = finality_signatures_from_block(block_hash, result)
+            except (RpcError, AssertionError, KeyError) as e:
+                print(f"Failed block {block_hash}: {e!r}")
+                self.blocks_failed += 1
+                continue
+            for finsig in finsigs:
+                contents = json.dumps(finsig)
+                messages.append((MessageData(contents), contents))
+            done.append(block_hash)
+        self.store.save_batch(messages)
+        with open(self.done_path, "a") as f:
+            f.write("".join(f"{block_hash}\n" for block_hash in done))
+        self.blocks_done += len(done)
+        self.finsigs_written += len(messages)
+
+    def _report(self, total: int, start: float):
+        finished = self.blocks_done + self.blocks_failed
+        elapsed = time.perf_counter() - start
+        rate = finished / elapsed if elapsed else 0.0
+        eta = (total - finished) / rate if rate else 0.0
+        print(f"Backfilled {finished}/{total} blocks ({rate:.1f} blocks/sec, ETA {eta:.0f}s): "
+              f"{self.finsigs_written} finality signatures, {self.blocks_failed} failed")
+
+    def run(self, rescan: bool = False) -> dict:
+        todo = self._load_todo(rescan)
+        block_hashes = [block_hash for _, block_hash in todo]
+        batches = [block_hashes[start:start + self.batch_size]
+                   for start in range(0, len(block_hashes), self.batch_size)]
+        start = last_report = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="finsig_backfill") as executor:
+            futures = {executor.submit(self.client.get_blocks, batch, proofs=True): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    results = future.result()
+                except Exception as e:
+                    results = [RpcError(str(e))] * len(batch)
+                self._save_batch(batch, results)
+                if time.perf_counter() - last_report >= self.progress_interval_sec:
+                    last_report = time.perf_counter()
+                    self._report(len(todo), start)
+        self.index_path.unlink(missing_ok=True)
+        self.done_path.unlink(missing_ok=True)
+        self._report(len(todo), start)
+        return {"blocks": len(todo), "done": self.blocks_done, "failed": self.blocks_failed,
+                "finsigs": self.finsigs_written}
+
+
+if __name__ == '__main__':
+    FinsigBackfill(catalog=default_catalog()).run(rescan="--rescan" in sys.argv)
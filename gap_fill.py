@@ -0,0 +1,237 @@
+import functools
+import json
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+import config
+import metrics
+from generate_finality_signatures import finality_signatures_from_block
+from message_structure import MessageData
+from node_rpc import RpcClient, RpcError
+from rpc_cache import default_cache
+
+
+class Gaps(NamedTuple):
+    # Block heights never received
+    heights: List[int]
+    # Hashes of blocks received without any finality signature
+    unsigned_blocks: List[str]
+    # Hashes of deploys in received blocks without a DeployProcessed event
+    deploys: List[str]
+
+    def __bool__(self):
+        return bool(self.heights or self.unsigned_blocks or self.deploys)
+
+
+class RecentSet:
+    """ Set of the last maxlen keys added """
+
+    def __init__(self, maxlen: int):
+        self.maxlen = maxlen
+        self._keys = OrderedDict()
+
+    def add(self, key):
+        self._keys[key] = None
+        if len(self._keys) > self.maxlen:
+            self._keys.popitem(last=False)
+
+    def __contains__(self, key) -> bool:
+        return key in self._keys
+
+
+class GapTracker:
+    """
+    Watches events as they are read for signs that some were lost, so only those need fetching by RPC rather
+    than crawling the whole stream again.
+
+    Skipped message ids on a stream are counted, but do not say which events were lost.  Lost BlockAdded events
+    show as heights missing between blocks.  Once settle_blocks later blocks have been added, a block is
+    checked for at least one FinalitySignature and a DeployProcessed for each of its deploys and transfers,
+    which may arrive on other streams before or after the block.  Gaps found are returned by take_gaps().
+
+    Gaps that could not be filled are given back by retry(), and taken again up to max_attempts times.
+    """
+
+    def __init__(self, settle_blocks: int = config.GAP_SETTLE_BLOCKS, max_recent: int = config.GAP_RECENT_EVENTS,
+                 max_attempts: int = config.GAP_FILL_ATTEMPTS):
+        self.settle_blocks = settle_blocks
+        self.max_attempts = max_attempts
+        self.last_msg_ids: Dict[str, int] = {}
+        self.skipped_ids = 0
+        self.max_height = None
+        self._missing_heights = set()
+        # (height, block_hash, deploy and transfer hashes) of blocks not yet checked
+        self._settling = deque()
+        self._signed_blocks = RecentSet(max_recent)
+        self._processed_deploys = RecentSet(max_recent)
+        self._unsigned_blocks = []
+        self._missing_deploys = []
+        # ("height" | "block" | "deploy", height or hash) -> fills tried, of gaps given back by retry()
+        self._attempts: Dict[tuple, int] = {}
+        self.given_up = 0
+
+    def observe(self, data: MessageData, stream: str = "", msg_id=None):
+        """ Tracks an event, with msg_id checked for skips if given """
+        if msg_id is not None:
+            self._check_id(stream, int(msg_id))
+        if data.is_finality_signature:
+            self._signed_blocks.add(data.block_hash)
+        elif data.is_deploy_processed:
+            self._processed_deploys.add(data.deploy_hash)
+        elif data.is_block_added:
+            block = data.event
+            if block is not None:
+                self.block_added(block.height, block.block_hash, block.deploy_hashes + block.transfer_hashes)
+
+    def _check_id(self, stream: str, msg_id: int):
+        last_msg_id = self.last_msg_ids.get(stream)
+        # Lower ids are a restart of the node or reader, which is not a gap
+        if last_msg_id is not None and msg_id > last_msg_id + 1:
+            skipped = msg_id - last_msg_id - 1
+            self.skipped_ids += skipped
+            logging.warning(f"Stream {stream} skipped {skipped} ids after {last_msg_id}")
+            if metrics.ENABLED:
+                metrics.GAPS.inc("id", amount=skipped)
+        self.last_msg_ids[stream] = msg_id
+
+    def block_added(self, height: int, block_hash: str, deploy_hashes: Iterable[str]):
+        if self.max_height is None or height > self.max_height:
+            if self.max_height is not None and height > self.max_height + 1:
+                self._add_missing_heights(range(self.max_height + 1, height))
+            self.max_height = height
+        else:
+            self._missing_heights.discard(height)
+        self._settling.append((height, block_hash, tuple(deploy_hashes)))
+        while self._settling and self._settling[0][0] <= self.max_height - self.settle_blocks:
+            self._settle(*self._settling.popleft())
+
+    def _add_missing_heights(self, heights: range):
+        self._missing_heights.update(heights)
+        if metrics.ENABLED:
+            metrics.GAPS.inc("height", amount=len(heights))
+
+    def _settle(self, height: int, block_hash: str, deploy_hashes: tuple):
+        if block_hash not in self._signed_blocks:
+            self._unsigned_blocks.append(block_hash)
+            if metrics.ENABLED:
+                metrics.GAPS.inc("signatures")
+        missing = [deploy_hash for deploy_hash in deploy_hashes if deploy_hash not in self._processed_deploys]
+        self._missing_deploys.extend(missing)
+        if metrics.ENABLED and missing:
+            metrics.GAPS.inc("deploy", amount=len(missing))
+
+    def take_gaps(self) -> Gaps:
+        """ Gaps found since the last call """
+        gaps = Gaps(sorted(self._missing_heights), self._unsigned_blocks, self._missing_deploys)
+        self._missing_heights = set()
+        self._unsigned_blocks = []
+        self._missing_deploys = []
+        return gaps
+
+    def retry(self, taken: Gaps, unfilled: Gaps):
+        """ Gives back unfilled gaps from a fill of taken, unless tried max_attempts times """
+        kinds = (("height", self._missing_heights.add), ("block", self._unsigned_blocks.append),
+                 ("deploy", self._missing_deploys.append))
+        for (kind, add), taken_keys, unfilled_keys in zip(kinds, taken, unfilled):
+            # Filled, so no longer tracked
+            for key in set(taken_keys).difference(unfilled_keys):
+                self._attempts.pop((kind, key), None)
+            for key in unfilled_keys:
+                attempts = self._attempts.get((kind, key), 0) + 1
+                if attempts < self.max_attempts:
+                    self._attempts[(kind, key)] = attempts
+                    add(key)
+                else:
+                    logging.warning(f"Giving up filling {kind} {key} after {attempts} attempts")
+                    self.given_up += 1
+
+
+def block_added_event(block: dict) -> dict:
+    """ BlockAdded event of a chain_get_block block, without its proofs """
+    return {"BlockAdded": {"block_hash": block["hash"],
+                           "block": {"hash": block["hash"], "header": block["header"], "body": block["body"]}}}
+
+
+def deploy_processed_events(result: dict) -> List[dict]:
+    """ DeployProcessed event of an info_get_deploy result for each block that executed it """
+    deploy = result["deploy"]
+    header = deploy["header"]
+    return [{"DeployProcessed": {"deploy_hash": deploy["hash"], "account": header["account"],
+                                 "timestamp": header["timestamp"], "ttl": header["ttl"],
+                                 "dependencies": header["dependencies"], "block_hash": execution["block_hash"],
+                                 "execution_result": execution["result"]}}
+            for execution in result["execution_results"]]
+
+
+class GapFiller:
+    """
+    Fetches the events of Gaps by RPC, as the JSON strings the node would have sent.
+
+    Missing blocks are fetched by height and bring their proofs as FinalitySignature events and their deploys
+    and transfers as DeployProcessed events.  Calls are sent as JSON-RPC batches of batch_size, with up to
+    workers batches at a time.
+    """
+
+    def __init__(self, client: RpcClient = None, workers: int = config.GAP_FILL_WORKERS,
+                 batch_size: int = config.BACKFILL_BATCH_SIZE):
+        self.client = client or RpcClient(pool_size=workers, cache=default_cache())
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def _batches(self, items: list) -> List[list]:
+        return [items[start:start + self.batch_size] for start in range(0, len(items), self.batch_size)]
+
+    def _fetch(self, fetch, items: list) -> list:
+        """ fetch(batch) of items on up to workers threads, results in order of items """
+        batches = self._batches(items)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="gap_fill") as executor:
+            futures = [executor.submit(fetch, batch) for batch in batches]
+        results = []
+        for batch, future in zip(batches, futures):
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                results.extend([RpcError(str(e))] * len(batch))
+        return results
+
+    def fill(self, gaps: Gaps) -> Tuple[List[str], Gaps]:
+        """ Returns events filling gaps, and the gaps that could not be filled """
+        events = []
+        unfilled = Gaps([], [], [])
+        deploy_hashes = list(gaps.deploys)
+        block_results = []
+        for height, result in zip(gaps.heights, self._fetch(self.client.get_blocks_at_heights, gaps.heights)):
+            if isinstance(result, RpcError) or not result.get("block"):
+                unfilled.heights.append(height)
+                continue
+            block = result["block"]
+            block_results.append((block["hash"], result))
+            events.append(json.dumps(block_added_event(block)))
+            deploy_hashes.extend(block["body"]["deploy_hashes"] + block["body"]["transfer_hashes"])
+        unsigned = list(gaps.unsigned_blocks)
+        # Proofs are added after the block, so are fetched from the node rather than the cache
+        fetched = self._fetch(functools.partial(self.client.get_blocks, proofs=True), unsigned)
+        for block_hash, result in zip(unsigned, fetched):
+            if isinstance(result, RpcError):
+                unfilled.unsigned_blocks.append(block_hash)
+                continue
+            block_results.append((block_hash, result))
+        for block_hash, result in block_results:
+            try:
+                finsigs = finality_signatures_from_block(block_hash, result)
+            except (AssertionError, KeyError):
+                finsigs = []
+            if not finsigs:
+                # No signatures yet, so still a gap
+                unfilled.unsigned_blocks.append(block_hash)
+            for finsig in finsigs:
+                events.append(json.dumps(finsig))
+        for deploy_hash, result in zip(deploy_hashes, self._fetch(self.client.get_deploys, deploy_hashes)):
+            if isinstance(result, RpcError) or not result.get("execution_results"):
+                unfilled.deploys.append(deploy_hash)
+                continue
+            for event in deploy_processed_events(result):
+                events.append(json.dumps(event))
+        return events, unfilled
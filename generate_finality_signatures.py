@@ -1,17 +1,14 @@
-import config
-from jsonrpcclient import request
+from node_rpc import RpcClient, client_for
 
 
-def get_block(block_hash: str) -> str:
-    result = request(config.RPC_SERVER_URL,
-                     "chain_get_block",
-                     {"Hash": block_hash})
-    return result.data.result
+def generate_finality_signatures_for_block(block_hash, client: RpcClient = None):
+    """ returns array of FinalitySignature event messages for a block """
+    client = client or client_for()
+    return finality_signatures_from_block(block_hash, client.get_block(block_hash=block_hash, proofs=True))
 
 
-def generate_finality_signatures_for_block(block_hash):
-    """ returns array of FinalitySignature event messages for a block """
-    result = get_block(block_hash)
+def finality_signatures_from_block(block_hash, result):
+    """ returns array of FinalitySignature event messages from chain_get_block result """
     block = result["block"]
     era_id = int(block["header"]["era_id"])
     hash = block["hash"]
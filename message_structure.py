@@ -1,5 +1,10 @@
 import json
 import datetime
+import functools
+import re
+from typing import Optional
+
+from event_types import EVENT_TYPES, EventData
 
 
 API_VERSION = "ApiVersion"
@@ -9,6 +14,9 @@ BLOCK_ADDED = "BlockAdded"
 FINALITY_SIGNATURE = "FinalitySignature"
 STEP = "Step"
 FAULT = "Fault"
+# Types with a primary_key built only from event content, so the same event always has the same key.  Others,
+# such as Fault, have the time received in their primary_key.
+CONTENT_KEY_TYPES = (BLOCK_ADDED, DEPLOY_ACCEPTED, DEPLOY_PROCESSED, FINALITY_SIGNATURE, STEP)
 
 
 class NestedDict(dict):
@@ -32,37 +40,147 @@ class NestedDict(dict):
         return d
 
 
+# Root key of message, such as {"BlockAdded":
+ROOT_KEY_RE = re.compile(r'\s*\{\s*"(\w+)"\s*:\s*')
+FIELD_VALUE_RE = r'"{}"\s*:\s*(?:"([^"\\]*)"|(-?\d+)|null)'
+# Block body hash lists, as hex strings they cannot contain "]"
+HASH_LIST_RE = r'"{}"\s*:\s*\[([^\]]*)\]'
+QUOTED_RE = re.compile(r'"([^"]*)"')
+
+# Routing fields read by lazy MessageData without parsing the message.
+# Top level fields are only searched for before the first nested object in the message, so a field of the
+# same name deep inside execution_result can never match.  Top level arrays before that, such as dependencies,
+# only hold hash strings.  Nested fields use the first match in the whole message.
+# None values are fields that do not exist in that message type.
+LAZY_FIELDS = {
+    DEPLOY_PROCESSED: {"top": ("deploy_hash", "block_hash"), "nested": (), "none": ("era_id",)},
+    DEPLOY_ACCEPTED: {"top": ("hash",), "nested": (), "none": ("era_id", "block_hash")},
+    # era_id is in block header, after era_end which only holds validator keyed maps.
+    BLOCK_ADDED: {"top": ("block_hash",), "nested": ("era_id",), "none": ()},
+    FINALITY_SIGNATURE: {"top": ("block_hash", "era_id", "public_key"), "nested": (), "none": ()},
+    STEP: {"top": ("era_id",), "nested": (), "none": ("block_hash",)},
+    FAULT: {"top": ("era_id",), "nested": (), "none": ("block_hash",)},
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _field_re(name: str):
+    return re.compile(FIELD_VALUE_RE.format(name))
+
+
+def _find_field(json_str: str, name: str, start: int, end: int):
+    """ Returns (found, value) of first "name": <string, int or null> in json_str[start:end] """
+    match = _field_re(name).search(json_str, start, end)
+    if match is None:
+        return False, None
+    text, number = match.groups()
+    if text is not None:
+        return True, text
+    if number is not None:
+        return True, int(number)
+    return True, None
+
+
 class MessageData:
 
-    def __init__(self, json_str: str):
+    def __init__(self, json_str: str, lazy: bool = False):
+        """
+        With lazy, only the message type and routing fields (era_id, block_hash and those used for primary_key)
+        are found by targeted search of json_str.  The full json parse only happens when .data is read.
+        Falls back to eager parsing if the message is not in a form the search understands.
+        """
         self.full_msg = json_str
-        json_data = json.loads(json_str)
+        self._data = None
+        # Parsed message data before wrapping in NestedDict, kept when only .event needed it
+        self._raw = None
+        self._fields = None
+        if lazy and self._find_lazy_fields():
+            return
+        self._parse()
+
+    def _parse(self):
+        self._data = NestedDict(self._raw_data())
+
+    def _raw_data(self) -> dict:
+        """ Message data from json.loads, without NestedDict """
+        if self._raw is not None:
+            return self._raw
+        json_data = json.loads(self.full_msg)
         if len(json_data.keys()) > 1:
             raise ValueError("Expected message data to have only one root dict key")
         self.message_type = next(iter(json_data.keys()))
         # ApiVersion is a scalar so using whole data
         if self.message_type == API_VERSION:
-            self.data = NestedDict(json_data)
+            self._raw = json_data
         else:
-            self.data = NestedDict(json_data[self.message_type])
+            self._raw = json_data[self.message_type]
+        return self._raw
+
+    def _find_lazy_fields(self) -> bool:
+        json_str = self.full_msg
+        root = ROOT_KEY_RE.match(json_str)
+        if root is None or root.group(1) not in LAZY_FIELDS or json_str[root.end():root.end() + 1] != "{":
+            return False
+        self.message_type = root.group(1)
+        spec = LAZY_FIELDS[self.message_type]
+        body_start = root.end() + 1
+        top_level_end = json_str.find("{", body_start)
+        if top_level_end == -1:
+            top_level_end = len(json_str)
+        fields = {name: None for name in spec["none"]}
+        for names, end in ((spec["top"], top_level_end), (spec["nested"], len(json_str))):
+            for name in names:
+                found, value = _find_field(json_str, name, body_start, end)
+                if not found:
+                    return False
+                fields[name] = value
+        self._fields = fields
+        return True
+
+    @property
+    def data(self) -> NestedDict:
+        if self._data is None:
+            self._parse()
+        return self._data
+
+    @functools.cached_property
+    def event(self) -> Optional[EventData]:
+        """
+        Typed event data (BlockAdded, FinalitySignature, ...) with direct attribute access.
+        None for message types without an event class or data not matching its schema, use .data for those.
+        Built from the parsed json, so a lazy message never builds its NestedDict for this.
+        """
+        event_type = EVENT_TYPES.get(self.message_type)
+        if event_type is None:
+            return None
+        try:
+            return event_type.from_data(self._data if self._data is not None else self._raw_data())
+        except ValueError:
+            return None
+
+    def _field(self, name: str):
+        """ Routing field from lazy search if available, else from parsed data """
+        if self._fields is not None and name in self._fields:
+            return self._fields[name]
+        return self.data[name]
 
     def _fin_sig_pk(self):
-        return f"finsig-{self.block_hash}-{self.data['public_key']}"
+        return f"finsig-{self.block_hash}-{self._field('public_key')}"
 
     def _block_pk(self):
         return f"block-{self.block_hash}"
 
     def _deploy_pk(self):
-        return f"deploy-{self.data['deploy_hash']}"
+        return f"deploy-{self._field('deploy_hash')}"
 
     def _deploy_accepted_pk(self):
-        return f"deploy-accepted-{self.data['hash']}"
+        return f"deploy-accepted-{self._field('hash')}"
 
     def _api_pk(self):
         return f"api-{self.data[API_VERSION].replace('.', '_')}"
 
     def _step_pk(self):
-        return f"step-{self.data['era_id']}"
+        return f"step-{self.era_id}"
 
     @staticmethod
     def _unique_timestamp():
@@ -118,11 +236,27 @@ class MessageData:
 
     @property
     def block_hash(self):
-        return self.data["block_hash"]
+        return self._field("block_hash")
+
+    @property
+    def deploy_hash(self):
+        if self.is_deploy_accepted:
+            return self._field("hash")
+        if self.is_deploy_processed:
+            return self._field("deploy_hash")
+        return None
+
+    @property
+    def public_key(self):
+        if self.is_finality_signature:
+            return self._field("public_key")
+        return None
 
     @property
     def era_id(self):
         # Does not exist for DeployProcessed so will be None
+        if self._fields is not None and "era_id" in self._fields:
+            return self._fields["era_id"]
 
         # Finality Signature location
         era_id = self.data["era_id"]
@@ -131,14 +265,21 @@ class MessageData:
             return self.data["block", "header", "era_id"]
         return era_id
 
+    def _block_hash_list(self, name: str):
+        if self._data is None:
+            match = re.search(HASH_LIST_RE.format(name), self.full_msg)
+            if match is not None:
+                return QUOTED_RE.findall(match.group(1))
+        return self.data["block", "body", name]
+
     def get_deploy_hashes(self):
         if not self.is_block_added:
             return
-        for deploy_hash in self.data["block", "body", "deploy_hashes"]:
+        for deploy_hash in self._block_hash_list("deploy_hashes"):
             yield deploy_hash
 
     def get_transfer_hashes(self):
         if not self.is_block_added:
             return
-        for transfer_hash in self.data["block", "body", "transfer_hashes"]:
+        for transfer_hash in self._block_hash_list("transfer_hashes"):
             yield transfer_hash
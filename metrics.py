@@ -0,0 +1,224 @@
+import datetime
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional, Tuple
+
+import config
+
+# Metrics of the ingest pipeline, served in Prometheus text format on localhost.
+#
+# Hooks on the per-event path check ENABLED first, so when metrics are off they cost one attribute lookup:
+#
+#     if metrics.ENABLED:
+#         metrics.EVENTS.inc(stream, message_type)
+#
+# enable() or start_server() turns them on.
+
+ENABLED = False
+PREFIX = "casper_events_"
+
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+LAG_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 300, 900, 3600)
+
+
+def _label_text(label_names: Tuple[str, ...], labels: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(label_names, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    TYPE = ""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = PREFIX + name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _samples(self):
+        """ Yields (suffix, label text, value) """
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield "", _label_text(self.label_names, labels), value
+
+    def expose(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.TYPE}"]
+        lines.extend(f"{self.name}{suffix}{labels} {value}" for suffix, labels, value in self._samples())
+        return "\n".join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+
+class Gauge(Metric):
+    """ Gauge set directly, or read from a function when scraped """
+    TYPE = "gauge"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, label_names)
+        self._functions = {}
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def set_function(self, func: Callable[[], float], *labels):
+        with self._lock:
+            self._functions[labels] = func
+
+    def value(self, *labels) -> Optional[float]:
+        func = self._functions.get(labels)
+        return func() if func is not None else self._values.get(labels)
+
+    def _samples(self):
+        yield from super()._samples()
+        with self._lock:
+            functions = list(self._functions.items())
+        for labels, func in functions:
+            yield "", _label_text(self.label_names, labels), func()
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self._functions.clear()
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Count per bucket, not cumulative, with the last for values over all buckets, then sum
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    def count(self, *labels) -> int:
+        state = self._values.get(labels)
+        return sum(state[0]) if state else 0
+
+    def _samples(self):
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield "_bucket", _label_text(self.label_names, labels, f'le="{bound}"'), cumulative
+            yield "_sum", _label_text(self.label_names, labels), total
+            yield "_count", _label_text(self.label_names, labels), cumulative
+
+
+EVENTS = Counter("events_total", "Events received by stream and message type", ("stream", "type"))
+LAST_MSG_ID = Gauge("last_msg_id", "Id of the last message received", ("stream",))
+RECONNECTS = Counter("reconnects_total", "Reconnects after an error or end of stream", ("stream",))
+DISCONNECTED = Counter("disconnected_seconds_total", "Time spent disconnected", ("stream",))
+PARSE_SECONDS = Histogram("parse_seconds", "MessageData routing parse time", ("type",))
+WRITE_SECONDS = Histogram("write_seconds", "Store batch write latency", ("store",))
+WRITE_BATCH = Counter("written_total", "Events written to store", ("store",))
+WRITE_QUEUE_DEPTH = Gauge("write_queue_depth", "Events waiting in the write behind queue")
+WRITE_DROPPED = Counter("write_dropped_total", "Events dropped by write behind backpressure")
+RPC_SECONDS = Histogram("rpc_seconds", "Node RPC latency per POST", ("method",))
+RPC_ERRORS = Counter("rpc_errors_total", "Failed node RPC attempts", ("method",))
+BLOCK_LAG = Histogram("block_lag_seconds", "Time from block header timestamp to arrival", ("stream",),
+                      LAG_BUCKETS)
+FAN_IN_FIRST = Counter("fan_in_first_total", "Events a node delivered before any other node", ("node",))
+FAN_IN_LAG = Histogram("fan_in_lag_seconds", "Time a node delivered an event after the first node", ("node",))
+HUB_CLIENTS = Gauge("hub_clients", "Clients connected to the SSE hub", ("stream",))
+HUB_DROPPED = Counter("hub_dropped_total", "SSE hub clients dropped for not taking data", ("stream",))
+GAPS = Counter("gaps_total", "Stream ids, block heights, block signatures and deploys found missing", ("kind",))
+GAP_FILLED = Counter("gap_filled_total", "Events fetched by RPC to fill gaps in the streams")
+SEEN_SKIPPED = Counter("seen_skipped_total", "Events skipped as already stored", ("type",))
+
+METRICS = (EVENTS, LAST_MSG_ID, RECONNECTS, DISCONNECTED, PARSE_SECONDS, WRITE_SECONDS, WRITE_BATCH,
+           WRITE_QUEUE_DEPTH, WRITE_DROPPED, RPC_SECONDS, RPC_ERRORS, BLOCK_LAG, FAN_IN_FIRST, FAN_IN_LAG,
+           HUB_CLIENTS, HUB_DROPPED, GAPS, GAP_FILLED, SEEN_SKIPPED)
+
+
+def expose() -> str:
+    """ All metrics in Prometheus text format """
+    return "\n".join(metric.expose() for metric in METRICS) + "\n"
+
+
+def reset():
+    for metric in METRICS:
+        metric.clear()
+
+
+def enable(enabled: bool = True):
+    global ENABLED
+    ENABLED = enabled
+
+
+def observe_block_lag(stream: str, block_timestamp: str):
+    """ Observes BLOCK_LAG from a header timestamp such as "2021-03-22T13:11:41.312Z", or without millis, to now """
+    time_format = "%Y-%m-%dT%H:%M:%S.%fZ" if "." in block_timestamp else "%Y-%m-%dT%H:%M:%SZ"
+    produced = datetime.datetime.strptime(block_timestamp, time_format)
+    BLOCK_LAG.observe(time.time() - produced.replace(tzinfo=datetime.timezone.utc).timestamp(), stream)
+
+
+class DisconnectTimer:
+    """ Adds time from disconnected() to the next connected() to DISCONNECTED for a stream """
+    __slots__ = ("stream", "_since")
+
+    def __init__(self, stream: str):
+        self.stream = stream
+        self._since = None
+
+    def disconnected(self):
+        if self._since is None:
+            self._since = time.monotonic()
+
+    def connected(self):
+        if self._since is not None:
+            DISCONNECTED.inc(self.stream, amount=time.monotonic() - self._since)
+            self._since = None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = expose().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(port: int = config.METRICS_PORT, host: str = config.METRICS_HOST) -> ThreadingHTTPServer:
+    """ Enables metrics and serves them at http://host:port/metrics on a daemon thread """
+    enable()
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics_server", daemon=True).start()
+    return server
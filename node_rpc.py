@@ -1,51 +1,279 @@
+import itertools
 import json
+import logging
+import threading
+import time
+from typing import Iterable, List, Tuple
+
 import requests
+from requests.adapters import HTTPAdapter
 
 import config
+import metrics
+import rpc_cache
+from rpc_cache import RpcCache
+
 
+class RpcError(Exception):
+    """ JSON-RPC error response, or transport failure after all retries """
 
-def rpc_call(method, params, rpc_url = config.RPC_SERVER_URL):
-    payload = json.dumps({"jsonrpc": "2.0", "method": method, "params": params, "id": 1})
-    headers = {'content-type': "application/json", 'cache-control': "no-cache"}
-    try:
-        response = requests.request("POST", rpc_url, data=payload, headers=headers)
-        json_data = json.loads(response.text)
-        return json_data["result"]
-    except requests.exceptions.RequestException as e:
-        print(e)
-    except Exception as e:
-        print(e)
+    def __init__(self, message: str, code: int = None, data=None):
+        super().__init__(message)
+        self.code = code
+        self.data = data
 
 
-def get_deploy(deploy_hash: str):
+class RpcClient:
     """
-    Get deploy by deploy_hash
+    JSON-RPC client for a node, with a pooled keep-alive Session shared by all threads using the client.
+
+    Transport errors, HTTP 429 and 5xx responses are retried up to retries times, with exponential backoff
+    from backoff_sec.  JSON-RPC error responses are not retried and raise RpcError.
+
+    batch() sends many calls in one POST.  If the node rejects batch requests, calls are sent one at a time
+    on the pooled connections.
+
+    With a cache, blocks by hash and executed deploys are read from and added to it.
     """
-    return rpc_call("info_get_deploy", [deploy_hash])
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, rpc_url: str = config.RPC_SERVER_URL, timeout_sec: float = config.RPC_TIMEOUT_SEC,
+                 retries: int = config.RPC_RETRIES, backoff_sec: float = config.RPC_BACKOFF_SEC,
+                 pool_size: int = config.RPC_POOL_SIZE, batch_size: int = config.RPC_BATCH_SIZE,
+                 cache: RpcCache = None):
+        self.rpc_url = rpc_url
+        self.cache = cache
+        self.timeout_sec = timeout_sec
+        self.retries = retries
+        self.backoff_sec = backoff_sec
+        self.batch_size = batch_size
+        self.batch_supported = True
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({'content-type': "application/json", 'cache-control': "no-cache"})
+        self._ids = itertools.count(1)
+        self._id_lock = threading.Lock()
+
+    def _next_id(self) -> int:
+        with self._id_lock:
+            return next(self._ids)
+
+    def _post(self, payload):
+        """ POST payload with retry, returns decoded JSON response """
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.post(self.rpc_url, data=json.dumps(payload), timeout=self.timeout_sec)
+                if response.status_code not in self.RETRY_STATUS:
+                    result = response.json()
+                    if metrics.ENABLED:
+                        metrics.RPC_SECONDS.observe(time.perf_counter() - start, _method_label(payload))
+                    return result
+                error = f"HTTP {response.status_code}"
+            except (requests.exceptions.RequestException, ValueError) as e:
+                error = str(e)
+            if metrics.ENABLED:
+                metrics.RPC_ERRORS.inc(_method_label(payload))
+            if attempt >= self.retries:
+                raise RpcError(f"RPC to {self.rpc_url} failed after {attempt + 1} attempts: {error}")
+            delay = self.backoff_sec * 2 ** attempt
+            logging.warning(f"RPC to {self.rpc_url} failed ({error}), retrying in {delay}s")
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _result(response: dict):
+        if "error" in response:
+            error = response["error"]
+            raise RpcError(error.get("message", "RPC error"), error.get("code"), error.get("data"))
+        return response["result"]
+
+    def _request(self, method: str, params) -> dict:
+        return {"jsonrpc": "2.0", "method": method, "params": params, "id": self._next_id()}
+
+    def call(self, method: str, params=None):
+        """ Single JSON-RPC call, returns result or raises RpcError """
+        return self._result(self._post(self._request(method, params or [])))
+
+    def batch(self, calls: Iterable[Tuple[str, list]]) -> List:
+        """
+        Sends (method, params) calls in POSTs of up to batch_size calls.
+        Returns results in order of calls, with an RpcError in place of each failed call.
+        """
+        results = []
+        calls = list(calls)
+        for start in range(0, len(calls), self.batch_size):
+            results.extend(self._batch(calls[start:start + self.batch_size]))
+        return results
+
+    def _batch(self, calls: list) -> list:
+        payload = [self._request(method, params) for method, params in calls]
+        if self.batch_supported:
+            responses = self._post(payload)
+            if isinstance(responses, list):
+                by_id = {response.get("id"): response for response in responses}
+                results = []
+                for request in payload:
+                    response = by_id.get(request["id"])
+                    try:
+                        if response is None:
+                            raise RpcError(f"No response for {request['method']} in batch")
+                        results.append(self._result(response))
+                    except RpcError as e:
+                        results.append(e)
+                return results
+            logging.warning(f"RPC at {self.rpc_url} does not support batch requests, sending calls one at a time")
+            self.batch_supported = False
+        results = []
+        for request in payload:
+            try:
+                results.append(self._result(self._post(request)))
+            except RpcError as e:
+                results.append(e)
+        return results
+
+    def get_deploy(self, deploy_hash: str):
+        """
+        Get deploy by deploy_hash
+        """
+        if self.cache is not None:
+            cached = self.cache.get(rpc_cache.DEPLOY, deploy_hash)
+            if cached is not None:
+                return cached
+        result = self.call("info_get_deploy", [deploy_hash])
+        # Deploys not yet executed will change
+        if self.cache is not None and result.get("execution_results"):
+            self.cache.put(rpc_cache.DEPLOY, deploy_hash, result)
+        return result
+
+    def _cache_block(self, block_hash: str, result):
+        # When hash is unknown, chain_get_block returns last block, which is not cached under the requested hash
+        block = result.get("block") if isinstance(result, dict) else None
+        if block and block["hash"] == block_hash:
+            self.cache.put(rpc_cache.BLOCK, block_hash, _without_proofs(result))
+
+    def _cached_block(self, block_hash: str):
+        cached = self.cache.get(rpc_cache.BLOCK, block_hash)
+        return _without_proofs(cached) if cached is not None else None
+
+    def get_block(self, block_hash=None, block_height=None, proofs: bool = False):
+        """
+        Get block based on block_hash, block_height, or last block if block_identifier is missing.
+
+        Finality signatures keep being added to a block's proofs, so only the header and body are cached, and a
+        block from the cache has no "proofs".  With proofs, the block is always fetched from the node.
+        """
+        if self.cache is None or not block_hash:
+            return self.call("chain_get_block", _block_params(block_hash, block_height))
+        cached = None if proofs else self._cached_block(block_hash)
+        if cached is not None:
+            return cached
+        result = self.call("chain_get_block", _block_params(block_hash))
+        self._cache_block(block_hash, result)
+        return result
+
+    def get_blocks(self, block_hashes: Iterable[str], proofs: bool = False) -> list:
+        """
+        Get blocks by hash in batches, with an RpcError in place of each failed block.
+        As with get_block, cached blocks have no proofs, so are not used with proofs.
+        """
+        block_hashes = list(block_hashes)
+        if self.cache is None:
+            return self.batch(("chain_get_block", _block_params(block_hash)) for block_hash in block_hashes)
+        results = [None if proofs else self._cached_block(block_hash) for block_hash in block_hashes]
+        missing = [index for index, result in enumerate(results) if result is None]
+        fetched = self.batch(("chain_get_block", _block_params(block_hashes[index])) for index in missing)
+        for index, result in zip(missing, fetched):
+            results[index] = result
+            self._cache_block(block_hashes[index], result)
+        return results
+
+    def get_blocks_at_heights(self, block_heights: Iterable[int]) -> list:
+        """ Get blocks by height in batches, with an RpcError in place of each failed block """
+        block_heights = list(block_heights)
+        results = self.batch(("chain_get_block", _block_params(block_height=height)) for height in block_heights)
+        if self.cache is not None:
+            for result in results:
+                if isinstance(result, dict) and result.get("block"):
+                    self._cache_block(result["block"]["hash"], result)
+        return results
+
+    def get_deploys(self, deploy_hashes: Iterable[str]) -> list:
+        """ Get deploys by hash in batches, with an RpcError in place of each failed deploy """
+        deploy_hashes = list(deploy_hashes)
+        results = [self.cache.get(rpc_cache.DEPLOY, deploy_hash) if self.cache is not None else None
+                   for deploy_hash in deploy_hashes]
+        missing = [index for index, result in enumerate(results) if result is None]
+        fetched = self.batch(("info_get_deploy", [deploy_hashes[index]]) for index in missing)
+        for index, result in zip(missing, fetched):
+            results[index] = result
+            if self.cache is not None and isinstance(result, dict) and result.get("execution_results"):
+                self.cache.put(rpc_cache.DEPLOY, deploy_hashes[index], result)
+        return results
+
+    def get_auction_info(self, block_hash=None, block_height=None):
+        return self.call("state_get_auction_info", _block_params(block_hash, block_height))
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client_for(rpc_url: str = config.RPC_SERVER_URL) -> RpcClient:
+    """ Shared client per rpc_url, so module level calls reuse pooled connections """
+    with _clients_lock:
+        if rpc_url not in _clients:
+            _clients[rpc_url] = RpcClient(rpc_url, cache=rpc_cache.default_cache())
+        return _clients[rpc_url]
+
+
+def rpc_call(method, params, rpc_url=config.RPC_SERVER_URL):
+    return client_for(rpc_url).call(method, params)
+
+
+def _without_proofs(result: dict) -> dict:
+    block = {name: value for name, value in result["block"].items() if name != "proofs"}
+    return dict(result, block=block)
+
+
+def _method_label(payload) -> str:
+    return "batch" if isinstance(payload, list) else payload["method"]
 
 
 def _get_block_identifier(block_hash: str = None, block_height: int = None):
     if block_hash:
-        return{"Hash": block_hash}
-    if block_height:
+        return {"Hash": block_hash}
+    if block_height is not None:
         return {"Height": block_height}
 
 
-def get_block(block_hash=None, block_height=None):
-    """
-    Get block based on block_hash, block_height, or last block if block_identifier is missing
-    """
+def _block_params(block_hash: str = None, block_height: int = None) -> list:
     params = []
     value = _get_block_identifier(block_hash, block_height)
     if value:
         params.append(value)
-    return rpc_call("chain_get_block", params)
+    return params
 
 
-def get_auction_info(block_hash=None, block_height=None):
-    params = []
-    value = _get_block_identifier(block_hash, block_height)
-    if value:
-        params.append(value)
-    return rpc_call("state_get_auction_info", params)
+def get_deploy(deploy_hash: str, rpc_url=config.RPC_SERVER_URL):
+    """
+    Get deploy by deploy_hash
+    """
+    return client_for(rpc_url).get_deploy(deploy_hash)
+
+
+def get_block(block_hash=None, block_height=None, rpc_url=config.RPC_SERVER_URL):
+    """
+    Get block based on block_hash, block_height, or last block if block_identifier is missing
+    """
+    return client_for(rpc_url).get_block(block_hash, block_height)
+
 
+def get_auction_info(block_hash=None, block_height=None, rpc_url=config.RPC_SERVER_URL):
+    return client_for(rpc_url).get_auction_info(block_hash, block_height)
@@ -0,0 +1,224 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import config
+
+# PendingJournal record kinds
+PROCESSED = "P"
+ACCEPTED = "A"
+BLOCK = "B"
+SPILLED_PROCESSED = "SP"
+SPILLED_ACCEPTED = "SA"
+
+
+class PendingDeploys:
+    """
+    In memory index of deploy events waiting for the BlockAdded that tells which era they belong in.
+
+    DeployProcessed events are held by block_hash and DeployAccepted events by deploy hash, each with its
+    primary_key and contents.  Entries older than ttl_sec (the longest a deploy can wait for a block) or beyond
+    max_entries are returned by pop_expired() for the caller to spill to durable storage.
+
+    Recent blocks are remembered, so deploy events arriving after their block can go straight to their final
+    location.  Entries are only in memory, so callers keep a PendingJournal of changes and spill() on shutdown.
+    """
+
+    def __init__(self, ttl_sec: float = 2 * 60 * 60, max_entries: int = 100000, recent_blocks: int = 1000):
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.recent_blocks = recent_blocks
+        # block_hash -> [(added, primary_key, contents), ...]
+        self._processed = OrderedDict()
+        # deploy_hash -> (added, primary_key, contents)
+        self._accepted = OrderedDict()
+        self._count = 0
+        # block_hash -> era_id and deploy_hash -> (era_id, block_hash) for recent blocks
+        self._block_era = OrderedDict()
+        self._deploy_block = {}
+        self._block_deploys = {}
+
+    def __len__(self):
+        return self._count
+
+    def era_of_block(self, block_hash: str) -> Optional[int]:
+        return self._block_era.get(block_hash)
+
+    def block_of_deploy(self, deploy_hash: str) -> Optional[Tuple[int, str]]:
+        """ (era_id, block_hash) of recent block including deploy_hash """
+        return self._deploy_block.get(deploy_hash)
+
+    def add_processed(self, block_hash: str, primary_key: str, contents: str):
+        self._processed.setdefault(block_hash, []).append((time.monotonic(), primary_key, contents))
+        self._count += 1
+
+    def add_accepted(self, deploy_hash: str, primary_key: str, contents: str):
+        if deploy_hash not in self._accepted:
+            self._count += 1
+        self._accepted[deploy_hash] = (time.monotonic(), primary_key, contents)
+        self._accepted.move_to_end(deploy_hash)
+
+    def block_added(self, block_hash: str, era_id: int, deploy_hashes: Iterable[str]) -> List[Tuple[str, str]]:
+        """ Records block as recent and returns [(primary_key, contents), ...] of pending deploys in it """
+        deploy_hashes = list(deploy_hashes)
+        self._block_era[block_hash] = era_id
+        self._block_deploys[block_hash] = deploy_hashes
+        for deploy_hash in deploy_hashes:
+            self._deploy_block[deploy_hash] = (era_id, block_hash)
+        while len(self._block_era) > self.recent_blocks:
+            old_block, _ = self._block_era.popitem(last=False)
+            for deploy_hash in self._block_deploys.pop(old_block):
+                self._deploy_block.pop(deploy_hash, None)
+
+        ready = [(primary_key, contents) for _, primary_key, contents in self._processed.pop(block_hash, ())]
+        for deploy_hash in deploy_hashes:
+            entry = self._accepted.pop(deploy_hash, None)
+            if entry is not None:
+                ready.append(entry[1:])
+        self._count -= len(ready)
+        return ready
+
+    def pop_expired(self, now: float = None) -> Tuple[list, list]:
+        """
+        Removes entries past ttl_sec, and oldest entries over max_entries.
+        Returns ([(block_hash, primary_key, contents), ...] of processed,
+                 [(deploy_hash, primary_key, contents), ...] of accepted)
+        """
+        if now is None:
+            now = time.monotonic()
+        cutoff = now - self.ttl_sec
+        processed, accepted = [], []
+        while self._processed:
+            block_hash, entries = next(iter(self._processed.items()))
+            if entries[0][0] > cutoff and self._count <= self.max_entries:
+                break
+            del self._processed[block_hash]
+            self._count -= len(entries)
+            processed.extend((block_hash, primary_key, contents) for _, primary_key, contents in entries)
+        while self._accepted:
+            deploy_hash, (added, primary_key, contents) = next(iter(self._accepted.items()))
+            if added > cutoff and self._count <= self.max_entries:
+                break
+            self._accepted.popitem(last=False)
+            self._count -= 1
+            accepted.append((deploy_hash, primary_key, contents))
+        return processed, accepted
+
+    def spill(self) -> Tuple[list, list]:
+        """ Removes and returns all entries, in the form of pop_expired """
+        return self.pop_expired(now=float("inf"))
+
+    def entries(self) -> Tuple[list, list]:
+        """ All entries without removing them, in the form of pop_expired """
+        processed = [(block_hash, primary_key, contents)
+                     for block_hash, entries in self._processed.items() for _, primary_key, contents in entries]
+        accepted = [(deploy_hash, primary_key, contents)
+                    for deploy_hash, (_, primary_key, contents) in self._accepted.items()]
+        return processed, accepted
+
+    def discard_processed(self, block_hash: str):
+        self._count -= len(self._processed.pop(block_hash, ()))
+
+    def discard_accepted(self, deploy_hash: str):
+        if self._accepted.pop(deploy_hash, None) is not None:
+            self._count -= 1
+
+
+class PendingJournal:
+    """
+    Append only file of the changes to a PendingDeploys, so deploys waiting for their block survive a crash.
+
+    Deploys added, blocks added and entries spilled are appended as JSON lines, and made durable by flush().
+    replay() applies them to a PendingDeploys at start, with entries aged from then.  The file is rewritten
+    with only the entries still pending by compact(), which is done after replay and whenever the file grows
+    past compact_bytes, and removed when nothing is pending.  With path None nothing is kept.
+    """
+
+    def __init__(self, path: Optional[Path], compact_bytes: int = config.PENDING_JOURNAL_COMPACT_BYTES):
+        self.path = Path(path) if path is not None else None
+        self.compact_bytes = compact_bytes
+        self._file = None
+
+    def _append(self, record: list):
+        if self.path is None:
+            return
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'a')
+        self._file.write(json.dumps(record) + "\n")
+
+    def processed(self, block_hash: str, primary_key: str, contents: str):
+        self._append([PROCESSED, block_hash, primary_key, contents])
+
+    def accepted(self, deploy_hash: str, primary_key: str, contents: str):
+        self._append([ACCEPTED, deploy_hash, primary_key, contents])
+
+    def block_added(self, block_hash: str, era_id: int, deploy_hashes: List[str]):
+        self._append([BLOCK, block_hash, era_id, deploy_hashes])
+
+    def spilled(self, processed: list, accepted: list):
+        """ Entries returned by pop_expired() or spill() """
+        for block_hash in {block_hash for block_hash, _, _ in processed}:
+            self._append([SPILLED_PROCESSED, block_hash])
+        for deploy_hash, _, _ in accepted:
+            self._append([SPILLED_ACCEPTED, deploy_hash])
+
+    def replay(self, pending: PendingDeploys):
+        if self.path is None or not self.path.exists():
+            return
+        with open(self.path) as f:
+            for line in f:
+                # A crash can leave the last line incomplete, it was not flushed so not relied on
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                kind = record[0]
+                if kind == PROCESSED:
+                    pending.add_processed(*record[1:])
+                elif kind == ACCEPTED:
+                    pending.add_accepted(*record[1:])
+                elif kind == BLOCK:
+                    pending.block_added(*record[1:])
+                elif kind == SPILLED_PROCESSED:
+                    pending.discard_processed(record[1])
+                elif kind == SPILLED_ACCEPTED:
+                    pending.discard_accepted(record[1])
+
+    def flush(self, pending: PendingDeploys):
+        """ Makes appended changes durable, compacting if the file is large """
+        if self._file is None:
+            return
+        self._file.flush()
+        if self._file.tell() >= self.compact_bytes or not len(pending):
+            self.compact(pending)
+        else:
+            os.fsync(self._file.fileno())
+
+    def compact(self, pending: PendingDeploys):
+        """ Rewrites the file with only the entries of pending, or removes it if there are none """
+        self.close()
+        if self.path is None:
+            return
+        if not len(pending):
+            if self.path.exists():
+                self.path.unlink()
+            return
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        processed, accepted = pending.entries()
+        with open(tmp_path, 'w') as f:
+            for block_hash, primary_key, contents in processed:
+                f.write(json.dumps([PROCESSED, block_hash, primary_key, contents]) + "\n")
+            for deploy_hash, primary_key, contents in accepted:
+                f.write(json.dumps([ACCEPTED, deploy_hash, primary_key, contents]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
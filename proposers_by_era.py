@@ -1,22 +1,23 @@
 from event_stream_reader import EventStreamReader
-from config import SSE_SERVER_URL
-from message_structure import MessageData
+from config import SSE_SERVER_MAIN_URL
+from event_filter import EventFilter, Match
+from message_structure import MessageData, BLOCK_ADDED
 from collections import defaultdict
 
-esr = EventStreamReader(SSE_SERVER_URL)
+esr = EventStreamReader(SSE_SERVER_MAIN_URL)
 
 era_proposers = {}
-for msg in esr.messages():
+for msg in esr.messages(event_filter=EventFilter(Match(BLOCK_ADDED))):
     if not msg:
         continue
-    data = MessageData(msg.data)
-    if data.is_block_added:
-        era_id = data.data['block', 'header', 'era_id']
-        if era_id not in era_proposers:
-            era_proposers[era_id] = defaultdict(int)
-        proposer = data.data['block', 'body', 'proposer']
-        era_proposers[era_id][proposer] += 1
-        if data.data['block', 'header', 'height'] == 47264:
-            break
+    block = MessageData(msg.data).event
+    if block is None:
+        print(f"Skipping block not matching BlockAdded schema, id: {msg.id}")
+        continue
+    if block.era_id not in era_proposers:
+        era_proposers[block.era_id] = defaultdict(int)
+    era_proposers[block.era_id][block.proposer] += 1
+    if block.height == 47264:
+        break
 
 print(era_proposers)
@@ -0,0 +1,132 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+
+import config
+from catalog import Catalog
+from directory_store import era_directory_name
+from node_rpc import RpcClient
+from rpc_cache import RpcCache
+
+
+class BlockEras:
+    """
+    Memoized block_hash -> era_id from chain_get_block.
+
+    Concurrent lookups of the same block share one RPC call, so a block is fetched once however many of its
+    deploys are being reconciled.
+    """
+
+    def __init__(self, client: RpcClient):
+        self.client = client
+        self._eras = {}
+        self._lock = threading.Lock()
+        self.fetches = 0
+
+    def era_of_block(self, block_hash: str) -> Optional[int]:
+        with self._lock:
+            future = self._eras.get(block_hash)
+            owner = future is None
+            if owner:
+                future = self._eras[block_hash] = Future()
+                self.fetches += 1
+        if not owner:
+            return future.result()
+        era_id = None
+        try:
+            era_id = self.client.get_block(block_hash=block_hash)["block"]["header"]["era_id"]
+        finally:
+            future.set_result(era_id)
+            if era_id is None:
+                # Don't memoize failures, so a later lookup retries
+                with self._lock:
+                    self._eras.pop(block_hash, None)
+        return era_id
+
+
+class Reconciler:
+    """
+    Moves deploy-accepted files left in deploy_accepted/ into era_<era_id>/<block_hash>/ of the block that
+    executed them, resolving deploys with up to concurrency RPC calls at a time.
+    Deploys of blocks in the catalog, if given, are moved without RPC calls.  Once stop, if given, is set,
+    files not yet started are left for the next run.
+    """
+    MOVED = "moved"
+    NOT_EXECUTED = "not_executed"
+    ERROR = "error"
+
+    def __init__(self, data_dir: Path = config.DATA_DIR, rpc_url: str = config.RPC_SERVER_URL,
+                 concurrency: int = config.RECONCILE_CONCURRENCY, progress_interval_sec: float = 10,
+                 cache: RpcCache = None, catalog: Catalog = None, stop: threading.Event = None):
+        self.data_dir = Path(data_dir)
+        self.stop = stop
+        self.catalog = catalog
+        self.catalog_hits = 0
+        self.client = RpcClient(rpc_url, pool_size=concurrency, cache=cache)
+        self.concurrency = concurrency
+        self.progress_interval_sec = progress_interval_sec
+        self.block_eras = BlockEras(self.client)
+        self.counts = {self.MOVED: 0, self.NOT_EXECUTED: 0, self.ERROR: 0}
+
+    def _reconcile_file(self, src_file: Path) -> str:
+        deploy_hash = src_file.name.split('-')[-1]
+        located = self.catalog.block_of_deploy(deploy_hash) if self.catalog is not None else None
+        if located is not None:
+            self.catalog_hits += 1
+            era_id, block_hash = located
+        else:
+            deploy = self.client.get_deploy(deploy_hash)
+            results = deploy["execution_results"]
+            if not results:
+                return self.NOT_EXECUTED
+            block_hash = results[0]["block_hash"]
+            era_id = self.block_eras.era_of_block(block_hash)
+            if era_id is None:
+                return self.ERROR
+        target_dir = self.data_dir / era_directory_name(era_id) / block_hash
+        target_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            src_file.rename(target_dir / src_file.name)
+        except FileNotFoundError:
+            # Moved by the store when its block arrived
+            pass
+        return self.MOVED
+
+    def _report(self, done: int, total: int, start: float):
+        elapsed = time.perf_counter() - start
+        rate = done / elapsed if elapsed else 0.0
+        print(f"Reconciled {done}/{total} deploy-accepted ({rate:.1f}/sec): {self.counts}, "
+              f"{self.block_eras.fetches} blocks looked up, {self.catalog_hits} from catalog")
+
+    def run(self) -> dict:
+        """ Reconciles all deploy_accepted files, returns counts by outcome """
+        source_dir = self.data_dir / "deploy_accepted"
+        if not source_dir.exists():
+            return self.counts
+        files = list(source_dir.glob("deploy-accepted-*"))
+        start = last_report = time.perf_counter()
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="reconcile") as executor:
+            futures = [executor.submit(self._reconcile_file, src_file) for src_file in files]
+            for future in as_completed(futures):
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    print(f"Reconcile error: {e}")
+                    outcome = self.ERROR
+                self.counts[outcome] += 1
+                done += 1
+                if self.stop is not None and self.stop.is_set():
+                    # Only waits for the files being reconciled
+                    for pending in futures:
+                        pending.cancel()
+                    print("Reconcile stopped")
+                    break
+                if time.perf_counter() - last_report >= self.progress_interval_sec:
+                    last_report = time.perf_counter()
+                    self._report(done, len(files), start)
+        self._report(done, len(files), start)
+        self.client.close()
+        return self.counts
@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import config
+
+
+BLOCK = "block"
+DEPLOY = "deploy"
+
+
+class RpcCache:
+    """
+    Two tier cache of immutable RPC results keyed by (kind, hash): an in process LRU of memory_entries results
+    in front of one JSON file per result in cache_dir/<kind>/<hash[:2]>/<hash>.json.
+
+    Callers only put results that can't change, chain_get_block by hash and info_get_deploy with execution
+    results.  The disk store is bounded to max_disk_bytes by removing least recently used files, which are
+    tracked in memory from a scan at start.
+    """
+
+    def __init__(self, cache_dir: Path = config.RPC_CACHE_DIR,
+                 memory_entries: int = config.RPC_CACHE_MEMORY_ENTRIES,
+                 max_disk_bytes: int = config.RPC_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        # path -> size, least recently used first
+        self._disk = OrderedDict()
+        self.disk_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.evictions = 0
+        self._load_disk()
+
+    def _load_disk(self):
+        files = []
+        if self.cache_dir.exists():
+            for kind_dir in os.scandir(self.cache_dir):
+                if not kind_dir.is_dir():
+                    continue
+                for shard_dir in os.scandir(kind_dir.path):
+                    for entry in os.scandir(shard_dir.path):
+                        if entry.name.endswith(".json"):
+                            stat = entry.stat()
+                            files.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._disk[path] = size
+            self.disk_bytes += size
+
+    def _path(self, kind: str, key: str) -> str:
+        return str(self.cache_dir / kind / key[:2] / f"{key}.json")
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {"memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "puts": self.puts,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk),
+                "disk_bytes": self.disk_bytes}
+
+    def _remember(self, memory_key: tuple, result):
+        self._memory[memory_key] = result
+        self._memory.move_to_end(memory_key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, kind: str, key: str) -> Optional[dict]:
+        memory_key = (kind, key)
+        with self._lock:
+            if memory_key in self._memory:
+                self._memory.move_to_end(memory_key)
+                self.memory_hits += 1
+                return self._memory[memory_key]
+            path = self._path(kind, key)
+            if path not in self._disk:
+                self.misses += 1
+                return None
+            self._disk.move_to_end(path)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.disk_bytes -= self._disk.pop(path, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(memory_key, result)
+        return result
+
+    def put(self, kind: str, key: str, result: dict):
+        path = self._path(kind, key)
+        contents = json.dumps(result)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(contents)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.puts += 1
+            self._remember((kind, key), result)
+            self.disk_bytes += len(contents) - self._disk.pop(path, 0)
+            self._disk[path] = len(contents)
+            while self.disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+                old_path, size = self._disk.popitem(last=False)
+                self.disk_bytes -= size
+                self.evictions += 1
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache() -> Optional[RpcCache]:
+    """ Shared cache in config.RPC_CACHE_DIR, or None if config.RPC_CACHE_ENABLED is off """
+    global _default_cache
+    if not config.RPC_CACHE_ENABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = RpcCache()
+        return _default_cache
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import math
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Callable, Iterable, Optional, Tuple
+
+import config
+import metrics
+from message_structure import MessageData, CONTENT_KEY_TYPES
+
+
+class BloomFilter:
+    """ Set membership in fixed memory, with false positives at error_rate once capacity keys are added """
+
+    def __init__(self, capacity: int = config.SEEN_BLOOM_CAPACITY, error_rate: float = config.SEEN_BLOOM_ERROR_RATE):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Double hashing, with both hashes from one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class SeenEvents:
+    """
+    Primary keys of events already stored, so events read again after a reconnect or restart from 0 are
+    skipped before being routed and written.
+
+    Keys of the last recent_eras eras are held exactly, and older eras in a BloomFilter.  Events without an era,
+    such as deploys, count as the latest era added.  As a Bloom filter has false positives, a key found only
+    there is checked with confirm(data), normally the store's is_stored, and with no confirm it is not skipped.
+    On an event loop, use is_stored_async so confirm, which reads the store, runs on an executor.
+    Only events of CONTENT_KEY_TYPES are tracked, as other keys hold the time received.
+    """
+
+    def __init__(self, recent_eras: int = config.SEEN_RECENT_ERAS, bloom: BloomFilter = None,
+                 confirm: Callable[[MessageData], bool] = None):
+        self.recent_eras = recent_eras
+        self.bloom = bloom if bloom is not None else BloomFilter()
+        self.confirm = confirm
+        # primary_key -> era_id, and era_id -> primary_keys, of recent eras in order
+        self._keys = {}
+        self._eras = OrderedDict()
+        self.skipped = 0
+
+    @classmethod
+    def from_store(cls, store, **kwargs) -> "SeenEvents":
+        """ Built from store.stored_keys(), confirming Bloom filter hits with store.is_stored """
+        seen = cls(confirm=store.is_stored, **kwargs)
+        seen.add_keys(store.stored_keys())
+        return seen
+
+    def __len__(self):
+        return len(self._keys) + self.bloom.count
+
+    def add_keys(self, keys: Iterable[Tuple[Optional[int], str]]):
+        """ Adds (era_id, primary_key), with era_id None if not known """
+        by_era = {}
+        for era_id, primary_key in keys:
+            by_era.setdefault(era_id, []).append(primary_key)
+        undated = by_era.pop(None, [])
+        for era_id in sorted(by_era):
+            for primary_key in by_era[era_id]:
+                self._add(primary_key, era_id)
+        for primary_key in undated:
+            self._add(primary_key, None)
+
+    def _add(self, primary_key: str, era_id: Optional[int]):
+        latest_era = next(reversed(self._eras)) if self._eras else None
+        if era_id is None:
+            era_id = latest_era
+        elif latest_era is None or era_id > latest_era:
+            self._eras[era_id] = []
+            while len(self._eras) > self.recent_eras:
+                self._retire(*self._eras.popitem(last=False))
+        elif era_id not in self._eras:
+            # Older than the recent eras
+            self.bloom.add(primary_key)
+            return
+        if primary_key not in self._keys:
+            self._keys[primary_key] = era_id
+            self._eras.setdefault(era_id, []).append(primary_key)
+
+    def _retire(self, era_id, primary_keys: list):
+        """ Moves keys of an era that is no longer recent into the Bloom filter """
+        for primary_key in primary_keys:
+            if self._keys.get(primary_key) == era_id:
+                self.bloom.add(primary_key)
+                del self._keys[primary_key]
+
+    def add(self, data: MessageData):
+        if data.message_type in CONTENT_KEY_TYPES:
+            self._add(data.primary_key, data.era_id)
+
+    def add_saved(self, batch: list):
+        """ Adds a batch of (MessageData, contents) saved by WriteBehindQueue """
+        for data, _ in batch:
+            self.add(data)
+
+    def _lookup(self, data: MessageData) -> Optional[bool]:
+        """ Whether the event was stored before, or None if only confirm can tell """
+        if data.message_type not in CONTENT_KEY_TYPES:
+            return False
+        primary_key = data.primary_key
+        if primary_key in self._keys:
+            return True
+        if primary_key not in self.bloom or self.confirm is None:
+            return False
+        return None
+
+    def _skipped(self, data: MessageData):
+        self.skipped += 1
+        if metrics.ENABLED:
+            metrics.SEEN_SKIPPED.inc(data.message_type)
+
+    def is_stored(self, data: MessageData) -> bool:
+        """ True if the event was stored before, counting it as skipped """
+        stored = self._lookup(data)
+        if stored is None:
+            stored = self.confirm(data)
+        if stored:
+            self._skipped(data)
+        return stored
+
+    async def is_stored_async(self, data: MessageData, executor: Executor = None) -> bool:
+        """ is_stored with confirm run on executor, so the event loop does not wait on the store """
+        stored = self._lookup(data)
+        if stored is None:
+            stored = await asyncio.get_running_loop().run_in_executor(executor, self.confirm, data)
+        if stored:
+            self._skipped(data)
+        return stored
@@ -0,0 +1,212 @@
+import os
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import config
+from event_store import EventStore
+from message_structure import MessageData
+
+
+class SegmentLogStore(EventStore):
+    """
+    Append-only log of events in rolled segment files under log_dir, instead of a file per event.
+
+    segment-<n>.log holds the original data string of each event on its own line.  A new segment is started
+    once the current one reaches SEGMENT_SIZE.
+
+    index.log is appended to with a tab separated line per event:
+        E  primary_key  segment  offset  length  era_id  block_hash
+    and a line to link deploy-accepted events to the block they were added in:
+        L  primary_key  block_hash
+
+    The index is loaded into memory at start, giving lookup by primary_key, block and era without walking
+    directories.  Segment records beyond the end of the index, from a crash between the two writes, are
+    indexed again on start.  Events already in the log are not written again.
+
+    save_message is thread safe.  Writes are passed to the OS as they are made and fsync is done on flush().
+    """
+    SEGMENT_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, log_dir: Path = config.LOG_DIR):
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # primary_key -> (segment, offset, length)
+        self._locations = {}
+        self._block_keys = defaultdict(list)
+        self._block_era = {}
+        self._era_blocks = defaultdict(list)
+        # Keys with an era but no block, such as step
+        self._era_keys = defaultdict(list)
+        self._load_index()
+        self._index_file = open(self.log_dir / "index.log", 'a')
+        self._recover()
+        self._segment_number = max(self._segment_numbers(), default=0)
+        self._segment_file = None
+        self._open_segment()
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.log_dir / f"segment-{segment:08d}.log"
+
+    def _segment_numbers(self) -> List[int]:
+        return sorted(int(path.stem.split('-')[-1]) for path in self.log_dir.glob("segment-*.log"))
+
+    def _open_segment(self):
+        if self._segment_file is not None:
+            self._segment_file.close()
+        self._segment_file = open(self._segment_path(self._segment_number), 'ab')
+
+    def _load_index(self):
+        index_path = self.log_dir / "index.log"
+        if not index_path.exists():
+            return
+        with open(index_path, 'r') as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    # Partial write at crash, records are indexed again by _recover
+                    break
+                fields = line.rstrip("\n").split("\t")
+                if fields[0] == "E":
+                    primary_key, segment, offset, length, era_id, block_hash = fields[1:]
+                    self._add_location(primary_key, int(segment), int(offset), int(length),
+                                       int(era_id) if era_id else None, block_hash or None)
+                elif fields[0] == "L":
+                    self._block_keys[fields[2]].append(fields[1])
+
+    def _add_location(self, primary_key: str, segment: int, offset: int, length: int,
+                      era_id: Optional[int], block_hash: Optional[str]):
+        self._locations[primary_key] = (segment, offset, length)
+        if block_hash is not None:
+            self._block_keys[block_hash].append(primary_key)
+            if era_id is not None and block_hash not in self._block_era:
+                self._block_era[block_hash] = era_id
+                self._era_blocks[era_id].append(block_hash)
+        elif era_id is not None:
+            self._era_keys[era_id].append(primary_key)
+
+    def _recover(self):
+        """ Index segment records written after the last index line, truncating any partial record """
+        indexed_end = defaultdict(int)
+        for segment, offset, length in self._locations.values():
+            indexed_end[segment] = max(indexed_end[segment], offset + length + 1)
+        for segment in self._segment_numbers():
+            path = self._segment_path(segment)
+            if path.stat().st_size == indexed_end[segment]:
+                continue
+            with open(path, 'r+b') as f:
+                f.seek(indexed_end[segment])
+                offset = indexed_end[segment]
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        f.truncate(offset)
+                        break
+                    self._index_record(MessageData(line[:-1].decode(), lazy=True), segment, offset, len(line) - 1)
+                    offset += len(line)
+        self._index_file.flush()
+
+    def _index_record(self, data: MessageData, segment: int, offset: int, length: int):
+        primary_key = data.primary_key
+        era_id = data.era_id
+        block_hash = None if data.is_deploy_accepted or data.is_step else data.block_hash
+        self._add_location(primary_key, segment, offset, length, era_id, block_hash)
+        self._index_file.write(f"E\t{primary_key}\t{segment}\t{offset}\t{length}\t"
+                               f"{'' if era_id is None else era_id}\t{block_hash or ''}\n")
+        if data.is_block_added:
+            for td_hash in list(data.get_deploy_hashes()) + list(data.get_transfer_hashes()):
+                accepted_key = f"deploy-accepted-{td_hash}"
+                self._block_keys[data.block_hash].append(accepted_key)
+                self._index_file.write(f"L\t{accepted_key}\t{data.block_hash}\n")
+
+    def save_message(self, data: MessageData, contents: str):
+        record = contents.encode()
+        if b"\n" in record:
+            raise ValueError("Event data must be a single line to be stored in segment log")
+        with self._lock:
+            if data.primary_key in self._locations:
+                return
+            if self._segment_file.tell() >= self.SEGMENT_SIZE:
+                self._segment_number += 1
+                self._open_segment()
+            offset = self._segment_file.tell()
+            self._segment_file.write(record + b"\n")
+            self._segment_file.flush()
+            self._index_record(data, self._segment_number, offset, len(record))
+            self._index_file.flush()
+
+    def flush(self):
+        with self._lock:
+            for f in (self._segment_file, self._index_file):
+                f.flush()
+                os.fsync(f.fileno())
+
+    def close(self):
+        self.flush()
+        self._segment_file.close()
+        self._index_file.close()
+
+    def stored_keys(self) -> List[Tuple[Optional[int], str]]:
+        with self._lock:
+            keys = [(era_id, primary_key) for era_id, block_hashes in self._era_blocks.items()
+                    for block_hash in block_hashes for primary_key in self._block_keys[block_hash]
+                    if primary_key in self._locations]
+            keys.extend((era_id, primary_key) for era_id, primary_keys in self._era_keys.items()
+                        for primary_key in primary_keys)
+            dated = {primary_key for _, primary_key in keys}
+            keys.extend((None, primary_key) for primary_key in self._locations if primary_key not in dated)
+            return keys
+
+    def is_stored(self, data: MessageData) -> bool:
+        return data.primary_key in self
+
+    def __contains__(self, primary_key: str) -> bool:
+        return primary_key in self._locations
+
+    def __len__(self):
+        return len(self._locations)
+
+    def get(self, primary_key: str) -> Optional[str]:
+        """ Data string of event stored with primary_key """
+        location = self._locations.get(primary_key)
+        if location is None:
+            return None
+        segment, offset, length = location
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            return f.read(length).decode()
+
+    def era_of_block(self, block_hash: str) -> Optional[int]:
+        return self._block_era.get(block_hash)
+
+    def blocks_for_era(self, era_id: int) -> List[str]:
+        return list(self._era_blocks.get(era_id, ()))
+
+    def keys_for_block(self, block_hash: str) -> List[str]:
+        """ Stored keys of block, its deploys, deploy-accepted and finality signatures """
+        return [key for key in self._block_keys.get(block_hash, ()) if key in self._locations]
+
+    def keys_for_era(self, era_id: int) -> List[str]:
+        keys = list(self._era_keys.get(era_id, ()))
+        for block_hash in self._era_blocks.get(era_id, ()):
+            keys.extend(self.keys_for_block(block_hash))
+        return keys
+
+    def messages(self) -> Iterator[str]:
+        """ All event data strings in the order they were written """
+        self.flush()
+        for segment in self._segment_numbers():
+            with open(self._segment_path(segment), 'rb') as f:
+                for line in f:
+                    yield line[:-1].decode()
+
+    def export_to_directory(self, root_dir: Path):
+        """
+        Write all events into the directory layout of DirectoryStore at root_dir, so existing tooling can be used.
+        Not journaled, as an interrupted export is simply run again.
+        """
+        from directory_store import DirectoryStore
+        # Closed to write out deploys still waiting for their block
+        with DirectoryStore(root_dir, journal=False) as directory_store:
+            for contents in self.messages():
+                directory_store.save_message(MessageData(contents, lazy=True), contents)
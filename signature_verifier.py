@@ -0,0 +1,149 @@
+import queue
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+
+import config
+from event_types import FinalitySignature
+
+# Key and signature hex strings start with a tag byte for the algorithm
+ED25519_TAG = "01"
+SECP256K1_TAG = "02"
+
+# Parsed public keys by era, in each process doing verification.  Validators are the same for an era, so
+# each key is parsed once per era and the keys of eras before the previous are dropped.
+_era_keys = {}
+
+
+def signed_message(block_hash: str, era_id: int) -> bytes:
+    """ Bytes signed by a finality signature: block hash followed by era_id as little endian u64 """
+    return bytes.fromhex(block_hash) + era_id.to_bytes(8, "little")
+
+
+def parse_public_key(public_key: str):
+    tag, key_bytes = public_key[:2], bytes.fromhex(public_key[2:])
+    if tag == ED25519_TAG:
+        return ed25519.Ed25519PublicKey.from_public_bytes(key_bytes)
+    if tag == SECP256K1_TAG:
+        return ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256K1(), key_bytes)
+    raise ValueError(f"Unknown public key tag: {tag}")
+
+
+def _era_public_key(era_id: int, public_key: str):
+    keys = _era_keys.get(era_id)
+    if keys is None:
+        keys = _era_keys[era_id] = {}
+        for old_era in [key for key in _era_keys if key < era_id - 1]:
+            del _era_keys[old_era]
+    parsed = keys.get(public_key)
+    if parsed is None:
+        parsed = keys[public_key] = parse_public_key(public_key)
+    return parsed
+
+
+def verify_signature(block_hash: str, era_id: int, public_key: str, signature: str) -> bool:
+    """ True if signature by public_key of block_hash in era_id is valid """
+    try:
+        key = _era_public_key(era_id, public_key)
+        tag, signature_bytes = signature[:2], bytes.fromhex(signature[2:])
+        message = signed_message(block_hash, era_id)
+        if tag == ED25519_TAG and isinstance(key, ed25519.Ed25519PublicKey):
+            key.verify(signature_bytes, message)
+        elif tag == SECP256K1_TAG and isinstance(key, ec.EllipticCurvePublicKey) and len(signature_bytes) == 64:
+            # Signature is r and s, each 32 bytes big endian, over the SHA-256 digest of message
+            r, s = int.from_bytes(signature_bytes[:32], "big"), int.from_bytes(signature_bytes[32:], "big")
+            key.verify(encode_dss_signature(r, s), message, ec.ECDSA(hashes.SHA256()))
+        else:
+            return False
+        return True
+    except (InvalidSignature, ValueError):
+        return False
+
+
+def verify_batch(signatures: List[Tuple[str, int, str, str]]) -> List[bool]:
+    """ verify_signature of each (block_hash, era_id, public_key, signature), run in a pool process """
+    return [verify_signature(*signature) for signature in signatures]
+
+
+class SignatureVerifier:
+    """
+    Verifies FinalitySignature events in batches on a process pool, off the thread reading the stream.
+
+    Signatures are collected by add() and sent to the pool when batch_size are waiting or max_delay_sec
+    after the first of a batch, whichever comes first.  Valid signatures are returned by verified() as
+    their batches complete, so only verified weight needs to be counted.  Invalid signatures are counted and
+    dropped.
+    """
+
+    def __init__(self, workers: int = config.VERIFY_WORKERS, batch_size: int = config.VERIFY_BATCH_SIZE,
+                 max_delay_sec: float = config.VERIFY_MAX_DELAY_SEC, executor: Executor = None):
+        self.batch_size = batch_size
+        self.max_delay_sec = max_delay_sec
+        self._executor = executor or ProcessPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._batch = []
+        self._timer = None
+        self._results = queue.Queue()
+        self._in_flight = 0
+        self.invalid = 0
+
+    def add(self, fin_sig: FinalitySignature):
+        with self._lock:
+            self._batch.append(fin_sig)
+            if len(self._batch) >= self.batch_size:
+                self._submit()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.max_delay_sec, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _submit(self):
+        """ Sends waiting signatures to the pool, called with _lock held """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        self._in_flight += 1
+        future = self._executor.submit(verify_batch, [(fin_sig.block_hash, fin_sig.era_id, fin_sig.public_key,
+                                                       fin_sig.signature) for fin_sig in batch])
+        future.add_done_callback(lambda done: self._results.put((batch, done)))
+
+    def flush(self):
+        """ Sends waiting signatures to the pool without waiting for a full batch """
+        with self._lock:
+            self._submit()
+
+    def _collect(self, batch: list, future) -> List[FinalitySignature]:
+        with self._lock:
+            self._in_flight -= 1
+        valid = [fin_sig for fin_sig, is_valid in zip(batch, future.result()) if is_valid]
+        self.invalid += len(batch) - len(valid)
+        return valid
+
+    def verified(self, wait: bool = False) -> Iterator[FinalitySignature]:
+        """ Valid signatures of completed batches, after all added signatures are verified if wait """
+        if wait:
+            self.flush()
+        while True:
+            try:
+                if wait and self._in_flight:
+                    batch, future = self._results.get()
+                else:
+                    batch, future = self._results.get_nowait()
+            except queue.Empty:
+                return
+            yield from self._collect(batch, future)
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self._executor.shutdown()
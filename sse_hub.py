@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import logging
+import mmap
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from aiohttp import web
+
+import config
+import metrics
+from dump_index import DumpIndex
+from event_stream_reader import EventStreamReader
+from sse_parser import frame_id, iter_frames
+
+# Local re-broadcast hub of the node event streams.
+#
+# One upstream EventStreamReader per stream fills a ReplayBuffer, which is served to any number of clients at
+# /events/<stream> in the same SSE format as the node, so consumers only need their URL changed:
+#
+#     SSE_SERVER_MAIN_URL = f"http://{HUB_HOST}:{HUB_PORT}/events/main"
+#
+# Events get ids of the hub, and clients may pass start_from as with the node.  With a state_dir, ids continue
+# after the highest id reserved by the last run, so a client cursor from before a hub restart is never taken for
+# a later event.  Without one ids count from 0 when the hub starts, and a start_from past the last id is from
+# before the hub restarted, so the client is sent all events still held, as a node does after its restart.
+# Nothing is queued per client.  Each client keeps a cursor into the buffer and is sent everything after it at
+# once when it can take more, so a slow client only falls behind itself.
+
+# Most events sent to a client in one write
+MAX_CHUNK_EVENTS = 1000
+KEEPALIVE_FRAME = b":\n\n"
+
+
+def sse_frame(data: str, msg_id: int) -> bytes:
+    return ("data:" + data.replace("\n", "\ndata:") + f"\nid:{msg_id}\n\n").encode()
+
+
+class ReplayBuffer:
+    """
+    The last capacity events of a stream as SSE frames, by hub id.
+
+    With spill_path, events leaving memory are appended there as a dump file, indexed by DumpIndex, so clients
+    can replay from any id since the hub started.  Without it, a client behind the buffer resumes at the oldest
+    event still held, as with the node.
+
+    With id_path, ids start after those reserved by the last run, kept there as JSON and reserved id_reserve
+    at a time, so only one write is needed per id_reserve events.
+    """
+
+    def __init__(self, capacity: int = config.HUB_BUFFER_SIZE, spill_path: Optional[Path] = None,
+                 id_path: Optional[Path] = None, id_reserve: int = config.HUB_ID_RESERVE):
+        self.capacity = capacity
+        self.id_path = id_path
+        self.id_reserve = id_reserve
+        self.next_id = 0
+        if id_path is not None and id_path.exists():
+            self.next_id = json.loads(id_path.read_text())["reserved"]
+        # Id of the first event of this run
+        self.base_id = self.next_id
+        self._reserved = self.next_id
+        if id_path is not None:
+            self._reserve()
+        self._frames = [b""] * capacity
+        # Set and replaced on every append, created with the running loop in Python < 3.10
+        self._appended = None
+        self.spill_path = spill_path
+        self._spill_file = None
+        self._spill_index = None
+        self._spill_lock = threading.Lock()
+        if spill_path is not None:
+            spill_path.parent.mkdir(parents=True, exist_ok=True)
+            self._spill_file = open(spill_path, 'wb')
+            index = DumpIndex(spill_path)
+            if index.index_path.exists():
+                index.index_path.unlink()
+            self._spill_index = DumpIndex(spill_path)
+
+    @property
+    def first_id(self) -> int:
+        """ Lowest id held in memory """
+        return max(self.base_id, self.next_id - self.capacity)
+
+    @property
+    def oldest_id(self) -> int:
+        """ Lowest id that can be replayed, from the spill file or memory """
+        return self.base_id if self._spill_file is not None else self.first_id
+
+    @property
+    def spill_end(self) -> int:
+        """ Ids below this can be read from the spill file """
+        return self.first_id if self._spill_file is not None else self.base_id
+
+    def _reserve(self):
+        """ Saves the end of the next id_reserve ids, so a restart continues after them """
+        self._reserved = self.next_id + self.id_reserve
+        self.id_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.id_path.with_name(f"{self.id_path.name}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"reserved": self._reserved}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.id_path)
+
+    def append(self, data: str) -> int:
+        msg_id = self.next_id
+        if self.id_path is not None and msg_id >= self._reserved:
+            self._reserve()
+        slot = msg_id % self.capacity
+        if self._spill_file is not None and msg_id - self.base_id >= self.capacity:
+            self._spill_file.write(self._frames[slot])
+        self._frames[slot] = sse_frame(data, msg_id)
+        self.next_id += 1
+        if self._appended is not None:
+            self._appended.set()
+            self._appended = None
+        return msg_id
+
+    def frames(self, start: int, limit: int = MAX_CHUNK_EVENTS) -> Tuple[bytes, int]:
+        """ Frames from start, which must be in memory, and the id after the last returned """
+        end = min(self.next_id, start + limit)
+        capacity = self.capacity
+        return b"".join(self._frames[msg_id % capacity] for msg_id in range(start, end)), end
+
+    def flush_spill(self):
+        if self._spill_file is not None:
+            self._spill_file.flush()
+
+    def read_spill(self, start: int, limit: int = MAX_CHUNK_EVENTS) -> Tuple[bytes, int]:
+        """ Blocking read of frames from start in the spill file, call flush_spill() first """
+        with self._spill_lock:
+            index = self._spill_index.update()
+            if index.indexed_end == 0:
+                return b"", start
+            offset = index.offset_for(start)
+            frames = []
+            next_id = start
+            with open(self.spill_path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    for frame_start, frame_end in iter_frames(buffer, offset, index.indexed_end):
+                        frames.append(buffer[frame_start:frame_end + 2])
+                        next_id = frame_id(buffer, frame_start, frame_end) + 1
+                        if len(frames) == limit:
+                            break
+            return b"".join(frames), next_id
+
+    async def wait(self, cursor: int, timeout: float) -> bool:
+        """ Waits for an event at or after cursor, returns False if none is appended within timeout """
+        while self.next_id <= cursor:
+            if self._appended is None:
+                self._appended = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._appended.wait(), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def close(self):
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+
+class SSEHub:
+    """
+    Serves streams read once from the node to any number of local clients, see module comment.
+
+    readers is {stream name: EventStreamReader}.  A client that does not take data for write_timeout_sec is
+    dropped, so a stalled client does not hold its connection forever.  Ids of each stream are kept in
+    state_dir if not None, to continue across restarts.
+    """
+
+    def __init__(self, readers: Dict[str, EventStreamReader], buffer_size: int = config.HUB_BUFFER_SIZE,
+                 spill_dir: Optional[Path] = config.HUB_SPILL_DIR,
+                 write_timeout_sec: float = config.HUB_CLIENT_WRITE_TIMEOUT_SEC,
+                 keepalive_sec: float = config.HUB_KEEPALIVE_SEC,
+                 state_dir: Optional[Path] = config.HUB_STATE_DIR):
+        self.readers = readers
+        self.buffers = {name: ReplayBuffer(buffer_size, spill_dir and Path(spill_dir) / f"{name}.spill",
+                                           state_dir and Path(state_dir) / f"{name}.ids")
+                        for name in readers}
+        self.write_timeout_sec = write_timeout_sec
+        self.keepalive_sec = keepalive_sec
+        self.clients = {name: 0 for name in readers}
+        self.dropped = 0
+        # Spill reads are blocking file reads, one at a time per buffer through its lock
+        self._spill_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="sse_hub_spill")
+        self._upstream_tasks = []
+        self._runner = None
+        for name in readers:
+            metrics.HUB_CLIENTS.set_function(lambda stream=name: self.clients[stream], name)
+
+    async def _read_upstream(self, name: str):
+        buffer = self.buffers[name]
+        async for msg in self.readers[name].async_messages():
+            buffer.append(msg.data)
+
+    def _api_version_frame(self, name: str) -> bytes:
+        api_version = self.readers[name].api_version
+        return f'data:{{"ApiVersion":"{api_version}"}}\n\n'.encode() if api_version is not None else b""
+
+    async def _next_chunk(self, buffer: ReplayBuffer, cursor: int) -> Tuple[bytes, int]:
+        """ Data to send a client at cursor and its new cursor, waiting for new events """
+        if cursor < buffer.spill_end:
+            buffer.flush_spill()
+            chunk, next_cursor = await asyncio.get_running_loop().run_in_executor(
+                self._spill_executor, buffer.read_spill, cursor)
+            # Nothing at cursor in the spill, so continue from memory
+            return chunk, next_cursor if chunk else buffer.first_id
+        if cursor < buffer.first_id:
+            logging.warning(f"Client at id {cursor} is behind the replay buffer, resuming at {buffer.first_id}")
+            cursor = buffer.first_id
+        if cursor < buffer.next_id:
+            return buffer.frames(cursor)
+        if await buffer.wait(cursor, self.keepalive_sec):
+            return buffer.frames(cursor)
+        return KEEPALIVE_FRAME, cursor
+
+    async def serve_stream(self, request: web.Request) -> web.StreamResponse:
+        name = request.match_info["stream"]
+        buffer = self.buffers.get(name)
+        if buffer is None:
+            raise web.HTTPNotFound()
+        start_from = request.query.get("start_from")
+        try:
+            cursor = buffer.next_id if start_from is None else max(0, int(start_from))
+        except ValueError:
+            raise web.HTTPBadRequest(text="start_from must be an integer")
+        if cursor > buffer.next_id:
+            logging.warning(f"Client start_from {cursor} is past id {buffer.next_id} of {name}, from before the hub "
+                            f"restarted, replaying from {buffer.oldest_id}")
+            cursor = buffer.oldest_id
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        self.clients[name] += 1
+        try:
+            chunk = self._api_version_frame(name)
+            while True:
+                if chunk:
+                    await asyncio.wait_for(response.write(chunk), self.write_timeout_sec)
+                chunk, cursor = await self._next_chunk(buffer, cursor)
+        except asyncio.TimeoutError:
+            logging.warning(f"Dropping {name} client {request.remote} at id {cursor}, not taking data")
+            self.dropped += 1
+            if metrics.ENABLED:
+                metrics.HUB_DROPPED.inc(name)
+        except (ConnectionResetError, ConnectionError):
+            pass
+        finally:
+            self.clients[name] -= 1
+        return response
+
+    async def start(self, host: str = config.HUB_HOST, port: int = config.HUB_PORT):
+        """ Starts reading upstream and serving clients, port 0 picks a free port, see addresses """
+        self._upstream_tasks = [asyncio.create_task(self._read_upstream(name)) for name in self.readers]
+        app = web.Application()
+        app.router.add_get("/events/{stream}", self.serve_stream)
+        self._runner = web.AppRunner(app, handle_signals=False, shutdown_timeout=1)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    @property
+    def addresses(self) -> list:
+        return self._runner.addresses if self._runner is not None else []
+
+    async def stop(self):
+        for task in self._upstream_tasks:
+            task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+        self._spill_executor.shutdown(wait=True)
+        for buffer in self.buffers.values():
+            buffer.close()
+
+
+async def main():
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopped.set)
+    # Replays the node's buffer on start, so clients can replay it from the first id of this run
+    hub = SSEHub({name: EventStreamReader(url, start_from=0, name=f"hub_{name}")
+                  for name, url in (("main", config.SSE_SERVER_MAIN_URL),
+                                    ("deploys", config.SSE_SERVER_DEPLOYS_URL),
+                                    ("sigs", config.SSE_SERVER_SIGS_URL))})
+    if config.METRICS_ENABLED:
+        metrics.start_server()
+    await hub.start()
+    print(f"Serving {', '.join(hub.readers)} at http://{config.HUB_HOST}:{config.HUB_PORT}/events/<stream>")
+    await stopped.wait()
+    print("Stopping hub...")
+    await hub.stop()
+    print(f"Stopped hub, {hub.dropped} clients dropped.")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
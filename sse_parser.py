@@ -0,0 +1,151 @@
+from typing import Iterator, Optional, Tuple
+
+# Framing engine for the SSE stream of a casper-node, shared by live and dump file streamers.
+#
+# Works directly on bytes, bytearray or mmap buffers and only decodes the data field of a frame,
+# once, when the frame is complete.  The node ends lines with "\n" only, so "\r" line endings are not
+# handled.
+
+DATA_FIELD = b"data:"
+ID_FIELD = b"id:"
+EVENT_FIELD = b"event:"
+RETRY_FIELD = b"retry:"
+
+
+class SSEMessage:
+    """ One complete SSE message, with the attributes of sseclient.Event used in this project """
+    __slots__ = ("id", "data", "event", "retry")
+
+    def __init__(self, data: str = '', id: Optional[str] = None, event: str = 'message', retry: Optional[int] = None):
+        self.data = data
+        self.id = id
+        self.event = event
+        self.retry = retry
+
+    def __str__(self):
+        return self.data
+
+
+def _value_start(buffer, pos: int, end: int) -> int:
+    # Single optional space after the colon is not part of the value
+    if pos < end and buffer[pos:pos + 1] == b" ":
+        return pos + 1
+    return pos
+
+
+def _decode(buffer, start: int, end: int) -> str:
+    # Decoding through a memoryview avoids copying the slice out of the buffer first.
+    return str(memoryview(buffer)[start:end], 'utf-8')
+
+
+def parse_frame(buffer, start: int = 0, end: Optional[int] = None) -> Optional[SSEMessage]:
+    """
+    Parse the frame at buffer[start:end] (without the blank line ending it).  Returns None for comment only frames.
+    """
+    if end is None:
+        end = len(buffer)
+    data_ranges = []
+    msg_id = None
+    event = 'message'
+    retry = None
+    line_start = start
+    while line_start < end:
+        line_end = buffer.find(b"\n", line_start, end)
+        if line_end == -1:
+            line_end = end
+        field = buffer[line_start:line_start + 6]
+        if field.startswith(DATA_FIELD):
+            data_ranges.append((_value_start(buffer, line_start + 5, line_end), line_end))
+        elif field.startswith(ID_FIELD):
+            msg_id = _decode(buffer, _value_start(buffer, line_start + 3, line_end), line_end)
+        elif field == EVENT_FIELD:
+            event = _decode(buffer, _value_start(buffer, line_start + 6, line_end), line_end)
+        elif field == RETRY_FIELD:
+            retry = int(buffer[_value_start(buffer, line_start + 6, line_end):line_end])
+        # Lines starting with ":" are comments, other fields are ignored as per SSE spec.
+        line_start = line_end + 1
+    if not data_ranges and msg_id is None:
+        return None
+    data = "\n".join(_decode(buffer, data_start, data_end) for data_start, data_end in data_ranges)
+    return SSEMessage(data, msg_id, event, retry)
+
+
+def frame_id(buffer, start: int, end: int) -> Optional[int]:
+    """ Returns id of frame buffer[start:end] without parsing the data field, or None if frame has no id """
+    # Node sends id after data, so search from the end of the frame.
+    id_start = buffer.rfind(b"\n" + ID_FIELD, start, end)
+    if id_start != -1:
+        id_start += 1
+    elif buffer[start:start + 3] == ID_FIELD:
+        id_start = start
+    else:
+        return None
+    line_end = buffer.find(b"\n", id_start, end)
+    if line_end == -1:
+        line_end = end
+    return int(buffer[id_start + 3:line_end])
+
+
+def find_frame_end(buffer, pos: int, end: int) -> int:
+    """
+    Returns offset of the next blank line ending a frame at or after pos, or -1.
+
+    Searching for single newlines uses memchr, which is many times faster than searching for the two
+    byte frame end, and frames only hold a few lines.
+    """
+    while True:
+        newline = buffer.find(b"\n", pos, end)
+        if newline == -1 or newline + 1 >= end:
+            return -1
+        if buffer[newline + 1:newline + 2] == b"\n":
+            return newline
+        pos = newline + 1
+
+
+def iter_frames(buffer, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, int]]:
+    """
+    Yields (frame_start, frame_end) offsets of each complete frame in buffer, which can be bytes or an mmap.
+    frame_end is the offset of the blank line ending the frame, next frame starts at frame_end + 2.
+    """
+    if end is None:
+        end = len(buffer)
+    pos = start
+    while pos < end:
+        frame_end = find_frame_end(buffer, pos, end)
+        if frame_end == -1:
+            return
+        if frame_end > pos:
+            yield pos, frame_end
+        pos = frame_end + 2
+
+
+class SSEFrameParser:
+    """
+    Incremental parser for a live byte stream.  Feed chunks as they are read and complete messages are
+    yielded, with partial frames held until the rest arrives.
+    """
+    # Consumed bytes are only removed from the buffer once they exceed this, to avoid copying on every chunk.
+    COMPACT_SIZE = 1 << 20
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pos = 0
+
+    def feed(self, chunk: bytes) -> Iterator[SSEMessage]:
+        buffer = self._buffer
+        # Frame end may straddle the previous chunk
+        scan_from = max(self._pos, len(buffer) - 1)
+        buffer += chunk
+        if find_frame_end(buffer, scan_from, len(buffer)) == -1:
+            return
+        for frame_start, frame_end in iter_frames(buffer, self._pos):
+            self._pos = frame_end + 2
+            msg = parse_frame(buffer, frame_start, frame_end)
+            if msg is not None:
+                yield msg
+        # Skip any blank lines left at the end of the buffer
+        while buffer[self._pos:self._pos + 1] == b"\n":
+            self._pos += 1
+        if self._pos >= self.COMPACT_SIZE or self._pos == len(buffer):
+            del buffer[:self._pos]
+            self._pos = 0
@@ -0,0 +1,61 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+
+class StreamCheckpoint:
+    """
+    Durable record of the last message id processed from a stream.
+
+    The checkpoint file is written atomically (temp file and rename) and in batches, every FLUSH_EVERY
+    messages or FLUSH_INTERVAL_SEC, whichever comes first.  After a process restart up to one batch may be
+    seen again, so consumers of a resumed stream must tolerate re-processing since the last flush.
+    """
+    FLUSH_EVERY = 1000
+    FLUSH_INTERVAL_SEC = 5
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.last_msg_id = -1
+        self.api_version = None
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        data = json.loads(self.path.read_text())
+        self.last_msg_id = int(data["last_msg_id"])
+        self.api_version = data.get("api_version")
+
+    @property
+    def start_from(self) -> int:
+        return self.last_msg_id + 1
+
+    def update(self, msg_id: int):
+        """ Record msg_id as processed, flushing to disk if the batch is full or old enough """
+        self.last_msg_id = msg_id
+        self._unflushed += 1
+        if (self._unflushed >= self.FLUSH_EVERY or
+                time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL_SEC):
+            self.flush()
+
+    def reset(self, api_version: Optional[str] = None):
+        """ Node restarted, so ids start over """
+        self.last_msg_id = -1
+        self.api_version = api_version
+        self.flush()
+
+    def flush(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"last_msg_id": self.last_msg_id, "api_version": self.api_version}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
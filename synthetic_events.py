@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import json
+import random
+from pathlib import Path
+from typing import Dict, Iterator, Union
+
+from signature_verifier import signed_message
+
+# Deterministic generator of casper-node event streams, for tests and benchmarks without a node or dump file.
+#
+# Each block is announced as the node does: DeployAccepted for its deploys, then BlockAdded, DeployProcessed
+# for each deploy and a FinalitySignature from each signing validator.  The last block of an era is a switch
+# block with next_era_validator_weights, followed by a Step for the era.  The same options and seed always
+# give the same events.
+
+GENESIS_TIME = datetime.datetime(2021, 3, 31, 0, 0, tzinfo=datetime.timezone.utc)
+BLOCK_TIME_SEC = 65
+
+
+class SyntheticChain:
+    """
+    Events of a chain of eras * blocks_per_era blocks, with validators signing each block.
+
+    Blocks hold 0 to 2 * deploys_per_block deploys, each with transforms_per_deploy transforms in its
+    execution effect.  Each validator signs a block with probability signature_rate.  With sign, signatures
+    are real ed25519 signatures that verify with signature_verifier, otherwise random bytes, which is much
+    faster to generate.
+    """
+
+    def __init__(self, validators: int = 100, eras: int = 3, blocks_per_era: int = 20, deploys_per_block: int = 5,
+                 transforms_per_deploy: int = 20, signature_rate: float = 1.0, sign: bool = False, seed: int = 0):
+        self.seed = seed
+        self.eras = eras
+        self.blocks_per_era = blocks_per_era
+        self.deploys_per_block = deploys_per_block
+        self.transforms_per_deploy = transforms_per_deploy
+        self.signature_rate = signature_rate
+        self.sign = sign
+        self.rng = random.Random(seed)
+        self._signing_keys = {}
+        self.validators = [self._validator_key() for _ in range(validators)]
+        self.genesis_weights = self._weights()
+
+    def _hash(self) -> str:
+        return f"{self.rng.getrandbits(256):064x}"
+
+    def _validator_key(self) -> str:
+        if not self.sign:
+            return "01" + self._hash()
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ed25519
+        private_key = ed25519.Ed25519PrivateKey.from_private_bytes(self.rng.getrandbits(256).to_bytes(32, "big"))
+        public_key = "01" + private_key.public_key().public_bytes(serialization.Encoding.Raw,
+                                                                  serialization.PublicFormat.Raw).hex()
+        self._signing_keys[public_key] = private_key
+        return public_key
+
+    def _weights(self) -> Dict[str, int]:
+        return {validator: self.rng.randint(10 ** 12, 10 ** 15) for validator in self.validators}
+
+    def _signature(self, block_hash: str, era_id: int, public_key: str) -> str:
+        if not self.sign:
+            return "01" + f"{self.rng.getrandbits(512):0128x}"
+        return "01" + self._signing_keys[public_key].sign(signed_message(block_hash, era_id)).hex()
+
+    @staticmethod
+    def _timestamp(height: int) -> str:
+        timestamp = GENESIS_TIME + datetime.timedelta(seconds=height * BLOCK_TIME_SEC)
+        return timestamp.strftime("%Y-%m-%dT%H:%M:%S.") + f"{timestamp.microsecond // 1000:03d}Z"
+
+    def _deploy_accepted(self, deploy_hash: str, account: str, timestamp: str) -> dict:
+        return {"DeployAccepted": {
+            "hash": deploy_hash,
+            "header": {"account": account, "timestamp": timestamp, "ttl": "1h", "gas_price": 1,
+                       "body_hash": self._hash(), "dependencies": [], "chain_name": "synthetic"},
+            "payment": {"ModuleBytes": {"module_bytes": "", "args": [
+                ["amount", {"cl_type": "U512", "bytes": "0400e1f505", "parsed": "100000000"}]]}},
+            "session": {"Transfer": {"args": [
+                ["amount", {"cl_type": "U512", "bytes": "0500f2052a01", "parsed": "5000000000"}]]}},
+            "approvals": [{"signer": account, "signature": "01" + f"{self.rng.getrandbits(512):0128x}"}]}}
+
+    def _deploy_processed(self, deploy_hash: str, account: str, timestamp: str, block_hash: str) -> dict:
+        keys = [f"balance-{self._hash()}" for _ in range(self.transforms_per_deploy)]
+        return {"DeployProcessed": {
+            "deploy_hash": deploy_hash, "account": account, "timestamp": timestamp, "ttl": "1h",
+            "dependencies": [], "block_hash": block_hash,
+            "execution_result": {"Success": {
+                "effect": {"operations": [{"key": key, "kind": "Write"} for key in keys],
+                           "transforms": [{"key": key, "transform": {"AddUInt512": "100000000"}} for key in keys]},
+                "transfers": [], "cost": str(self.rng.randint(10 ** 7, 10 ** 9))}}}}
+
+    def events(self) -> Iterator[dict]:
+        """ Events of the chain in stream order, the same on every call """
+        self.rng = random.Random(f"events-{self.seed}")
+        parent_hash = "00" * 32
+        height = 0
+        for era_id in range(self.eras):
+            for era_height in range(self.blocks_per_era):
+                block_hash = self._hash()
+                timestamp = self._timestamp(height)
+                deploys = [(self._hash(), self.rng.choice(self.validators))
+                           for _ in range(self.rng.randint(0, 2 * self.deploys_per_block))]
+                for deploy_hash, account in deploys:
+                    yield self._deploy_accepted(deploy_hash, account, timestamp)
+                era_end = None
+                if era_height == self.blocks_per_era - 1:
+                    weights = self._weights()
+                    era_end = {"era_report": {"equivocators": [], "rewards": [], "inactive_validators": []},
+                               "next_era_validator_weights": [{"validator": validator, "weight": str(weight)}
+                                                              for validator, weight in weights.items()]}
+                yield {"BlockAdded": {"block_hash": block_hash, "block": {
+                    "hash": block_hash,
+                    "header": {"parent_hash": parent_hash, "state_root_hash": self._hash(),
+                               "body_hash": self._hash(), "random_bit": self.rng.random() < 0.5,
+                               "accumulated_seed": self._hash(), "era_end": era_end, "timestamp": timestamp,
+                               "era_id": era_id, "height": height, "protocol_version": "1.0.0"},
+                    "body": {"proposer": self.rng.choice(self.validators),
+                             "deploy_hashes": [deploy_hash for deploy_hash, _ in deploys], "transfer_hashes": []}}}}
+                for deploy_hash, account in deploys:
+                    yield self._deploy_processed(deploy_hash, account, timestamp, block_hash)
+                for validator in self.validators:
+                    if self.rng.random() < self.signature_rate:
+                        yield {"FinalitySignature": {"block_hash": block_hash, "era_id": era_id,
+                                                     "signature": self._signature(block_hash, era_id, validator),
+                                                     "public_key": validator}}
+                parent_hash = block_hash
+                height += 1
+            yield {"Step": {"era_id": era_id, "execution_effect": {"operations": [], "transforms": []}}}
+
+    def messages(self) -> Iterator[str]:
+        """ Events as JSON strings, in the compact form sent by the node """
+        for event in self.events():
+            yield json.dumps(event, separators=(",", ":"))
+
+    def write_dump(self, path: Union[str, Path], first_id: int = 0) -> int:
+        """
+        Writes events as a dump file of the SSE stream, as from `curl -sN host_ip:9999/events`, with ids from
+        first_id.  Returns the number of events written.
+        """
+        count = 0
+        with open(path, 'w') as f:
+            f.write('data:{"ApiVersion":"1.0.0"}\n\n')
+            for count, contents in enumerate(self.messages(), 1):
+                f.write(f"data:{contents}\nid:{first_id + count - 1}\n\n")
+        return count
+
+
+def add_chain_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--validators", type=int, default=100)
+    parser.add_argument("--eras", type=int, default=3)
+    parser.add_argument("--blocks-per-era", type=int, default=20)
+    parser.add_argument("--deploys-per-block", type=int, default=5)
+    parser.add_argument("--transforms-per-deploy", type=int, default=20)
+    parser.add_argument("--signature-rate", type=float, default=1.0)
+    parser.add_argument("--sign", action="store_true", help="real ed25519 signatures")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def chain_from_arguments(args: argparse.Namespace) -> SyntheticChain:
+    return SyntheticChain(args.validators, args.eras, args.blocks_per_era, args.deploys_per_block,
+                          args.transforms_per_deploy, args.signature_rate, args.sign, args.seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic event stream dump file")
+    parser.add_argument("dump_file")
+    add_chain_arguments(parser)
+    args = parser.parse_args()
+    print(f"Wrote {chain_from_arguments(args).write_dump(args.dump_file)} events to {args.dump_file}")
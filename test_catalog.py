@@ -0,0 +1,76 @@
+import json
+
+from catalog import Catalog, catalog_for
+from directory_store import DirectoryStore
+import file_store
+from message_structure import MessageData
+from test_message_structure import BLOCK_HASH, DEPLOY_HASH, MESSAGES, PUBLIC_KEY
+from test_segment_log_store import STREAM_ORDER
+
+
+def test_store_records_locations(tmp_path):
+    catalog = Catalog(tmp_path / "catalog.sqlite")
+    store = DirectoryStore(tmp_path / "events", catalog=catalog)
+    store.save_batch((MessageData(json.dumps(message), lazy=True), json.dumps(message)) for message in STREAM_ORDER)
+
+    block = MESSAGES[1]["BlockAdded"]["block"]
+    assert catalog.eras() == [67]
+    assert catalog.blocks_for_era(67) == [BLOCK_HASH]
+    assert catalog.block(BLOCK_HASH) == {"era_id": 67, "height": block["header"]["height"],
+                                         "proposer": block["body"]["proposer"],
+                                         "deploy_hashes": sorted(block["body"]["deploy_hashes"])}
+    assert catalog.block_of_deploy(DEPLOY_HASH) == (67, BLOCK_HASH)
+    assert (tmp_path / "events" / catalog.directory_of_deploy(DEPLOY_HASH) / f"deploy-{DEPLOY_HASH}").exists()
+    assert catalog.finsig_count(BLOCK_HASH) == 1
+    assert catalog.blocks_missing_finsigs() == []
+
+    # Saving again does not count signatures twice
+    store.save_message(MessageData(json.dumps(MESSAGES[4])), json.dumps(MESSAGES[4]))
+    assert catalog.finsig_count(BLOCK_HASH) == 1
+
+
+def test_store_routes_by_catalog_after_restart(tmp_path):
+    catalog = Catalog(tmp_path / "catalog.sqlite")
+    store = DirectoryStore(tmp_path / "events", catalog=catalog)
+    store.save_batch((MessageData(json.dumps(message), lazy=True), json.dumps(message)) for message in MESSAGES[1:2])
+    store.close()
+
+    # Pending no longer knows the block, as after its journal was compacted
+    store = DirectoryStore(tmp_path / "events", catalog=catalog, journal=False)
+    store.save_batch((MessageData(json.dumps(message), lazy=True), json.dumps(message))
+                     for message in (MESSAGES[2], MESSAGES[3]))
+    block_dir = tmp_path / "events" / "era_67" / BLOCK_HASH
+    assert (block_dir / f"deploy-{DEPLOY_HASH}").exists()
+    assert (block_dir / f"deploy-accepted-{DEPLOY_HASH}").exists()
+    assert not (tmp_path / "events" / BLOCK_HASH).exists()
+    assert len(store.pending) == 0
+
+
+def test_rebuild_from_directories(tmp_path):
+    store = DirectoryStore(tmp_path / "events")
+    store.save_batch((MessageData(json.dumps(message), lazy=True), json.dumps(message))
+                     for message in STREAM_ORDER if "FinalitySignature" not in message)
+
+    catalog = Catalog(tmp_path / "catalog.sqlite")
+    assert not catalog.is_built
+    catalog.rebuild(tmp_path / "events")
+    assert catalog.is_built
+    assert catalog.block_of_deploy(DEPLOY_HASH) == (67, BLOCK_HASH)
+    assert catalog.blocks_missing_finsigs() == [(67, BLOCK_HASH)]
+
+    finsig_dir = tmp_path / "events" / "era_67" / BLOCK_HASH
+    (finsig_dir / f"finsig-{BLOCK_HASH}-{PUBLIC_KEY}").write_text(json.dumps(MESSAGES[4]))
+    catalog.rebuild(tmp_path / "events")
+    assert catalog.finsig_count(BLOCK_HASH) == 1
+
+
+def test_file_store_reads_other_data_dir(tmp_path):
+    store = DirectoryStore(tmp_path)
+    store.save_batch((MessageData(json.dumps(message), lazy=True), json.dumps(message))
+                     for message in STREAM_ORDER if "FinalitySignature" not in message)
+    # Only config.DATA_DIR has the default catalog, other directories are read
+    assert catalog_for(tmp_path) is None
+    era_dirs = file_store.get_era_directories(tmp_path)
+    assert era_dirs == [tmp_path / "era_67"]
+    assert list(file_store.get_block_hashes_from_dir(era_dirs[0])) == [BLOCK_HASH]
+    assert file_store.is_missing_finsig_files(era_dirs[0] / BLOCK_HASH)
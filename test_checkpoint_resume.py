@@ -0,0 +1,127 @@
+import asyncio
+import json
+import random
+
+from event_stream_reader import (NodeRestartDetected, async_file_message_streamer, file_message_streamer,
+                                 file_message_streamer_with_disconnects, multiplex_streams)
+from stream_checkpoint import StreamCheckpoint
+
+
+EVENT_COUNT = 3000
+
+
+def write_dump_file(path, event_count=EVENT_COUNT, api_version="1.0.0"):
+    """ Writes file in format of `curl -sN host_ip:9999/events > dump_file` """
+    with open(path, 'w') as f:
+        f.write(f'data:{{"ApiVersion":"{api_version}"}}\n\n')
+        for msg_id in range(event_count):
+            data = {"Step": {"era_id": msg_id, "execution_effect": {}}}
+            f.write(f"data:{json.dumps(data)}\nid:{msg_id}\n\n")
+            if msg_id % 100 == 0:
+                f.write(":\n\n")
+
+
+def test_replay_with_disconnects_loses_and_repeats_nothing(tmp_path, quick_reader):
+    random.seed(120)
+    dump_file = tmp_path / "events_dump"
+    write_dump_file(dump_file)
+    checkpoint = StreamCheckpoint(tmp_path / "checkpoint.json")
+    esr = quick_reader(str(dump_file), 0, file_message_streamer_with_disconnects, checkpoint=checkpoint)
+
+    msg_ids = [int(msg.id) for msg in esr.messages()]
+
+    assert msg_ids == list(range(EVENT_COUNT))
+    assert checkpoint.last_msg_id == EVENT_COUNT - 1
+
+
+def test_resume_from_persisted_checkpoint(tmp_path, quick_reader):
+    random.seed(121)
+    dump_file = tmp_path / "events_dump"
+    write_dump_file(dump_file)
+    checkpoint_file = tmp_path / "checkpoint.json"
+    esr = quick_reader(str(dump_file), 0, file_message_streamer_with_disconnects,
+                       checkpoint=StreamCheckpoint(checkpoint_file))
+    first_run = []
+    for msg in esr.messages():
+        first_run.append(int(msg.id))
+        if len(first_run) == 1234:
+            break
+    esr.checkpoint.flush()
+
+    # New process reading the same checkpoint continues where the last one stopped.
+    esr = quick_reader(str(dump_file), 0, file_message_streamer_with_disconnects,
+                       checkpoint=StreamCheckpoint(checkpoint_file))
+    second_run = [int(msg.id) for msg in esr.messages()]
+
+    assert first_run + second_run == list(range(EVENT_COUNT))
+
+
+def test_node_restart_falls_back_to_zero(tmp_path, quick_reader):
+    old_node, new_node = tmp_path / "old_node", tmp_path / "new_node"
+    write_dump_file(old_node, 50, "1.0.0")
+    write_dump_file(new_node, 20, "1.1.0")
+    esr = quick_reader(str(old_node), 0, file_message_streamer, checkpoint=StreamCheckpoint(tmp_path / "checkpoint.json"))
+
+    msg_ids = []
+    for msg in esr.messages():
+        msg_ids.append(int(msg.id))
+        if len(msg_ids) == 50:
+            # Upgrade of node, ids start over with new ApiVersion
+            esr.server = str(new_node)
+
+    assert msg_ids == list(range(50)) + list(range(20))
+    assert esr.api_version == "1.1.0"
+
+
+def test_id_going_backwards_falls_back_to_zero(tmp_path, quick_reader):
+    dump_file = tmp_path / "events_dump"
+    write_dump_file(dump_file, 10)
+    esr = quick_reader(str(dump_file), 0, file_message_streamer)
+    # Reader was at id 500 when node restarted, new node is sending ids from 0 again
+    esr.last_msg_id = 500
+
+    msg_ids = [int(msg.id) for msg in esr.messages()]
+
+    assert msg_ids == list(range(10))
+
+
+def test_multiplex_streams_to_handlers(tmp_path, quick_reader):
+    streams = {"main": 300, "sigs": 500}
+    readers_and_handlers = []
+    received = {}
+    checkpoints = {}
+    for name, event_count in streams.items():
+        dump_file = tmp_path / name
+        write_dump_file(dump_file, event_count)
+        checkpoints[name] = StreamCheckpoint(tmp_path / f"{name}.json")
+        reader = quick_reader(str(dump_file), 0, file_message_streamer, async_file_message_streamer,
+                              checkpoint=checkpoints[name])
+        reader.RECONNECT_COUNT = 1
+        received[name] = []
+
+        async def handler(msg, name=name):
+            received[name].append(int(msg.id))
+        readers_and_handlers.append((reader, handler))
+
+    asyncio.run(multiplex_streams(readers_and_handlers))
+
+    for name, event_count in streams.items():
+        assert received[name] == list(range(event_count))
+        assert checkpoints[name].last_msg_id == event_count - 1
+
+
+def test_checkpoint_when_saved(tmp_path, quick_reader):
+    dump_file = tmp_path / "events_dump"
+    write_dump_file(dump_file, 10)
+    checkpoint = StreamCheckpoint(tmp_path / "checkpoint.json")
+    esr = quick_reader(str(dump_file), 0, file_message_streamer, checkpoint=checkpoint, checkpoint_when_saved=True)
+    esr.RECONNECT_COUNT = 1
+
+    callbacks = [esr.saved_callback() for _ in esr.messages()]
+    assert checkpoint.last_msg_id == -1
+    callbacks[6]()
+    assert checkpoint.last_msg_id == 6
+    # Callbacks from before a node restart are ignored
+    esr._restart_from_zero(NodeRestartDetected("test"))
+    callbacks[8]()
+    assert checkpoint.last_msg_id == -1
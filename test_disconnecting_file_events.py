@@ -1,9 +1,8 @@
 from event_stream_reader import EventStreamReader, file_message_streamer_with_disconnects
 
 
-# With changes to always pull from 0 and overwrite old data
-# This many never finish.  With server restarts, the id resets
-# to 0, so we cannot safely resume if the error was due to upgrade.
+# Resumes from last msg.id + 1 after each disconnect.  Only a detected
+# server restart (new ApiVersion or id going backwards) restarts from 0.
 
 data_path = "events_dryrun_120"
 
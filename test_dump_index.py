@@ -0,0 +1,87 @@
+import json
+
+from dump_index import DumpIndex
+from event_stream_reader import file_message_streamer
+
+
+def append_events(path, msg_ids):
+    with open(path, 'a') as f:
+        for msg_id in msg_ids:
+            f.write(f"data:{json.dumps({'Step': {'era_id': msg_id}})}\nid:{msg_id}\n\n")
+            f.write(":\n\n")
+
+
+def test_index_is_extended_as_dump_grows(tmp_path):
+    dump_file = tmp_path / "events_dump"
+    dump_file.write_text('data:{"ApiVersion":"1.0.0"}\n\n')
+    append_events(dump_file, range(100))
+
+    index = DumpIndex(dump_file).update()
+    assert index.count == 100
+    assert index.id_range() == (0, 99)
+
+    # Partial frame at end is not indexed until complete
+    append_events(dump_file, range(100, 150))
+    with open(dump_file, 'a') as f:
+        f.write('data:{"Step":{"era_id":150}}\nid:150\n')
+    index = DumpIndex(dump_file).update()
+    assert index.count == 150
+    assert index.id_range() == (0, 149)
+
+    # Index read back from sidecar file matches
+    reloaded = DumpIndex(dump_file)
+    assert list(reloaded.ids) == list(range(150))
+    assert list(reloaded.offsets) == list(index.offsets)
+
+
+def test_offsets_point_at_frames(tmp_path):
+    dump_file = tmp_path / "events_dump"
+    append_events(dump_file, range(20))
+    index = DumpIndex(dump_file).update()
+    contents = dump_file.read_bytes()
+    assert contents[index.offset_for(7):].startswith(b'data:{"Step": {"era_id": 7}}\nid:7\n')
+    assert index.offset_for(20) == len(contents)
+
+
+def test_streamer_seeks_to_start_from(tmp_path):
+    dump_file = tmp_path / "events_dump"
+    dump_file.write_text('data:{"ApiVersion":"1.0.0"}\n\n')
+    append_events(dump_file, range(500))
+
+    messages = list(file_message_streamer(str(dump_file), 450))
+
+    assert messages[0].data == '{"ApiVersion":"1.0.0"}'
+    assert [int(msg.id) for msg in messages[1:]] == list(range(450, 500))
+
+
+def test_replaced_dump_is_indexed_again(tmp_path):
+    dump_file = tmp_path / "events_dump"
+    append_events(dump_file, range(100, 200))
+    size = dump_file.stat().st_size
+    DumpIndex(dump_file).update()
+
+    # Another dump of the same size, with different ids
+    dump_file.unlink()
+    append_events(dump_file, range(500, 600))
+    assert dump_file.stat().st_size == size
+    index = DumpIndex(dump_file).update()
+    assert index.id_range() == (500, 599)
+
+    # Replaced again while the index is open, with a larger dump
+    dump_file.unlink()
+    append_events(dump_file, range(1000, 1200))
+    assert index.update().id_range() == (1000, 1199)
+    assert [int(msg.id) for msg in file_message_streamer(str(dump_file), 1150)] == list(range(1150, 1200))
+
+
+def test_streamer_yields_api_version_after_node_restart(tmp_path):
+    dump_file = tmp_path / "events_dump"
+    dump_file.write_text('data:{"ApiVersion":"1.0.0"}\n\n')
+    append_events(dump_file, range(10))
+    with open(dump_file, 'a') as f:
+        f.write('data:{"ApiVersion":"1.1.0"}\n\n')
+    append_events(dump_file, range(5))
+
+    messages = [msg.data if msg.id is None else int(msg.id) for msg in file_message_streamer(str(dump_file), 0)]
+    assert messages == (['{"ApiVersion":"1.0.0"}'] + list(range(10)) + ['{"ApiVersion":"1.1.0"}'] +
+                        list(range(5)))
@@ -0,0 +1,165 @@
+import json
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+from dynamdb_store import DynamoStore, DynamoWriteError
+from message_structure import MessageData
+from test_message_structure import BLOCK_HASH, MESSAGES
+
+
+class StubDynamoClient:
+    """
+    Tables as dicts of key -> item.  The first throttle_first calls raise a throttling error, and the next
+    unprocessed_calls calls leave half of their items unprocessed.
+    """
+
+    def __init__(self, throttle_first: int = 0, unprocessed_calls: int = 0):
+        self.tables = {}
+        self.schemas = {}
+        self.calls = []
+        self.throttle_first = throttle_first
+        self.unprocessed_calls = unprocessed_calls
+        self._lock = threading.Lock()
+
+    def get_paginator(self, name):
+        client = self
+
+        class Paginator:
+            def paginate(self):
+                return [{"TableNames": list(client.tables)}]
+        return Paginator()
+
+    def get_waiter(self, name):
+        class Waiter:
+            def wait(self, TableName):
+                pass
+        return Waiter()
+
+    def create_table(self, TableName, KeySchema, AttributeDefinitions, BillingMode):
+        self.tables[TableName] = {}
+        self.schemas[TableName] = [key["AttributeName"] for key in KeySchema]
+
+    def _key(self, table, item):
+        return tuple(item[name][list(item[name])[0]] for name in self.schemas[table])
+
+    def batch_write_item(self, RequestItems):
+        with self._lock:
+            self.calls.append(RequestItems)
+            if len(self.calls) <= self.throttle_first:
+                raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "BatchWriteItem")
+            count = sum(len(requests) for requests in RequestItems.values())
+            assert count <= 25
+            unprocessed = {}
+            skip = count // 2 if len(self.calls) <= self.throttle_first + self.unprocessed_calls else 0
+            for table, requests in RequestItems.items():
+                keys = [self._key(table, request["PutRequest"]["Item"]) for request in requests]
+                assert len(set(keys)) == len(keys), "duplicate keys in batch"
+                for key, request in zip(keys, requests):
+                    if skip:
+                        skip -= 1
+                        unprocessed.setdefault(table, []).append(request)
+                    else:
+                        self.tables[table][key] = request["PutRequest"]["Item"]
+            return {"UnprocessedItems": unprocessed}
+
+    def get_item(self, TableName, Key):
+        item = self.tables[TableName].get(self._key(TableName, Key))
+        return {"Item": item} if item else {}
+
+
+def finsig_messages(count: int):
+    for index in range(count):
+        message = {"FinalitySignature": {"block_hash": BLOCK_HASH, "era_id": 67, "signature": "01" + "ab" * 64,
+                                         "public_key": f"01{index:064x}"}}
+        yield MessageData(json.dumps(message), lazy=True), json.dumps(message)
+
+
+def test_tables_and_batches():
+    client = StubDynamoClient()
+    store = DynamoStore(client, max_concurrency=4, backoff_sec=0)
+    assert client.schemas["FinalitySignature"] == ["block_hash", "primary_key"]
+    assert client.schemas["BlockAdded"] == ["era_id", "primary_key"]
+
+    store.save_batch(finsig_messages(60))
+    assert len(client.calls) == 3
+    assert len(client.tables["FinalitySignature"]) == 60
+    assert store.items_written == 60
+
+    # Writing again replaces the same items
+    store.save_batch((MessageData(json.dumps(message)), json.dumps(message)) for message in MESSAGES[1:])
+    store.save_batch(finsig_messages(60))
+    assert len(client.tables["FinalitySignature"]) == 61
+    assert len(client.tables["BlockAdded"]) == 1
+    assert store.get(MessageData(json.dumps(MESSAGES[2]))) == json.dumps(MESSAGES[2])
+
+    # Recreating the store keeps existing tables
+    DynamoStore(client)
+    assert len(client.tables["FinalitySignature"]) == 61
+
+
+def test_duplicates_in_batch_collapsed():
+    client = StubDynamoClient()
+    store = DynamoStore(client, backoff_sec=0)
+    messages = list(finsig_messages(10))
+    store.save_batch(messages + messages)
+    assert len(client.calls) == 1
+    assert len(client.tables["FinalitySignature"]) == 10
+
+
+def test_unprocessed_and_throttled_retried():
+    client = StubDynamoClient(throttle_first=2, unprocessed_calls=2)
+    store = DynamoStore(client, max_concurrency=8, backoff_sec=0)
+    store.save_batch(finsig_messages(25))
+    # Throttled twice, then 12 and 6 items left unprocessed
+    assert [sum(len(r) for r in call.values()) for call in client.calls] == [25, 25, 25, 12, 6]
+    assert store.limit.throttles == 4
+    # Halved by each throttle down to 1, and raised by the successful write
+    assert store.limit.limit == 2
+    assert len(client.tables["FinalitySignature"]) == 25
+    assert store.items_written == 25
+
+
+def test_write_error_after_retries():
+    client = StubDynamoClient(throttle_first=100)
+    store = DynamoStore(client, retries=2, backoff_sec=0)
+    with pytest.raises(DynamoWriteError) as e:
+        store.save_batch(finsig_messages(3))
+    assert len(client.calls) == 3
+    assert len(e.value.unprocessed["FinalitySignature"]) == 3
+
+
+def test_faults_replaced_when_written_again():
+    client = StubDynamoClient()
+    store = DynamoStore(client, backoff_sec=0)
+    fault = json.dumps({"Fault": {"era_id": 67, "public_key": "01" + "cd" * 32, "timestamp": "2022-01-01T00:00:00Z"}})
+    store.save_batch([(MessageData(fault), fault)])
+    store.save_batch([(MessageData(fault), fault)])
+    assert len(client.tables["Fault"]) == 1
+    assert store.get(MessageData(fault)) == fault
+
+
+def test_oversized_item_rejected_alone():
+    client = StubDynamoClient()
+    store = DynamoStore(client, backoff_sec=0)
+    message = {"DeployAccepted": {"hash": "ef" * 32, "session": "00" * 300 * 1024}}
+    messages = list(finsig_messages(10)) + [(MessageData(json.dumps(message), lazy=True), json.dumps(message))]
+    store.save_batch(messages)
+    assert store.items_rejected == 1
+    assert len(client.tables["FinalitySignature"]) == 10
+    assert client.tables["DeployAccepted"] == {}
+
+
+def test_completed_batches_not_kept():
+    client = StubDynamoClient()
+    store = DynamoStore(client, backoff_sec=0)
+    messages = list(finsig_messages(125))
+    for start in range(0, 125, 25):
+        for data, contents in messages[start:start + 25]:
+            store.save_message(data, contents)
+        store._futures[-1].result()
+    # Only the last batch, as each was done before the next was submitted
+    assert len(store._futures) == 1
+    store.flush()
+    assert len(client.tables["FinalitySignature"]) == 125
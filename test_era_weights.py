@@ -0,0 +1,87 @@
+import random
+
+from era_weights import EraWeightsStore, SwitchBlockFinder
+from event_types import FinalitySignature
+from finalized_blocks import EraData
+from node_rpc import RpcError
+
+
+class StubChainClient:
+    """ Chain of blocks by height with the given number of blocks per era, switch blocks hold next era weights """
+
+    def __init__(self, era_lengths):
+        self.eras = [era_id for era_id, length in enumerate(era_lengths) for _ in range(length)]
+        self.calls = 0
+
+    def _block(self, height):
+        era_id = self.eras[height]
+        era_end = None
+        if height + 1 < len(self.eras) and self.eras[height + 1] != era_id:
+            era_end = {"next_era_validator_weights": [{"validator": f"v{era_id + 1}", "weight": str(height)}]}
+        return {"block": {"hash": f"h{height}", "header": {"height": height, "era_id": era_id, "era_end": era_end}}}
+
+    def get_block(self, block_hash=None, block_height=None):
+        self.calls += 1
+        if block_hash is not None:
+            return self._block(int(block_hash[1:]))
+        return self._block(len(self.eras) - 1 if block_height is None else block_height)
+
+
+def test_finds_switch_blocks():
+    rng = random.Random(7)
+    client = StubChainClient([rng.randint(100, 130) for _ in range(200)])
+    for era_id in (1, 2, 57, 198, 199):
+        client.calls = 0
+        switch_height = client.eras.index(era_id) - 1
+        assert SwitchBlockFinder(client).era_weights(era_id) == {f"v{era_id}": switch_height}
+        # Walking parent hashes back takes a call per block of the era
+        assert client.calls <= 15
+
+
+def test_era_within_uneven_chain():
+    client = StubChainClient([1, 500, 3, 2, 700, 1, 1, 90])
+    finder = SwitchBlockFinder(client)
+    for era_id in range(1, 8):
+        assert finder.first_height_of_era(era_id, len(client.eras) - 1, 7) == client.eras.index(era_id)
+    assert finder.era_weights(0) == {}
+
+
+def test_weights_store(tmp_path):
+    store = EraWeightsStore(tmp_path / "weights")
+    assert store.get(5) is None
+    weights = {"01ab": 10 ** 30, "01cd": 1}
+    store.put(5, weights)
+    assert EraWeightsStore(tmp_path / "weights").get(5) == weights
+
+
+def test_restart_in_known_era_needs_no_rpc(tmp_path):
+    client = StubChainClient([10, 10, 10])
+    fin_sig = FinalitySignature.from_data({"block_hash": "h25", "era_id": 2, "signature": "01", "public_key": "v2"})
+    assert EraData(client, EraWeightsStore(tmp_path)).process_finality_signature(fin_sig)
+    assert client.calls > 0
+
+    client.calls = 0
+    assert EraData(client, EraWeightsStore(tmp_path)).process_finality_signature(fin_sig)
+    assert client.calls == 0
+
+
+def test_signature_kept_when_rpc_fails(tmp_path):
+    client = StubChainClient([10, 10, 10])
+    get_block = client.get_block
+
+    def failing_get_block(*args, **kwargs):
+        raise RpcError("node unavailable")
+    client.get_block = failing_get_block
+    era_data = EraData(client, EraWeightsStore(tmp_path))
+    fin_sig = FinalitySignature.from_data({"block_hash": "h25", "era_id": 2, "signature": "01", "public_key": "v2"})
+    assert not era_data.process_finality_signature(fin_sig)
+    assert era_data.waiting == {2: [fin_sig]}
+    # Not retried before ERA_RPC_RETRY_SEC
+    client.get_block = get_block
+    assert era_data.retry_waiting() == []
+    assert client.calls == 0
+
+    # Due for retry
+    era_data._rpc_retry_at[2] = 0
+    assert era_data.retry_waiting() == [fin_sig]
+    assert era_data.waiting == {}
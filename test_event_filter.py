@@ -0,0 +1,97 @@
+import asyncio
+
+from event_filter import EventFilter, Match
+from message_structure import MessageData, BLOCK_ADDED, DEPLOY_PROCESSED, FINALITY_SIGNATURE
+from synthetic_events import SyntheticChain
+
+
+def chain_messages():
+    chain = SyntheticChain(validators=10, eras=2, blocks_per_era=10, transforms_per_deploy=2)
+    return chain, list(chain.messages())
+
+
+def accepted(event_filter, messages):
+    return [message for message in messages if event_filter.accepts(message)]
+
+
+def test_message_type():
+    _, messages = chain_messages()
+    event_filter = EventFilter(Match(BLOCK_ADDED))
+
+    assert accepted(event_filter, messages) == [message for message in messages
+                                                if MessageData(message).is_block_added]
+    assert event_filter.accepted + event_filter.rejected == len(messages)
+
+
+def test_field_value_and_predicate():
+    chain, messages = chain_messages()
+    proposer = chain.validators[0]
+    proposed = [message for message in messages
+                if MessageData(message).is_block_added and MessageData(message).event.proposer == proposer]
+    assert proposed
+
+    assert accepted(EventFilter(Match(BLOCK_ADDED, {"block.body.proposer": proposer})), messages) == proposed
+    assert accepted(EventFilter(Match(BLOCK_ADDED, {"block.body.proposer": lambda key: key == proposer})),
+                    messages) == proposed
+    high = accepted(EventFilter(Match(BLOCK_ADDED, {"block.header.height": lambda height: height >= 15})), messages)
+    assert [MessageData(message).event.height for message in high] == [15, 16, 17, 18, 19]
+
+
+def test_conditions_all_and_matches_any():
+    chain, messages = chain_messages()
+    both = EventFilter(Match(BLOCK_ADDED, {"block.header.height": 3, "block.header.era_id": 0}))
+    assert [MessageData(message).event.height for message in accepted(both, messages)] == [3]
+    wrong_era = EventFilter(Match(BLOCK_ADDED, {"block.header.height": 3, "block.header.era_id": 1}))
+    assert accepted(wrong_era, messages) == []
+
+    block_hash = MessageData(accepted(both, messages)[0]).event.block_hash
+    either = EventFilter(Match(BLOCK_ADDED, {"block.header.height": 3}),
+                         Match(FINALITY_SIGNATURE, {"block_hash": block_hash}))
+    expected = [message for message in messages
+                if MessageData(message).message_type in (BLOCK_ADDED, FINALITY_SIGNATURE)
+                and MessageData(message).block_hash == block_hash]
+    assert len(expected) > 1
+    assert accepted(either, messages) == expected
+
+
+def test_field_path_not_just_name():
+    nested = '{"BlockAdded":{"other":{"height":5},"block":{"header":{"height":6}}}}'
+    assert not EventFilter(Match(BLOCK_ADDED, {"block.header.height": 5})).accepts(nested)
+    assert EventFilter(Match(BLOCK_ADDED, {"block.header.height": 6})).accepts(nested)
+    # Object values can only be checked by parsing
+    era_end = '{"BlockAdded":{"block":{"header":{"era_end":{"era_report":{}}}}}}'
+    assert EventFilter(Match(BLOCK_ADDED, {"block.header.era_end": lambda era_end: "era_report" in era_end})
+                       ).accepts(era_end)
+
+
+def test_missing_field_or_failing_predicate_does_not_match():
+    message = '{"DeployProcessed":{"deploy_hash":"ab","account":null,"timestamp":"2021-03-22T12:59:47.939Z"}}'
+    assert not EventFilter(Match(DEPLOY_PROCESSED, {"ttl": lambda ttl: True})).accepts(message)
+    assert not EventFilter(Match(DEPLOY_PROCESSED, {"account": lambda account: True})).accepts(message)
+    assert not EventFilter(Match(DEPLOY_PROCESSED, {"timestamp": lambda timestamp: timestamp > 5})).accepts(message)
+    assert EventFilter(Match(DEPLOY_PROCESSED, {"deploy_hash": "ab"})).accepts(message)
+
+
+def test_whitespace_before_type():
+    message = ' { "FinalitySignature" : {"block_hash": "ab", "era_id": 1}}'
+    assert EventFilter(Match(FINALITY_SIGNATURE, {"era_id": 1})).accepts(message)
+    assert not EventFilter(Match(BLOCK_ADDED)).accepts(message)
+
+
+def test_reader_passes_over_rejected(tmp_path, quick_reader):
+    chain, messages = chain_messages()
+    dump_file = tmp_path / "dump"
+    last_id = chain.write_dump(dump_file, first_id=0) - 1
+    blocks = [message for message in messages if MessageData(message).is_block_added]
+
+    esr = quick_reader(dump_file, reconnect_count=1)
+    assert [msg.data for msg in esr.messages(event_filter=EventFilter(Match(BLOCK_ADDED)))] == blocks
+    assert esr.last_msg_id == last_id
+
+    esr = quick_reader(dump_file, reconnect_count=1)
+
+    async def read():
+        return [msg.data async for msg in esr.async_messages(event_filter=EventFilter(Match(BLOCK_ADDED)))]
+
+    assert asyncio.run(read()) == blocks
+    assert esr.last_msg_id == last_id
@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import pytest
+
+import config
+from fan_in import FanInReader, content_key
+import file_store
+from message_structure import MessageData
+from synthetic_events import SyntheticChain
+
+
+def write_node_dumps(tmp_path, chain):
+    """ Same events from two nodes, with different message ids and node_b missing the first blocks """
+    node_a = tmp_path / "node_a"
+    node_b = tmp_path / "node_b"
+    chain.write_dump(node_a, first_id=0)
+    messages = list(chain.messages())
+    with open(node_b, 'w') as f:
+        f.write('data:{"ApiVersion":"1.0.0"}\n\n')
+        for msg_id, contents in enumerate(messages[len(messages) // 3:], 5000):
+            f.write(f"data:{contents}\nid:{msg_id}\n\n")
+    return node_a, node_b, messages
+
+
+def test_each_event_once(tmp_path, quick_reader):
+    chain = SyntheticChain(validators=10, eras=2, blocks_per_era=5, transforms_per_deploy=1)
+    node_a, node_b, messages = write_node_dumps(tmp_path, chain)
+    fan_in = FanInReader([quick_reader(node_a, name="a"), quick_reader(node_b, name="b")])
+
+    received = [msg.data for msg in fan_in.messages()]
+
+    assert sorted(received) == sorted(messages)
+    stats = fan_in.stats()
+    assert stats["emitted"] == len(messages)
+    assert stats["nodes"]["a"]["received"] == len(messages)
+    assert stats["nodes"]["b"]["received"] == len(messages) - len(messages) // 3
+    assert stats["nodes"]["a"]["first"] + stats["nodes"]["b"]["first"] == len(messages)
+    assert stats["nodes"]["a"]["duplicates"] + stats["nodes"]["b"]["duplicates"] == \
+        len(messages) - len(messages) // 3
+
+
+def test_async_each_event_once(tmp_path, quick_reader):
+    chain = SyntheticChain(validators=10, eras=2, blocks_per_era=5, transforms_per_deploy=1)
+    node_a, node_b, messages = write_node_dumps(tmp_path, chain)
+    fan_in = FanInReader([quick_reader(node_a, name="a"), quick_reader(node_b, name="b")])
+
+    async def read():
+        return [msg.data async for msg in fan_in.async_messages()]
+
+    assert sorted(asyncio.run(read())) == sorted(messages)
+    assert fan_in.stats()["emitted"] == len(messages)
+
+
+def test_stop_early(tmp_path, quick_reader):
+    chain = SyntheticChain(validators=10, eras=2, blocks_per_era=5, transforms_per_deploy=1)
+    node_a, node_b, _ = write_node_dumps(tmp_path, chain)
+    fan_in = FanInReader([quick_reader(node_a, name="a"), quick_reader(node_b, name="b")], queue_size=2)
+
+    for count, _ in enumerate(fan_in.messages(), 1):
+        if count == 10:
+            break
+
+    assert fan_in.emitted == 10
+
+
+def test_content_key_ignores_receive_time():
+    fault = json.dumps({"Fault": {"era_id": 5, "public_key": "01ab", "timestamp": "2021-03-22T13:11:41.312Z"}})
+    other_fault = json.dumps({"Fault": {"era_id": 6, "public_key": "01ab", "timestamp": "2021-03-22T13:11:41.312Z"}})
+    step = json.dumps({"Step": {"era_id": 5, "execution_effect": {}}})
+
+    assert content_key(fault) == content_key(fault)
+    assert content_key(fault) != content_key(other_fault)
+    assert content_key(step) == MessageData(step).primary_key
+
+
+def test_dedupe_size_bounds_memory(tmp_path, quick_reader):
+    chain = SyntheticChain(validators=10, eras=2, blocks_per_era=5, transforms_per_deploy=1)
+    node_a, node_b, messages = write_node_dumps(tmp_path, chain)
+    fan_in = FanInReader([quick_reader(node_a, name="a"), quick_reader(node_b, name="b")], dedupe_size=100)
+
+    list(fan_in.messages())
+
+    assert len(fan_in._seen) == 100
+
+
+class FailingReader:
+    name = "failing"
+
+    def messages(self):
+        raise ConnectionError("node gone")
+        yield
+
+    async def async_messages(self):
+        raise ConnectionError("node gone")
+        yield
+
+
+def test_node_error_raised_after_events(tmp_path, quick_reader):
+    chain = SyntheticChain(validators=10, eras=1, blocks_per_era=3, transforms_per_deploy=1)
+    node_a, _, messages = write_node_dumps(tmp_path, chain)
+
+    received = []
+    with pytest.raises(ConnectionError):
+        for msg in FanInReader([quick_reader(node_a, name="a"), FailingReader()]).messages():
+            received.append(msg.data)
+    assert sorted(received) == sorted(messages)
+
+    async def read():
+        async for msg in FanInReader([quick_reader(node_a, name="a"), FailingReader()]).async_messages():
+            received.append(msg.data)
+
+    received = []
+    with pytest.raises(ConnectionError):
+        asyncio.run(read())
+    assert sorted(received) == sorted(messages)
+
+
+def test_file_store_node_readers(monkeypatch):
+    monkeypatch.setattr(config, "SSE_SERVERS", [config.BASE_SERVER, "10.0.0.2"])
+    reader = file_store.stream_reader("main", config.SSE_SERVER_MAIN_URL)
+    assert [node.server for node in reader.readers] == [config.SSE_SERVER_MAIN_URL,
+                                                     config.SSE_SERVER_MAIN_URL.replace(config.BASE_SERVER, "10.0.0.2")]
+    # The first node continues from the checkpoint of a single node
+    assert [node.checkpoint.path.name for node in reader.readers] == ["main.json", "main_10.0.0.2.json"]
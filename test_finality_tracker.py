@@ -0,0 +1,41 @@
+from finality_tracker import FinalityTracker
+
+WEIGHTS = {f"01{index:064x}": 10 for index in range(10)}
+VALIDATORS = list(WEIGHTS)
+
+
+def test_duplicate_signatures_counted_once():
+    tracker = FinalityTracker()
+    tracker.add_era(5, WEIGHTS)
+    for validator in VALIDATORS[:6]:
+        for _ in range(3):
+            assert not tracker.add_signature(5, "aa", validator)
+    assert tracker.signed_weight("aa") == 60
+    assert tracker.duplicates == 12
+    assert not tracker.add_signature(5, "aa", "01unknown")
+    assert tracker.unknown_validators == 1
+
+    # 70 of 100 is over 0.67
+    assert tracker.add_signature(5, "aa", VALIDATORS[6])
+    assert tracker.is_finalized("aa")
+    assert tracker.pending_blocks == 0
+    assert not tracker.add_signature(5, "aa", VALIDATORS[7])
+
+
+def test_old_eras_and_finalized_evicted():
+    tracker = FinalityTracker(finalized_memory=2)
+    tracker.add_era(5, WEIGHTS)
+    tracker.add_era(6, WEIGHTS)
+    tracker.add_signature(5, "aa", VALIDATORS[0])
+    tracker.add_signature(6, "bb", VALIDATORS[0])
+    assert tracker.pending_blocks == 2
+
+    tracker.add_era(7, WEIGHTS)
+    assert not tracker.has_era(5)
+    assert tracker.signed_weight("aa") is None
+    assert tracker.pending_blocks == 1
+
+    for block_hash in ("cc", "dd", "ee"):
+        for validator in VALIDATORS[:7]:
+            tracker.add_signature(7, block_hash, validator)
+    assert [tracker.is_finalized(block_hash) for block_hash in ("cc", "dd", "ee")] == [False, True, True]
@@ -0,0 +1,61 @@
+from finsig_backfill import FinsigBackfill, blocks_missing_finsigs
+from node_rpc import RpcClient
+
+PROOFS = [{"public_key": f"01{key:064x}", "signature": f"01{key:0128x}"} for key in range(3)]
+
+
+def make_store(data_dir, rpc_handler):
+    for era_id, block_hash in ((1, "a1"), (1, "a2"), (2, "b1"), (2, "missing")):
+        (data_dir / f"era_{era_id}").mkdir(parents=True, exist_ok=True)
+        (data_dir / f"era_{era_id}" / f"block-{block_hash}").write_text("{}")
+        rpc_handler.blocks[block_hash] = {"hash": block_hash, "header": {"era_id": era_id}, "proofs": PROOFS}
+    (data_dir / "era_1" / "a2").mkdir()
+    (data_dir / "era_1" / "a2" / "finsig-a2-01").write_text("{}")
+    (data_dir / "era_2" / "b1").mkdir()
+    (data_dir / "era_2" / "b1" / "deploy-d1").write_text("{}")
+
+
+def test_missing_index_and_resume(tmp_path, rpc_url, rpc_handler):
+    data_dir = tmp_path / "events"
+    make_store(data_dir, rpc_handler)
+    assert blocks_missing_finsigs(data_dir) == [(1, "a1"), (2, "b1"), (2, "missing")]
+
+    backfill = FinsigBackfill(data_dir, tmp_path / "state", RpcClient(rpc_url), workers=2, batch_size=2)
+    assert backfill.run() == {"blocks": 3, "done": 2, "failed": 1, "finsigs": 6}
+    for era_id, block_hash in ((1, "a1"), (2, "b1")):
+        block_dir = data_dir / f"era_{era_id}" / block_hash
+        assert sorted(path.name for path in block_dir.glob("finsig-*")) == [
+            f"finsig-{block_hash}-{proof['public_key']}" for proof in PROOFS]
+    assert blocks_missing_finsigs(data_dir) == [(2, "missing")]
+
+    # Completed run leaves no index, so the next run scans again and retries only the failed block
+    assert not (tmp_path / "state" / "finsig_backfill.index").exists()
+    rpc_handler.methods = []
+    backfill = FinsigBackfill(data_dir, tmp_path / "state", RpcClient(rpc_url))
+    assert backfill.run() == {"blocks": 1, "done": 0, "failed": 1, "finsigs": 0}
+    assert rpc_handler.methods == ["chain_get_block"]
+
+
+def test_blocks_stored_after_a_run_are_found(tmp_path, rpc_url, rpc_handler):
+    data_dir = tmp_path / "events"
+    make_store(data_dir, rpc_handler)
+    rpc_handler.blocks.pop("missing")
+    FinsigBackfill(data_dir, tmp_path / "state", RpcClient(rpc_url)).run()
+
+    (data_dir / "era_2" / "block-b2").write_text("{}")
+    rpc_handler.blocks["b2"] = {"hash": "b2", "header": {"era_id": 2}, "proofs": PROOFS}
+    result = FinsigBackfill(data_dir, tmp_path / "state", RpcClient(rpc_url)).run()
+    assert result == {"blocks": 2, "done": 1, "failed": 1, "finsigs": 3}
+    assert blocks_missing_finsigs(data_dir) == [(2, "missing")]
+
+
+def test_interrupted_run_resumes_from_index(tmp_path, rpc_url, rpc_handler):
+    data_dir = tmp_path / "events"
+    make_store(data_dir, rpc_handler)
+    state_dir = tmp_path / "state"
+    state_dir.mkdir()
+    # Index and done file as left by a run stopped after its first batch
+    (state_dir / "finsig_backfill.index").write_text("1 a1\n2 b1\n")
+    (state_dir / "finsig_backfill.done").write_text("a1\n")
+    result = FinsigBackfill(data_dir, state_dir, RpcClient(rpc_url)).run()
+    assert result == {"blocks": 1, "done": 1, "failed": 0, "finsigs": 3}
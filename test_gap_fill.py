@@ -0,0 +1,171 @@
+import json
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from gap_fill import GapFiller, Gaps, GapTracker
+from message_structure import MessageData
+from node_rpc import RpcClient
+from rpc_cache import RpcCache
+from synthetic_events import SyntheticChain
+
+
+class ChainRpcHandler(BaseHTTPRequestHandler):
+    """ chain_get_block by hash or height and info_get_deploy, from the events of a SyntheticChain """
+    protocol_version = "HTTP/1.1"
+    blocks = {}
+    heights = {}
+    deploys = {}
+
+    @classmethod
+    def load(cls, events: list):
+        cls.blocks, cls.heights, cls.deploys = {}, {}, {}
+        accepted = {}
+        for event in events:
+            if "BlockAdded" in event:
+                block = dict(event["BlockAdded"]["block"], proofs=[])
+                cls.blocks[block["hash"]] = block
+                cls.heights[block["header"]["height"]] = block
+            elif "FinalitySignature" in event:
+                fin_sig = event["FinalitySignature"]
+                cls.blocks[fin_sig["block_hash"]]["proofs"].append(
+                    {"public_key": fin_sig["public_key"], "signature": fin_sig["signature"]})
+            elif "DeployAccepted" in event:
+                accepted[event["DeployAccepted"]["hash"]] = event["DeployAccepted"]
+            elif "DeployProcessed" in event:
+                processed = event["DeployProcessed"]
+                cls.deploys[processed["deploy_hash"]] = {
+                    "deploy": accepted[processed["deploy_hash"]],
+                    "execution_results": [{"block_hash": processed["block_hash"],
+                                           "result": processed["execution_result"]}]}
+
+    def _response(self, request):
+        if request["method"] == "info_get_deploy":
+            result = self.deploys[request["params"][0]]
+        else:
+            identifier = request["params"][0]
+            if "Hash" in identifier:
+                result = {"block": self.blocks.get(identifier["Hash"])}
+            else:
+                result = {"block": self.heights.get(identifier["Height"])}
+        return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if isinstance(request, list):
+            body = json.dumps([self._response(r) for r in request]).encode()
+        else:
+            body = json.dumps(self._response(request)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def chain():
+    return SyntheticChain(validators=10, eras=2, blocks_per_era=10, transforms_per_deploy=1, seed=3)
+
+
+@pytest.fixture
+def chain_rpc_url(chain, serve_rpc):
+    ChainRpcHandler.load(list(chain.events()))
+    return serve_rpc(ChainRpcHandler)
+
+
+def drop_events(chain):
+    """ Stream events without the block at height 4, signatures of height 7 and a deploy of height 9 """
+    events = list(chain.events())
+    blocks = {event["BlockAdded"]["block"]["header"]["height"]: event["BlockAdded"]
+              for event in events if "BlockAdded" in event}
+    lost_deploy = blocks[9]["block"]["body"]["deploy_hashes"][0]
+    kept, lost = [], []
+    for event in events:
+        if ("BlockAdded" in event and event["BlockAdded"]["block"]["header"]["height"] == 4 or
+                "FinalitySignature" in event and event["FinalitySignature"]["block_hash"] in
+                (blocks[4]["block_hash"], blocks[7]["block_hash"]) or
+                "DeployProcessed" in event and (event["DeployProcessed"]["block_hash"] == blocks[4]["block_hash"] or
+                                                event["DeployProcessed"]["deploy_hash"] == lost_deploy)):
+            lost.append(event)
+        else:
+            kept.append(event)
+    return kept, lost, blocks, lost_deploy
+
+
+def test_tracker_finds_gaps(chain):
+    kept, lost, blocks, lost_deploy = drop_events(chain)
+    tracker = GapTracker(settle_blocks=3)
+    for event in kept:
+        tracker.observe(MessageData(json.dumps(event), lazy=True), "main")
+
+    gaps = tracker.take_gaps()
+    assert gaps.heights == [4]
+    assert gaps.unsigned_blocks == [blocks[7]["block_hash"]]
+    assert gaps.deploys == [lost_deploy]
+    assert not tracker.take_gaps()
+
+
+def test_late_block_is_not_a_gap():
+    tracker = GapTracker(settle_blocks=100)
+    for height in (0, 1, 3, 2, 4):
+        tracker.block_added(height, f"hash-{height}", ())
+    assert not tracker.take_gaps()
+
+
+def test_skipped_ids_counted():
+    tracker = GapTracker()
+    step = MessageData(json.dumps({"Step": {"era_id": 1, "execution_effect": {}}}), lazy=True)
+    for msg_id in (10, 11, 15, 16, 0, 1):
+        tracker.observe(step, "main", str(msg_id))
+    assert tracker.skipped_ids == 3
+
+
+def test_fill_fetches_only_lost_events(chain, chain_rpc_url):
+    kept, lost, _, _ = drop_events(chain)
+    tracker = GapTracker(settle_blocks=3)
+    for event in kept:
+        tracker.observe(MessageData(json.dumps(event), lazy=True), "main")
+    client = RpcClient(chain_rpc_url, batch_size=5)
+
+    events, unfilled = GapFiller(client, workers=2, batch_size=5).fill(tracker.take_gaps())
+
+    assert not unfilled
+    filled = [json.loads(contents) for contents in events]
+    assert sorted(map(json.dumps, filled)) == sorted(map(json.dumps, lost))
+    # Filled events complete the stream, so no gaps are found again
+    for contents in events:
+        tracker.observe(MessageData(contents, lazy=True), "gap_fill")
+    assert not tracker.take_gaps()
+
+
+def test_unfilled_gaps_retried_up_to_max_attempts():
+    tracker = GapTracker(settle_blocks=100, max_attempts=2)
+    for height in (0, 1, 4):
+        tracker.block_added(height, f"hash-{height}", ())
+    gaps = tracker.take_gaps()
+    assert gaps.heights == [2, 3]
+    # Height 2 filled, 3 not
+    tracker.retry(gaps, Gaps([3], [], ["deploy-a"]))
+    gaps = tracker.take_gaps()
+    assert gaps == Gaps([3], [], ["deploy-a"])
+    tracker.retry(gaps, gaps)
+    assert not tracker.take_gaps()
+    assert tracker.given_up == 2
+
+
+def test_block_without_signatures_stays_unfilled(chain, chain_rpc_url, tmp_path):
+    block_hash = next(iter(ChainRpcHandler.blocks))
+    proofs = ChainRpcHandler.blocks[block_hash]["proofs"]
+    ChainRpcHandler.blocks[block_hash]["proofs"] = []
+    filler = GapFiller(RpcClient(chain_rpc_url, cache=RpcCache(tmp_path)), workers=1)
+
+    events, unfilled = filler.fill(Gaps([], [block_hash], []))
+    assert events == [] and unfilled.unsigned_blocks == [block_hash]
+    # Signatures added later are fetched, not the block cached without them
+    ChainRpcHandler.blocks[block_hash]["proofs"] = proofs
+    events, unfilled = filler.fill(unfilled)
+    assert len(events) == len(proofs) and not unfilled
@@ -0,0 +1,77 @@
+import json
+
+from message_structure import MessageData
+
+BLOCK_HASH = "fcc5e8f8672f44f3531c2a0498aefd0397c2bcbc4660a7542e04431617ff749d"
+DEPLOY_HASH = "558eeb213af94495765cbf05aee26589d9ec4a7f3a4fb5680fa23a2ba8ecd22e"
+PUBLIC_KEY = "01b99d5f54a5147ee34f472d546d84037007025df5e1a13cfdca7aac05e9ac5858"
+
+MESSAGES = [
+    {"ApiVersion": "1.0.0"},
+    {"BlockAdded": {
+        "block_hash": BLOCK_HASH,
+        "block": {"hash": BLOCK_HASH,
+                  "header": {"parent_hash": "aa" * 32,
+                             "era_end": {"era_report": {"equivocators": [], "rewards": [], "inactive_validators": []},
+                                         "next_era_validator_weights": [{"validator": PUBLIC_KEY, "weight": "10"}]},
+                             "timestamp": "2021-03-22T13:11:41.312Z", "era_id": 67, "height": 16495},
+                  "body": {"proposer": PUBLIC_KEY, "deploy_hashes": [DEPLOY_HASH, "bb" * 32],
+                           "transfer_hashes": []}}}},
+    {"DeployProcessed": {
+        "deploy_hash": DEPLOY_HASH, "account": PUBLIC_KEY, "timestamp": "2021-03-22T12:59:47.939Z", "ttl": "1h",
+        "dependencies": ["cc" * 32], "block_hash": BLOCK_HASH,
+        "execution_result": {"Success": {"effect": {"transforms": [
+            {"key": "transfer-1", "transform": {"WriteTransfer": {"deploy_hash": "dd" * 32, "block_hash": "ee" * 32}}}
+        ]}}}}},
+    {"DeployAccepted": {"hash": DEPLOY_HASH, "header": {"account": PUBLIC_KEY, "body_hash": "ff" * 32}}},
+    {"FinalitySignature": {"block_hash": BLOCK_HASH, "era_id": 67, "signature": "01" + "ab" * 64,
+                           "public_key": PUBLIC_KEY}},
+    {"Step": {"era_id": 67, "execution_effect": {"operations": [], "transforms": []}}},
+]
+
+
+def test_lazy_routing_fields_match_eager_parse():
+    for message in MESSAGES:
+        for separators in ((",", ":"), (", ", ": ")):
+            json_str = json.dumps(message, separators=separators)
+            eager = MessageData(json_str)
+            lazy = MessageData(json_str, lazy=True)
+            assert lazy.message_type == eager.message_type
+            assert lazy.era_id == eager.era_id
+            if not eager.is_api_version:
+                assert lazy.primary_key == eager.primary_key
+                assert lazy.block_hash == eager.block_hash
+            assert list(lazy.get_deploy_hashes()) == list(eager.get_deploy_hashes())
+            assert list(lazy.get_transfer_hashes()) == list(eager.get_transfer_hashes())
+            assert lazy.data == eager.data
+
+
+def test_lazy_does_not_parse_for_routing():
+    lazy = MessageData(json.dumps(MESSAGES[2]), lazy=True)
+    assert lazy.primary_key == f"deploy-{DEPLOY_HASH}"
+    assert lazy.block_hash == BLOCK_HASH
+    assert lazy._data is None
+    for message in MESSAGES[3], MESSAGES[5]:
+        lazy = MessageData(json.dumps(message), lazy=True)
+        assert lazy.block_hash is None
+        assert lazy._raw is None
+
+
+def test_typed_events():
+    block = MessageData(json.dumps(MESSAGES[1])).event
+    assert (block.block_hash, block.era_id, block.height, block.proposer) == (BLOCK_HASH, 67, 16495, PUBLIC_KEY)
+    assert block.deploy_hashes == (DEPLOY_HASH, "bb" * 32)
+    assert block.is_switch_block
+    assert block.next_era_validator_weights == {PUBLIC_KEY: 10}
+
+    lazy = MessageData(json.dumps(MESSAGES[4]), lazy=True)
+    fin_sig = lazy.event
+    assert (fin_sig.block_hash, fin_sig.era_id, fin_sig.public_key) == (BLOCK_HASH, 67, PUBLIC_KEY)
+    # Built from the parsed json, without a NestedDict
+    assert lazy._data is None
+
+    # Unknown types and data not matching the schema stay on the NestedDict path
+    assert MessageData(json.dumps({"Unknown": {"era_id": 1}})).event is None
+    broken = MessageData(json.dumps({"FinalitySignature": {"era_id": 1}}))
+    assert broken.event is None
+    assert broken.data["era_id"] == 1
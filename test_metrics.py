@@ -0,0 +1,73 @@
+import random
+import urllib.request
+
+import pytest
+
+import metrics
+from event_stream_reader import file_message_streamer, file_message_streamer_with_disconnects
+from node_rpc import RpcClient, RpcError
+from test_checkpoint_resume import write_dump_file
+
+
+@pytest.fixture
+def enabled():
+    metrics.reset()
+    metrics.enable()
+    yield
+    metrics.enable(False)
+    metrics.reset()
+
+
+def test_disabled_records_nothing(tmp_path, quick_reader):
+    metrics.reset()
+    dump_file = tmp_path / "events_dump"
+    write_dump_file(dump_file, 10)
+    assert len(list(quick_reader(str(dump_file), 0, file_message_streamer, name="main").messages())) == 10
+    assert metrics.LAST_MSG_ID.value("main") is None
+
+
+def test_stream_metrics(tmp_path, quick_reader, enabled):
+    random.seed(120)
+    dump_file = tmp_path / "events_dump"
+    write_dump_file(dump_file, 2000)
+    reader = quick_reader(str(dump_file), 0, file_message_streamer_with_disconnects, name="main")
+    assert len(list(reader.messages())) == 2000
+    assert metrics.LAST_MSG_ID.value("main") == 1999
+    # Disconnects, then the stream ends each time until reconnects run out
+    assert metrics.RECONNECTS.value("main") > reader.RECONNECT_COUNT
+    assert metrics.DISCONNECTED.value("main") > 0
+
+
+def test_histogram_exposition(enabled):
+    for value in (0.00002, 0.0002, 0.0002, 20):
+        metrics.WRITE_SECONDS.observe(value, "DirectoryStore")
+    text = metrics.expose()
+    assert "# TYPE casper_events_write_seconds histogram" in text
+    assert 'casper_events_write_seconds_bucket{store="DirectoryStore",le="5e-05"} 1' in text
+    assert 'casper_events_write_seconds_bucket{store="DirectoryStore",le="0.0005"} 3' in text
+    assert 'casper_events_write_seconds_bucket{store="DirectoryStore",le="+Inf"} 4' in text
+    assert 'casper_events_write_seconds_count{store="DirectoryStore"} 4' in text
+
+
+def test_rpc_metrics_and_endpoint(rpc_url, rpc_handler, enabled):
+    client = RpcClient(rpc_url, retries=0)
+    client.get_block(block_hash="a")
+    rpc_handler.fail_first = rpc_handler.posts + 1
+    with pytest.raises(RpcError):
+        client.get_block(block_hash="b")
+    assert metrics.RPC_SECONDS.count("chain_get_block") == 1
+    assert metrics.RPC_ERRORS.value("chain_get_block") == 1
+
+    server = metrics.start_server(port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        text = urllib.request.urlopen(url).read().decode()
+    finally:
+        server.shutdown()
+    assert 'casper_events_rpc_errors_total{method="chain_get_block"} 1' in text
+
+
+def test_block_lag_timestamps(enabled):
+    metrics.observe_block_lag("main", "2021-03-22T13:11:41.312Z")
+    metrics.observe_block_lag("main", "2021-03-22T13:11:41Z")
+    assert metrics.BLOCK_LAG.count("main") == 2
@@ -0,0 +1,33 @@
+import pytest
+
+from node_rpc import RpcClient, RpcError
+
+
+def test_calls_reuse_connection(rpc_url, rpc_handler):
+    client = RpcClient(rpc_url)
+    for block in range(20):
+        assert client.get_block(block_hash=str(block)) == {"block": {"hash": str(block)}}
+    assert rpc_handler.connections == 1
+    with pytest.raises(RpcError) as error:
+        client.get_block(block_hash="missing")
+    assert error.value.code == -32001
+
+
+def test_batch_in_order_with_errors(rpc_url, rpc_handler):
+    client = RpcClient(rpc_url, batch_size=4)
+    hashes = ["a", "b", "missing", "c", "d", "e"]
+    results = client.get_blocks(hashes)
+    assert rpc_handler.posts == 2
+    assert [r["block"]["hash"] for r in results if not isinstance(r, RpcError)] == ["a", "b", "c", "d", "e"]
+    assert isinstance(results[2], RpcError)
+
+
+def test_retry_with_backoff(rpc_url, rpc_handler):
+    rpc_handler.fail_first = 2
+    client = RpcClient(rpc_url, retries=2, backoff_sec=0.01)
+    assert client.get_block(block_hash="a") == {"block": {"hash": "a"}}
+
+    rpc_handler.posts, rpc_handler.fail_first = 0, 3
+    with pytest.raises(RpcError):
+        client.get_block(block_hash="a")
+    assert rpc_handler.posts == 3
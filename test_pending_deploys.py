@@ -0,0 +1,100 @@
+import json
+
+from directory_store import DirectoryStore, PENDING_JOURNAL
+from message_structure import MessageData
+from pending_deploys import PendingDeploys
+from test_message_structure import BLOCK_HASH, DEPLOY_HASH, MESSAGES
+from test_segment_log_store import STREAM_ORDER, directory_files
+
+BLOCK_DIR = f"era_67/{BLOCK_HASH}"
+FINAL_FILES = {f"era_67/block-{BLOCK_HASH}", f"{BLOCK_DIR}/deploy-{DEPLOY_HASH}",
+               f"{BLOCK_DIR}/deploy-accepted-{DEPLOY_HASH}"}
+
+
+def save(store, messages):
+    for message in messages:
+        contents = json.dumps(message)
+        store.save_message(MessageData(contents, lazy=True), contents)
+
+
+def test_deploys_before_and_after_block(tmp_path):
+    # Deploys before block are held in memory, not staged on disk
+    store = DirectoryStore(tmp_path / "before")
+    save(store, STREAM_ORDER[:2])
+    assert len(store.pending) == 2
+    assert directory_files(tmp_path / "before") == {}
+    save(store, STREAM_ORDER[2:3])
+    assert len(store.pending) == 0
+    assert set(directory_files(tmp_path / "before")) == FINAL_FILES
+
+    # Deploys after block go straight to their block directory
+    store = DirectoryStore(tmp_path / "after")
+    save(store, [MESSAGES[1], MESSAGES[3], MESSAGES[2]])
+    assert directory_files(tmp_path / "after") == directory_files(tmp_path / "before")
+
+
+def test_expired_deploys_spill_and_move(tmp_path):
+    store = DirectoryStore(tmp_path, PendingDeploys(ttl_sec=0))
+    save(store, STREAM_ORDER[:2])
+    assert set(directory_files(tmp_path)) == {f"{BLOCK_HASH}/deploy-{DEPLOY_HASH}",
+                                              f"deploy_accepted/deploy-accepted-{DEPLOY_HASH}"}
+    save(store, STREAM_ORDER[2:3])
+    assert set(directory_files(tmp_path)) == FINAL_FILES
+
+
+def test_close_spills_for_next_run(tmp_path):
+    store = DirectoryStore(tmp_path)
+    save(store, STREAM_ORDER[:2])
+    store.close()
+    assert len(directory_files(tmp_path)) == 2
+
+    # Spilled deploys are found at startup and moved when the block arrives
+    store = DirectoryStore(tmp_path)
+    save(store, STREAM_ORDER[2:3])
+    assert set(directory_files(tmp_path)) == FINAL_FILES
+
+
+def save_batch(store, messages):
+    store.save_batch((MessageData(json.dumps(message), lazy=True), json.dumps(message)) for message in messages)
+
+
+def test_pending_deploys_survive_crash(tmp_path):
+    store = DirectoryStore(tmp_path)
+    save_batch(store, STREAM_ORDER[:2])
+    assert (tmp_path / PENDING_JOURNAL).exists()
+    # Process dies without close, the next run replays the journal
+    store = DirectoryStore(tmp_path)
+    assert len(store.pending) == 2
+    assert directory_files(tmp_path) == {}
+    save_batch(store, STREAM_ORDER[2:3])
+    assert set(directory_files(tmp_path)) == FINAL_FILES
+    # Nothing pending, so no journal
+    assert not (tmp_path / PENDING_JOURNAL).exists()
+    assert len(DirectoryStore(tmp_path).pending) == 0
+
+
+def test_journal_skips_spilled_and_compacts(tmp_path):
+    pending = PendingDeploys()
+    store = DirectoryStore(tmp_path, pending)
+    store.journal.compact_bytes = 1
+    save_batch(store, STREAM_ORDER[:2])
+    # Compacted to the two pending entries
+    assert len((tmp_path / PENDING_JOURNAL).read_text().splitlines()) == 2
+
+    pending.ttl_sec = 0
+    save_batch(store, [MESSAGES[5]])
+    assert len(DirectoryStore(tmp_path).pending) == 0
+    assert set(directory_files(tmp_path)) == {f"{BLOCK_HASH}/deploy-{DEPLOY_HASH}",
+                                              f"deploy_accepted/deploy-accepted-{DEPLOY_HASH}", "era_67/step-67"}
+
+
+def test_store_without_journal_leaves_it_alone(tmp_path):
+    store = DirectoryStore(tmp_path)
+    save_batch(store, STREAM_ORDER[:2])
+    journal = (tmp_path / PENDING_JOURNAL).read_text()
+    # A second store on the same directory, such as the finality signature backfill
+    other = DirectoryStore(tmp_path, journal=False)
+    assert len(other.pending) == 0
+    save_batch(other, [MESSAGES[5]])
+    other.close()
+    assert (tmp_path / PENDING_JOURNAL).read_text() == journal
@@ -0,0 +1,45 @@
+import threading
+
+from reconcile import Reconciler
+
+BLOCKS = {f"{block:064x}": 10 + block for block in range(3)}
+# Ten executed deploys per block and two not yet executed
+EXECUTED = {f"{deploy:064x}": list(BLOCKS)[deploy % 3] for deploy in range(100, 130)}
+NOT_EXECUTED = [f"{deploy:064x}" for deploy in range(200, 202)]
+
+
+def test_reconcile_against_stub_rpc(tmp_path, rpc_url, rpc_handler):
+    accepted_dir = tmp_path / "deploy_accepted"
+    accepted_dir.mkdir()
+    for deploy_hash in list(EXECUTED) + NOT_EXECUTED:
+        (accepted_dir / f"deploy-accepted-{deploy_hash}").write_text("{}")
+
+    rpc_handler.blocks = {block_hash: {"hash": block_hash, "header": {"era_id": era_id}}
+                          for block_hash, era_id in BLOCKS.items()}
+    rpc_handler.executed = dict(EXECUTED, **{deploy_hash: None for deploy_hash in NOT_EXECUTED})
+    counts = Reconciler(tmp_path, rpc_url, concurrency=8).run()
+
+    assert counts == {"moved": 30, "not_executed": 2, "error": 0}
+    # Each block fetched once
+    assert rpc_handler.methods.count("chain_get_block") == 3
+    assert rpc_handler.methods.count("info_get_deploy") == 32
+    for deploy_hash, block_hash in EXECUTED.items():
+        assert (tmp_path / f"era_{BLOCKS[block_hash]}" / block_hash / f"deploy-accepted-{deploy_hash}").exists()
+    assert sorted(path.name for path in accepted_dir.iterdir()) == [f"deploy-accepted-{h}" for h in NOT_EXECUTED]
+
+
+def test_reconcile_stops_when_asked(tmp_path, rpc_url, rpc_handler):
+    accepted_dir = tmp_path / "deploy_accepted"
+    accepted_dir.mkdir()
+    for deploy_hash in EXECUTED:
+        (accepted_dir / f"deploy-accepted-{deploy_hash}").write_text("{}")
+    rpc_handler.blocks = {block_hash: {"hash": block_hash, "header": {"era_id": era_id}}
+                          for block_hash, era_id in BLOCKS.items()}
+    rpc_handler.executed = EXECUTED
+    stop = threading.Event()
+    stop.set()
+    counts = Reconciler(tmp_path, rpc_url, concurrency=1, stop=stop).run()
+
+    assert sum(counts.values()) == 1
+    # Files not started are left for the next run
+    assert len(list(accepted_dir.iterdir())) >= len(EXECUTED) - 2
@@ -0,0 +1,70 @@
+from node_rpc import RpcClient
+from rpc_cache import BLOCK, RpcCache
+
+
+def block(block_hash, padding=0):
+    return {"block": {"hash": block_hash, "body": "x" * padding}}
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    cache = RpcCache(tmp_path, memory_entries=2)
+    for block_hash in ("aa01", "aa02", "bb03"):
+        cache.put(BLOCK, block_hash, block(block_hash))
+
+    assert cache.get(BLOCK, "bb03") == block("bb03")
+    # Pushed out of memory, read from disk
+    assert cache.get(BLOCK, "aa01") == block("aa01")
+    assert cache.get(BLOCK, "cc04") is None
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+
+    # Disk entries are found again after restart
+    cache = RpcCache(tmp_path)
+    assert cache.stats()["disk_entries"] == 3
+    assert cache.get(BLOCK, "aa02") == block("aa02")
+    assert cache.disk_hits == 1
+
+
+def test_disk_evicts_least_recently_used(tmp_path):
+    size = len('{"block": {"hash": "aa00", "body": ""}}') + 100
+    cache = RpcCache(tmp_path, memory_entries=0, max_disk_bytes=3 * size)
+    for block_hash in ("aa00", "aa01", "aa02"):
+        cache.put(BLOCK, block_hash, block(block_hash, 100))
+    cache.get(BLOCK, "aa00")
+    cache.put(BLOCK, "aa03", block("aa03", 100))
+
+    assert cache.evictions == 1
+    assert cache.disk_bytes <= 3 * size
+    assert cache.get(BLOCK, "aa01") is None
+    assert not (tmp_path / BLOCK / "aa" / "aa01.json").exists()
+    assert cache.get(BLOCK, "aa00") is not None
+
+
+def test_client_caches_only_immutable_results(tmp_path, rpc_url, rpc_handler):
+    client = RpcClient(rpc_url, cache=RpcCache(tmp_path))
+    for _ in range(2):
+        client.get_block(block_hash="aa01")
+        client.get_block()
+        client.get_deploy("executed")
+        client.get_deploy("pending")
+    # Latest block and pending deploy are fetched each time
+    assert rpc_handler.methods.count("chain_get_block") == 3
+    assert rpc_handler.methods.count("info_get_deploy") == 3
+
+    posts = rpc_handler.posts
+    results = client.get_blocks(["aa01", "aa02", "aa03"])
+    assert [result["block"]["hash"] for result in results] == ["aa01", "aa02", "aa03"]
+    assert rpc_handler.posts == posts + 1
+    assert rpc_handler.methods.count("chain_get_block") == 5
+
+
+def test_blocks_cached_without_proofs(tmp_path, rpc_url, rpc_handler):
+    client = RpcClient(rpc_url, cache=RpcCache(tmp_path))
+    rpc_handler.blocks["aa01"] = {"hash": "aa01", "header": {"era_id": 1}, "proofs": []}
+    client.get_block(block_hash="aa01")
+    # Signatures added after the block was cached
+    rpc_handler.blocks["aa01"]["proofs"] = [{"public_key": "01ab", "signature": "01cd"}]
+    assert "proofs" not in client.get_block(block_hash="aa01")["block"]
+    assert client.get_block(block_hash="aa01", proofs=True)["block"]["proofs"] == rpc_handler.blocks["aa01"]["proofs"]
+    assert client.get_blocks(["aa01"], proofs=True)[0]["block"]["proofs"] == rpc_handler.blocks["aa01"]["proofs"]
+    assert rpc_handler.methods.count("chain_get_block") == 3
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import threading
+
+from catalog import Catalog
+from directory_store import DirectoryStore, TMP_PREFIX
+from message_structure import MessageData
+from seen_events import BloomFilter, SeenEvents
+from segment_log_store import SegmentLogStore
+from synthetic_events import SyntheticChain
+from write_behind import WriteBehindQueue
+
+
+def chain_messages(seed: int = 0) -> list:
+    chain = SyntheticChain(validators=5, eras=4, blocks_per_era=3, transforms_per_deploy=1, seed=seed)
+    return [(MessageData(contents, lazy=True), contents) for contents in chain.messages()]
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(1000, 0.01)
+    keys = [f"key-{number}" for number in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other-{number}" in bloom for number in range(10000))
+    assert false_positives < 300
+
+
+def test_old_eras_need_confirm():
+    seen = SeenEvents(recent_eras=2, bloom=BloomFilter(1000, 0.01))
+    seen.add_keys([(1, "step-1"), (2, "step-2"), (3, "step-3"), (None, "deploy-a")])
+    step_1 = MessageData(json.dumps({"Step": {"era_id": 1, "execution_effect": {}}}), lazy=True)
+    step_3 = MessageData(json.dumps({"Step": {"era_id": 3, "execution_effect": {}}}), lazy=True)
+
+    assert seen.is_stored(step_3)
+    # Era 1 is only in the Bloom filter, so it is skipped only once confirmed
+    assert not seen.is_stored(step_1)
+    seen.confirm = lambda data: True
+    assert seen.is_stored(step_1)
+    assert seen.skipped == 2
+    assert len(seen) == 4
+
+
+def test_confirm_runs_off_the_event_loop():
+    seen = SeenEvents(recent_eras=1, bloom=BloomFilter(1000, 0.01))
+    seen.add_keys([(1, "step-1"), (2, "step-2")])
+    step_1 = MessageData(json.dumps({"Step": {"era_id": 1, "execution_effect": {}}}), lazy=True)
+    step_2 = MessageData(json.dumps({"Step": {"era_id": 2, "execution_effect": {}}}), lazy=True)
+    confirm_threads = []
+
+    def confirm(data):
+        confirm_threads.append(threading.current_thread())
+        return True
+    seen.confirm = confirm
+
+    async def check():
+        return await seen.is_stored_async(step_2), await seen.is_stored_async(step_1)
+
+    assert asyncio.run(check()) == (True, True)
+    # Only the Bloom filter hit is confirmed, on an executor thread
+    assert len(confirm_threads) == 1 and confirm_threads[0] is not threading.main_thread()
+    assert seen.skipped == 2
+
+
+def test_faults_never_skipped():
+    seen = SeenEvents(bloom=BloomFilter(1000, 0.01))
+    fault = MessageData(json.dumps({"Fault": {"era_id": 1, "public_key": "01ab", "timestamp": "t"}}), lazy=True)
+    seen.add(fault)
+    assert not seen.is_stored(fault)
+
+
+def test_rebuilt_from_directory_store(tmp_path):
+    messages = chain_messages()
+    catalog = Catalog(tmp_path / "catalog.sqlite")
+    store = DirectoryStore(tmp_path / "events", catalog=catalog)
+    store.save_batch(messages)
+    store.close()
+
+    store = DirectoryStore(tmp_path / "events", catalog=catalog)
+    seen = SeenEvents.from_store(store, recent_eras=1, bloom=BloomFilter(10000, 0.001))
+    assert all(seen.is_stored(data) for data, _ in messages)
+    assert seen.skipped == len(messages)
+    # Steps are keyed by era, so the same in any chain
+    assert not any(seen.is_stored(data) for data, _ in chain_messages(seed=1) if not data.is_step)
+
+
+def test_partly_written_file_not_seen(tmp_path):
+    messages = [(data, contents) for data, contents in chain_messages() if data.is_block_added]
+    store = DirectoryStore(tmp_path)
+    store.save_batch(messages[:1])
+    data, contents = messages[1]
+    # Left by a crash while writing, before the rename to its primary key
+    era_dir = tmp_path / f"era_{data.era_id}"
+    era_dir.mkdir(exist_ok=True)
+    (era_dir / f"{TMP_PREFIX}{data.primary_key}").write_text(contents[:10])
+
+    seen = SeenEvents.from_store(DirectoryStore(tmp_path))
+    assert seen.is_stored(messages[0][0])
+    assert not seen.is_stored(data)
+    assert not list(tmp_path.glob(f"*/{TMP_PREFIX}{messages[0][0].primary_key}"))
+
+
+def test_rebuilt_from_segment_log(tmp_path):
+    messages = chain_messages()
+    store = SegmentLogStore(tmp_path / "event_log")
+    store.save_batch(messages)
+    store.close()
+
+    store = SegmentLogStore(tmp_path / "event_log")
+    seen = SeenEvents.from_store(store, recent_eras=1, bloom=BloomFilter(10000, 0.001))
+    assert all(seen.is_stored(data) for data, _ in messages)
+    # Steps are keyed by era, so the same in any chain
+    assert not any(seen.is_stored(data) for data, _ in chain_messages(seed=1) if not data.is_step)
+    store.close()
+
+
+def test_added_once_saved(tmp_path):
+    messages = chain_messages()
+    store = SegmentLogStore(tmp_path / "event_log")
+    seen = SeenEvents(recent_eras=2, bloom=BloomFilter(1000, 0.01), confirm=store.is_stored)
+
+    async def run():
+        queue = WriteBehindQueue(store, flush_interval_sec=0.01, on_saved=seen.add_saved)
+        flusher = asyncio.create_task(queue.run())
+        for data, contents in messages:
+            await queue.put(data, contents)
+        await queue.drain()
+        flusher.cancel()
+
+    asyncio.run(run())
+    assert all(seen.is_stored(data) for data, _ in messages)
+    store.close()
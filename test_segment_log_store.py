@@ -0,0 +1,102 @@
+import json
+
+import directory_store
+from directory_store import DirectoryStore, PENDING_JOURNAL
+from message_structure import MessageData
+from segment_log_store import SegmentLogStore
+from test_message_structure import BLOCK_HASH, DEPLOY_HASH, MESSAGES, PUBLIC_KEY
+
+# DeployAccepted and DeployProcessed arrive before the block they are added in
+STREAM_ORDER = [MESSAGES[3], MESSAGES[2], MESSAGES[1], MESSAGES[4], MESSAGES[5]]
+KEYS = {f"deploy-accepted-{DEPLOY_HASH}", f"deploy-{DEPLOY_HASH}", f"block-{BLOCK_HASH}",
+        f"finsig-{BLOCK_HASH}-{PUBLIC_KEY}", "step-67"}
+
+
+def save_stream(store):
+    for message in STREAM_ORDER:
+        contents = json.dumps(message)
+        store.save_message(MessageData(contents, lazy=True), contents)
+
+
+def directory_files(root_dir):
+    """ Event files under root_dir, without the pending deploys journal """
+    return {str(path.relative_to(root_dir)): path.read_text() for path in root_dir.rglob("*")
+            if path.is_file() and path.name != PENDING_JOURNAL}
+
+
+def test_lookup_by_key_block_and_era(tmp_path):
+    store = SegmentLogStore(tmp_path / "log")
+    save_stream(store)
+
+    assert len(store) == 5
+    assert json.loads(store.get(f"deploy-{DEPLOY_HASH}")) == MESSAGES[2]
+    assert store.era_of_block(BLOCK_HASH) == 67
+    assert store.blocks_for_era(67) == [BLOCK_HASH]
+    assert set(store.keys_for_block(BLOCK_HASH)) == KEYS - {"step-67"}
+    assert set(store.keys_for_era(67)) == KEYS
+
+
+def test_reopen_and_recover_unindexed_records(tmp_path):
+    store = SegmentLogStore(tmp_path / "log")
+    save_stream(store)
+    store.close()
+    # Lose the last index lines, as with a crash between segment and index writes
+    index_path = tmp_path / "log" / "index.log"
+    lines = index_path.read_text().splitlines(keepends=True)
+    index_path.write_text("".join(lines[:2]) + lines[2][:10])
+
+    store = SegmentLogStore(tmp_path / "log")
+    assert set(store.keys_for_era(67)) == KEYS
+    # Already stored events are not appended again
+    save_stream(store)
+    assert len(list(store.messages())) == 5
+
+
+def test_segments_roll(tmp_path):
+    store = SegmentLogStore(tmp_path / "log")
+    store.SEGMENT_SIZE = 100
+    save_stream(store)
+    assert len(list((tmp_path / "log").glob("segment-*.log"))) == 5
+    assert json.loads(store.get(f"finsig-{BLOCK_HASH}-{PUBLIC_KEY}")) == MESSAGES[4]
+
+
+def test_export_matches_directory_store(tmp_path):
+    store = SegmentLogStore(tmp_path / "log")
+    save_stream(store)
+    store.export_to_directory(tmp_path / "exported")
+
+    directory_store = DirectoryStore(tmp_path / "direct")
+    save_stream(directory_store)
+
+    assert directory_files(tmp_path / "exported") == directory_files(tmp_path / "direct")
+
+
+def test_directory_batch_matches_single_saves(tmp_path):
+    DirectoryStore(tmp_path / "batch").save_batch(
+        (MessageData(json.dumps(message), lazy=True), json.dumps(message)) for message in STREAM_ORDER)
+    save_stream(DirectoryStore(tmp_path / "single"))
+
+    assert directory_files(tmp_path / "batch") == directory_files(tmp_path / "single")
+
+
+def test_export_writes_deploys_without_block(tmp_path):
+    store = SegmentLogStore(tmp_path / "log")
+    contents = json.dumps(MESSAGES[3])
+    store.save_message(MessageData(contents, lazy=True), contents)
+    store.export_to_directory(tmp_path / "exported")
+
+    assert directory_files(tmp_path / "exported") == {f"deploy_accepted/deploy-accepted-{DEPLOY_HASH}": contents}
+    # Not journaled, so it cannot replay into the journal of a file_store writing the same directory
+    assert not (tmp_path / "exported" / PENDING_JOURNAL).exists()
+
+
+def test_directory_flush_syncs_once_per_batch(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(directory_store, "sync_filesystem", synced.append)
+    root_dir = tmp_path / "direct"
+    store = DirectoryStore(root_dir)
+    store.save_batch((MessageData(json.dumps(message), lazy=True), json.dumps(message)) for message in STREAM_ORDER)
+    assert synced == [root_dir]
+    # Nothing written since
+    store.flush()
+    assert synced == [root_dir]
@@ -0,0 +1,57 @@
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+
+from event_types import FinalitySignature
+from signature_verifier import SignatureVerifier, signed_message, verify_signature
+
+BLOCK_HASH = "fcc5e8f8672f44f3531c2a0498aefd0397c2bcbc4660a7542e04431617ff749d"
+
+
+def ed25519_signature(block_hash: str, era_id: int):
+    key = ed25519.Ed25519PrivateKey.generate()
+    public_bytes = key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return "01" + public_bytes.hex(), "01" + key.sign(signed_message(block_hash, era_id)).hex()
+
+
+def secp256k1_signature(block_hash: str, era_id: int):
+    key = ec.generate_private_key(ec.SECP256K1())
+    public_bytes = key.public_key().public_bytes(serialization.Encoding.X962,
+                                                 serialization.PublicFormat.CompressedPoint)
+    r, s = decode_dss_signature(key.sign(signed_message(block_hash, era_id), ec.ECDSA(hashes.SHA256())))
+    return "02" + public_bytes.hex(), "02" + r.to_bytes(32, "big").hex() + s.to_bytes(32, "big").hex()
+
+
+def corrupt(signature: str) -> str:
+    """ Signature with its last byte changed """
+    return signature[:-2] + ("01" if signature.endswith("00") else "00")
+
+
+def test_verify_signature():
+    for sign in (ed25519_signature, secp256k1_signature):
+        public_key, signature = sign(BLOCK_HASH, 67)
+        assert verify_signature(BLOCK_HASH, 67, public_key, signature)
+        assert not verify_signature(BLOCK_HASH, 68, public_key, signature)
+        assert not verify_signature("00" * 32, 67, public_key, signature)
+        assert not verify_signature(BLOCK_HASH, 67, public_key, corrupt(signature))
+    assert not verify_signature(BLOCK_HASH, 67, "03" + "00" * 32, "01" + "00" * 64)
+    assert not verify_signature(BLOCK_HASH, 67, "01" + "zz" * 32, "01" + "00" * 64)
+
+
+def test_batches_on_process_pool():
+    signatures = []
+    for index in range(25):
+        public_key, signature = (ed25519_signature if index % 2 else secp256k1_signature)(BLOCK_HASH, 67)
+        if index % 5 == 0:
+            signature = corrupt(signature)
+        signatures.append(FinalitySignature.from_data({"block_hash": BLOCK_HASH, "era_id": 67,
+                                                       "signature": signature, "public_key": public_key}))
+    verifier = SignatureVerifier(workers=2, batch_size=10, max_delay_sec=10)
+    for fin_sig in signatures:
+        verifier.add(fin_sig)
+    verified = list(verifier.verified(wait=True))
+    verifier.close()
+    # Batches may complete in any order
+    assert sorted(fin_sig.public_key for fin_sig in verified) == sorted(
+        fin_sig.public_key for index, fin_sig in enumerate(signatures) if index % 5)
+    assert verifier.invalid == 5
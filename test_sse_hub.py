@@ -0,0 +1,145 @@
+import asyncio
+
+from event_stream_reader import EventStreamReader, async_file_message_streamer
+from sse_hub import ReplayBuffer, SSEHub
+from sse_parser import SSEFrameParser
+from synthetic_events import SyntheticChain
+
+
+def parse(chunk: bytes) -> list:
+    return [(msg.id, msg.data) for msg in SSEFrameParser().feed(chunk)]
+
+
+def test_replay_buffer_keeps_last_capacity():
+    buffer = ReplayBuffer(10)
+    for number in range(25):
+        buffer.append(f'{{"n":{number}}}')
+    assert buffer.first_id == 15
+    chunk, next_id = buffer.frames(15)
+    assert next_id == 25
+    assert parse(chunk) == [(str(msg_id), f'{{"n":{msg_id}}}') for msg_id in range(15, 25)]
+    assert buffer.frames(20, limit=3)[1] == 23
+
+
+def test_replay_buffer_spills_to_disk(tmp_path):
+    buffer = ReplayBuffer(10, tmp_path / "main.spill")
+    for number in range(25):
+        buffer.append(f'{{"n":{number}}}')
+    assert buffer.spill_end == 15
+    buffer.flush_spill()
+    chunk, next_id = buffer.read_spill(3, limit=5)
+    assert next_id == 8
+    assert [int(msg_id) for msg_id, _ in parse(chunk)] == list(range(3, 8))
+    chunk, next_id = buffer.read_spill(0)
+    assert next_id == 15
+    assert len(parse(chunk)) == 15
+    buffer.close()
+
+
+def test_replay_buffer_ids_continue_after_restart(tmp_path):
+    id_path = tmp_path / "main.ids"
+    buffer = ReplayBuffer(10, tmp_path / "main.spill", id_path, id_reserve=20)
+    assert [buffer.append(f'{{"n":{number}}}') for number in range(25)] == list(range(25))
+    buffer.close()
+    # Restarted after reserving ids up to 40, so no id a client has seen is used again
+    buffer = ReplayBuffer(10, tmp_path / "main.spill", id_path, id_reserve=20)
+    assert buffer.next_id == buffer.oldest_id == 40
+    for number in range(15):
+        buffer.append(f'{{"n":{number}}}')
+    assert buffer.first_id == buffer.spill_end == 45
+    buffer.flush_spill()
+    chunk, next_id = buffer.read_spill(0)
+    assert next_id == 45
+    assert [int(msg_id) for msg_id, _ in parse(chunk)] == list(range(40, 45))
+    buffer.close()
+
+
+def upstream_reader(dump_file) -> EventStreamReader:
+    esr = EventStreamReader(str(dump_file), 0, async_message_streamer=async_file_message_streamer, name="main")
+    # Dump file ends, so keep reconnecting for more while the test runs
+    esr.RECONNECT_DELAY_SEC = 0.05
+    return esr
+
+
+async def read_events(url: str, count: int, start_from: int = 0) -> list:
+    client = EventStreamReader(url, start_from)
+    events = []
+    async for msg in client.async_messages():
+        events.append((int(msg.id), msg.data))
+        if len(events) == count:
+            break
+    return events
+
+
+def run_hub(tmp_path, clients, chain=None, **hub_args):
+    chain = chain or SyntheticChain(validators=20, eras=2, blocks_per_era=5, transforms_per_deploy=2)
+    dump_file = tmp_path / "events_dump"
+    count = chain.write_dump(dump_file)
+    messages = list(chain.messages())
+
+    hub_args.setdefault("state_dir", None)
+
+    async def run():
+        hub = SSEHub({"main": upstream_reader(dump_file)}, **hub_args)
+        await hub.start("127.0.0.1", 0)
+        host, port = hub.addresses[0][:2]
+        try:
+            return hub, await asyncio.wait_for(clients(f"http://{host}:{port}/events/main", count, hub), 60)
+        finally:
+            await hub.stop()
+
+    return messages, asyncio.run(run())
+
+
+def test_clients_replay_from_start(tmp_path):
+    async def clients(url, count, hub):
+        return await asyncio.gather(*(read_events(url, count) for _ in range(20)))
+
+    messages, (hub, results) = run_hub(tmp_path, clients, buffer_size=100000)
+    for events in results:
+        assert events == list(enumerate(messages))
+    assert hub.clients["main"] == 0
+
+
+def test_replay_from_spill_and_start_from(tmp_path):
+    async def clients(url, count, hub):
+        while hub.buffers["main"].next_id < count:
+            await asyncio.sleep(0.01)
+        return await asyncio.gather(read_events(url, count), read_events(url, count - 40, start_from=40))
+
+    messages, (hub, (from_start, from_40)) = run_hub(tmp_path, clients, buffer_size=50, spill_dir=tmp_path / "spill")
+    assert from_start == list(enumerate(messages))
+    assert from_40 == list(enumerate(messages))[40:]
+
+
+def test_start_from_before_hub_restart_replays(tmp_path):
+    async def clients(url, count, hub):
+        while hub.buffers["main"].next_id < count:
+            await asyncio.sleep(0.01)
+        # A client that read further before the hub restarted
+        return await read_events(url, 10, start_from=count + 500)
+
+    messages, (hub, events) = run_hub(tmp_path, clients, buffer_size=100000)
+    assert events == list(enumerate(messages))[:10]
+
+
+def test_stalled_client_does_not_block_others(tmp_path):
+    async def clients(url, count, hub):
+        host, port = url.split("/")[2].split(":")
+        # Connects and never reads
+        _, writer = await asyncio.open_connection(host, int(port))
+        writer.write(f"GET /events/main?start_from=0 HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+        await writer.drain()
+        while hub.clients["main"] == 0:
+            await asyncio.sleep(0.01)
+        events = await read_events(url, count)
+        while hub.clients["main"] > 0:
+            await asyncio.sleep(0.01)
+        writer.close()
+        return events
+
+    # Events larger than socket buffers, so writes to the stalled client stop completing
+    chain = SyntheticChain(validators=20, eras=3, blocks_per_era=10, transforms_per_deploy=300)
+    messages, (hub, events) = run_hub(tmp_path, clients, chain, write_timeout_sec=0.2, keepalive_sec=0.1)
+    assert events == list(enumerate(messages))
+    assert hub.dropped == 1
@@ -0,0 +1,34 @@
+from sse_parser import SSEFrameParser, frame_id, iter_frames, parse_frame
+
+
+STREAM = (b'data:{"ApiVersion":"1.0.0"}\n\n'
+          b':\n\n'
+          b'data:{"Step":{"era_id":1}}\nid:0\n\n'
+          b'data: {"BlockAdded":{"block_hash":"ab"}}\nid: 1\n\n'
+          b'data:line one\ndata:line two\nid:2\n\n')
+
+
+def messages_from_chunks(chunk_size):
+    parser = SSEFrameParser()
+    messages = []
+    for pos in range(0, len(STREAM), chunk_size):
+        messages.extend(parser.feed(STREAM[pos:pos + chunk_size]))
+    return [(msg.id, msg.data) for msg in messages]
+
+
+def test_parser_independent_of_chunk_boundaries():
+    expected = [(None, '{"ApiVersion":"1.0.0"}'),
+                ('0', '{"Step":{"era_id":1}}'),
+                ('1', '{"BlockAdded":{"block_hash":"ab"}}'),
+                ('2', 'line one\nline two')]
+    for chunk_size in (1, 2, 3, 7, 64, len(STREAM)):
+        assert messages_from_chunks(chunk_size) == expected
+
+
+def test_frame_ids_without_parsing_data():
+    ids = [frame_id(STREAM, start, end) for start, end in iter_frames(STREAM)]
+    assert ids == [None, None, 0, 1, 2]
+
+
+def test_comment_frame_is_not_a_message():
+    assert parse_frame(b":") is None
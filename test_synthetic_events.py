@@ -0,0 +1,44 @@
+from collections import Counter
+
+from event_stream_reader import file_message_streamer
+from finality_tracker import FinalityTracker
+from message_structure import MessageData
+from signature_verifier import verify_signature
+from synthetic_events import SyntheticChain
+
+
+def test_dump_is_deterministic_and_readable(tmp_path):
+    chain = SyntheticChain(validators=10, eras=2, blocks_per_era=5, deploys_per_block=3, seed=4)
+    count = chain.write_dump(tmp_path / "dump_a")
+    SyntheticChain(validators=10, eras=2, blocks_per_era=5, deploys_per_block=3, seed=4).write_dump(tmp_path / "dump_b")
+    assert (tmp_path / "dump_a").read_bytes() == (tmp_path / "dump_b").read_bytes()
+    assert list(chain.messages()) == list(chain.messages())
+
+    messages = list(file_message_streamer(str(tmp_path / "dump_a"), 0))
+    assert messages[0].id is None
+    assert [int(msg.id) for msg in messages[1:]] == list(range(count))
+    types = Counter(MessageData(msg.data).message_type for msg in messages[1:])
+    assert types["BlockAdded"] == 10
+    assert types["FinalitySignature"] == 100
+    assert types["Step"] == 2
+    assert types["DeployAccepted"] == types["DeployProcessed"] > 0
+
+    # Resume from an id in the middle, after the ApiVersion sent on each connection
+    resumed = list(file_message_streamer(str(tmp_path / "dump_a"), 50))
+    assert [msg.id for msg in resumed[:2]] == [None, "50"]
+
+
+def test_blocks_finalize_with_signed_events():
+    chain = SyntheticChain(validators=5, eras=2, blocks_per_era=3, deploys_per_block=1, sign=True)
+    tracker = FinalityTracker()
+    tracker.add_era(0, chain.genesis_weights)
+    finalized = 0
+    for contents in chain.messages():
+        data = MessageData(contents)
+        if data.is_finality_signature:
+            fin_sig = data.event
+            assert verify_signature(fin_sig.block_hash, fin_sig.era_id, fin_sig.public_key, fin_sig.signature)
+            finalized += tracker.add_signature(fin_sig.era_id, fin_sig.block_hash, fin_sig.public_key)
+        elif data.is_block_added and data.event.is_switch_block:
+            tracker.add_era(data.era_id + 1, data.event.next_era_validator_weights)
+    assert finalized == 6
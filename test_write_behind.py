@@ -0,0 +1,175 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from event_store import EventStore
+from message_structure import MessageData
+from write_behind import WriteBehindQueue, WriteFailed, DROP_NEWEST, DROP_OLDEST
+
+
+class RecordingStore(EventStore):
+    def __init__(self, release: threading.Event = None):
+        self.batches = []
+        self.release = release
+
+    def save_message(self, data, contents):
+        self.save_batch([(data, contents)])
+
+    def save_batch(self, messages):
+        if self.release is not None:
+            self.release.wait()
+        self.batches.append([data.era_id for data, _ in messages])
+
+
+class FailingStore(RecordingStore):
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    def save_batch(self, messages):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        super().save_batch(messages)
+
+
+def step(era_id: int):
+    contents = json.dumps({"Step": {"era_id": era_id}})
+    return MessageData(contents, lazy=True), contents
+
+
+def test_batches_by_size_and_time():
+    async def run():
+        store = RecordingStore()
+        queue = WriteBehindQueue(store, batch_size=4, flush_interval_sec=0.05)
+        flusher = asyncio.create_task(queue.run())
+        for era_id in range(10):
+            await queue.put(*step(era_id))
+        await queue.drain()
+        flusher.cancel()
+        return store, queue
+
+    store, queue = asyncio.run(run())
+    assert store.batches == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert queue.stats()["flushed"] == 10
+    assert queue.stats()["flushes"] == 3
+
+
+def test_drop_policies_when_full():
+    async def run(policy):
+        release = threading.Event()
+        store = RecordingStore(release)
+        queue = WriteBehindQueue(store, max_size=3, batch_size=1, flush_interval_sec=0, policy=policy)
+        flusher = asyncio.create_task(queue.run())
+        await queue.put(*step(0))
+        # Let flusher take first message and block in store
+        await asyncio.sleep(0.01)
+        for era_id in range(1, 6):
+            await queue.put(*step(era_id))
+        release.set()
+        await queue.drain()
+        flusher.cancel()
+        return store.batches, queue.dropped
+
+    assert asyncio.run(run(DROP_NEWEST)) == ([[0], [1], [2], [3]], 2)
+    assert asyncio.run(run(DROP_OLDEST)) == ([[0], [3], [4], [5]], 2)
+
+
+def test_block_policy_waits_for_room():
+    async def run():
+        release = threading.Event()
+        store = RecordingStore(release)
+        queue = WriteBehindQueue(store, max_size=2, batch_size=1, flush_interval_sec=0)
+        flusher = asyncio.create_task(queue.run())
+        for era_id in range(3):
+            await queue.put(*step(era_id))
+        blocked_put = asyncio.create_task(queue.put(*step(3)))
+        await asyncio.sleep(0.01)
+        was_blocked = not blocked_put.done()
+        release.set()
+        await blocked_put
+        await queue.drain()
+        flusher.cancel()
+        return store.batches, was_blocked, queue.max_depth
+
+    batches, was_blocked, max_depth = asyncio.run(run())
+    assert was_blocked
+    assert batches == [[0], [1], [2], [3]]
+    assert max_depth == 2
+
+
+def test_callbacks_after_saved_in_order():
+    async def run():
+        release = threading.Event()
+        store = RecordingStore(release)
+        queue = WriteBehindQueue(store, batch_size=2, flush_interval_sec=0)
+        flusher = asyncio.create_task(queue.run())
+        called = []
+        for era_id in range(3):
+            await queue.put(*step(era_id), on_saved=lambda era_id=era_id: called.append(era_id))
+        queue.when_saved(lambda: called.append("skipped"))
+        await asyncio.sleep(0.01)
+        before_saved = list(called)
+        release.set()
+        await queue.drain()
+        queue.when_saved(lambda: called.append("now"))
+        flusher.cancel()
+        return before_saved, called
+
+    before_saved, called = asyncio.run(run())
+    assert before_saved == []
+    assert called == [0, 1, 2, "skipped", "now"]
+
+
+def test_failed_batch_is_retried():
+    async def run():
+        store = FailingStore(failures=2)
+        queue = WriteBehindQueue(store, batch_size=10, flush_interval_sec=0, retries=3, retry_delay_sec=0)
+        flusher = asyncio.create_task(queue.run())
+        called = []
+        for era_id in range(3):
+            await queue.put(*step(era_id), on_saved=lambda era_id=era_id: called.append(era_id))
+        await queue.drain()
+        flusher.cancel()
+        return store.batches, called, queue.flush_errors
+
+    assert asyncio.run(run()) == ([[0, 1, 2]], [0, 1, 2], 2)
+
+
+def test_stops_when_retries_fail():
+    async def run():
+        store = FailingStore(failures=100)
+        queue = WriteBehindQueue(store, batch_size=1, flush_interval_sec=0, retries=1, retry_delay_sec=0)
+        flusher = asyncio.create_task(queue.run())
+        called = []
+        for era_id in range(3):
+            await queue.put(*step(era_id), on_saved=lambda era_id=era_id: called.append(era_id))
+        await queue.drain()
+        with pytest.raises(WriteFailed):
+            await flusher
+        with pytest.raises(WriteFailed):
+            await queue.put(*step(3))
+        return called, queue.depth
+
+    assert asyncio.run(run()) == ([], 0)
+
+
+def test_failing_callback_does_not_stop_queue():
+    async def run():
+        def fail(*args):
+            raise ValueError("callback failed")
+
+        store = RecordingStore()
+        queue = WriteBehindQueue(store, max_size=1, batch_size=1, flush_interval_sec=0, on_saved=fail)
+        flusher = asyncio.create_task(queue.run())
+        called = []
+        for era_id in range(5):
+            on_saved = fail if era_id == 1 else lambda era_id=era_id: called.append(era_id)
+            await queue.put(*step(era_id), on_saved=on_saved)
+        await asyncio.wait_for(queue.drain(), 5)
+        flusher.cancel()
+        return store.batches, called
+
+    assert asyncio.run(run()) == ([[0], [1], [2], [3], [4]], [0, 2, 3, 4])
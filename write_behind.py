@@ -0,0 +1,227 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, Optional
+
+import config
+import metrics
+from event_store import EventStore
+from message_structure import MessageData
+
+
+BLOCK = "block"
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+BACKPRESSURE_POLICIES = (BLOCK, DROP_NEWEST, DROP_OLDEST)
+
+
+class WriteFailed(Exception):
+    """ A batch could not be saved after all retries, so the queue stopped """
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue between stream handlers and an EventStore, so a slow disk does not stall reading the stream
+    until the queue is full.
+
+    A single flusher task, run(), takes batches of up to batch_size messages, waiting at most flush_interval_sec
+    after the first message of a batch, and saves each batch with store.save_batch in executor.  Stores make a
+    batch durable with one flush, rather than a flush per message.
+
+    When the queue is full the backpressure policy decides what put() does:
+        block        wait for room, pausing the stream consumer (no events lost)
+        drop_newest  discard the new message
+        drop_oldest  discard the oldest queued message to make room
+    Dropped messages are counted in stats, but lost to the store.
+
+    So stream checkpoints do not move past messages that are not yet saved, put() takes an on_saved callback
+    for the message, and when_saved() a callback for messages not put, such as those skipped.  Callbacks are
+    called on the event loop, in order, once all messages put before them are saved or dropped.
+
+    A failed batch is retried up to retries times with exponential backoff from retry_delay_sec, holding up
+    the batches after it.  If it still fails, run() raises WriteFailed, queued messages are discarded without
+    their callbacks, and put() raises WriteFailed.
+
+    on_saved, if given, is called on the event loop with each batch of (MessageData, contents) once it is saved.
+    An exception from a callback or on_saved is logged, and does not stop the queue.
+    """
+
+    def __init__(self, store: EventStore, executor: Optional[Executor] = None, max_size: int = 10000,
+                 batch_size: int = 500, flush_interval_sec: float = 0.5, policy: str = BLOCK,
+                 on_saved: Callable[[list], None] = None, retries: int = config.WRITE_RETRIES,
+                 retry_delay_sec: float = config.WRITE_RETRY_DELAY_SEC):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.store = store
+        self.executor = executor
+        self.batch_size = batch_size
+        self.flush_interval_sec = flush_interval_sec
+        self.policy = policy
+        self.on_saved = on_saved
+        self.retries = retries
+        self.retry_delay_sec = retry_delay_sec
+        self._queue = asyncio.Queue(maxsize=max_size)
+        # Messages put, and taken from the queue by batches that are saved or by drop_oldest, in queue order
+        self._put_count = 0
+        self._taken_count = 0
+        self._saved_count = 0
+        # (put count, callback) waiting for that many messages to be saved
+        self._callbacks = deque()
+        self.error = None
+        self._stopped = asyncio.Event()
+        self.enqueued = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.flush_errors = 0
+        self.last_flush_sec = 0.0
+        self.max_flush_sec = 0.0
+        self.total_flush_sec = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {"depth": self.depth,
+                "max_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "flushes": self.flushes,
+                "flushed": self.flushed,
+                "flush_errors": self.flush_errors,
+                "last_flush_sec": self.last_flush_sec,
+                "max_flush_sec": self.max_flush_sec,
+                "avg_flush_sec": self.total_flush_sec / self.flushes if self.flushes else 0.0}
+
+    async def put(self, data: MessageData, contents: str, on_saved: Callable[[], None] = None):
+        if self.error is not None:
+            raise self.error
+        item = (data, contents)
+        if self.policy == BLOCK:
+            await self._queue.put(item)
+            if self.error is not None:
+                raise self.error
+        else:
+            if self._queue.full():
+                self.dropped += 1
+                if metrics.ENABLED:
+                    metrics.WRITE_DROPPED.inc()
+                if self.policy == DROP_NEWEST:
+                    if on_saved is not None:
+                        self.when_saved(on_saved)
+                    return
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self._taken_count += 1
+            self._queue.put_nowait(item)
+        # Nothing awaited since the message was queued, so counts are in queue order
+        self._put_count += 1
+        if on_saved is not None:
+            self._callbacks.append((self._put_count, on_saved))
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    def when_saved(self, callback: Callable[[], None]):
+        """ Calls callback once all messages put so far are saved, now if they are """
+        if self._saved_count >= self._put_count:
+            self._call(callback)
+        else:
+            self._callbacks.append((self._put_count, callback))
+
+    def _saved(self, taken_count: int):
+        self._saved_count = max(self._saved_count, taken_count)
+        while self._callbacks and self._callbacks[0][0] <= self._saved_count:
+            self._call(self._callbacks.popleft()[1])
+
+    @staticmethod
+    def _call(callback: Callable, *args):
+        try:
+            callback(*args)
+        except Exception:
+            logging.exception(f"Write behind callback {callback} failed")
+
+    async def _next_batch(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.flush_interval_sec
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        self._taken_count += len(batch)
+        return batch
+
+    async def _save(self, batch: list):
+        """ Saves batch, retrying with backoff, raises WriteFailed after retries """
+        loop = asyncio.get_running_loop()
+        for attempt in itertools.count():
+            try:
+                await loop.run_in_executor(self.executor, self.store.save_batch, batch)
+                return
+            except Exception as e:
+                self.flush_errors += 1
+                if attempt >= self.retries:
+                    raise WriteFailed(f"Write behind flush of {len(batch)} messages failed: {e}") from e
+                delay = self.retry_delay_sec * 2 ** attempt
+                logging.error(f"Write behind flush of {len(batch)} messages failed ({e}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+
+    async def _flush(self, batch: list):
+        start = time.perf_counter()
+        taken_count = self._taken_count
+        try:
+            await self._save(batch)
+            self.flushed += len(batch)
+            if metrics.ENABLED:
+                metrics.WRITE_BATCH.inc(type(self.store).__name__, amount=len(batch))
+            if self.on_saved is not None:
+                self._call(self.on_saved, batch)
+            self._saved(taken_count)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.flushes += 1
+            self.last_flush_sec = elapsed
+            self.max_flush_sec = max(self.max_flush_sec, elapsed)
+            self.total_flush_sec += elapsed
+            if metrics.ENABLED:
+                metrics.WRITE_SECONDS.observe(elapsed, type(self.store).__name__)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def run(self):
+        """ Flusher task, runs until cancelled or a batch can not be saved """
+        try:
+            while True:
+                await self._flush(await self._next_batch())
+        except Exception as e:
+            error = e if isinstance(e, WriteFailed) else WriteFailed(f"Write behind queue failed: {e!r}")
+            logging.error(f"{error}, stopping write behind queue")
+            # Raised by put(), including to callers waiting for room as the queue is emptied
+            self.error = error
+            while not self._queue.empty():
+                self._queue.get_nowait()
+                self._queue.task_done()
+            self._stopped.set()
+            if error is e:
+                raise
+            raise error from e
+
+    async def drain(self):
+        """ Wait until all queued messages are flushed or the queue stopped, run() must be running """
+        joined = asyncio.ensure_future(self._queue.join())
+        stopped = asyncio.ensure_future(self._stopped.wait())
+        await asyncio.wait((joined, stopped), return_when=asyncio.FIRST_COMPLETED)
+        joined.cancel()
+        stopped.cancel()